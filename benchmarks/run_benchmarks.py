@@ -0,0 +1,283 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from datetime import datetime, timedelta, timezone
+
+from optionsbacktrader import OptionsBroker, OptionsTradingEnvironment, Account
+from optionsbacktrader.columnar_store import ColumnarStore
+from optionsbacktrader.compact_store import CompactStore
+from optionsbacktrader.sharded_store import ShardedStore
+from optionsbacktrader.schema import upgrade_schema
+from optionsbacktrader.pricing import black_scholes, black_scholes_greeks, implied_volatility, get_years_to_expiry
+from .synthetic_data import write_sqlite, write_csv
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BACKENDS = ('sqlite', 'sqlite-memory', 'columnar', 'mmap', 'compact')
+
+
+def summarize(timings):
+    timings = np.array(timings)
+
+    return {
+        'calls': len(timings),
+        'total_s': float(timings.sum()),
+        'mean_s': float(timings.mean()),
+        'median_s': float(np.median(timings)),
+        'p95_s': float(np.percentile(timings, 95)),
+        'min_s': float(timings.min())
+    }
+
+
+def time_calls(fn, arguments):
+    timings = []
+    for args in arguments:
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+
+    return summarize(timings)
+
+
+def get_compact_path(columnar_path):
+    return os.path.splitext(columnar_path)[0] + '.compact'
+
+
+def open_broker(backend, db_path, columnar_path):
+    broker = OptionsBroker(account=Account(100000))
+
+    if backend == 'sqlite':
+        broker.load_historical_data(db_path, fidelity='day')
+    elif backend == 'sqlite-memory':
+        broker.load_historical_data(db_path, fidelity='day', in_memory=True)
+    elif backend == 'columnar':
+        broker.load_historical_data(db_path, fidelity='day', backend='columnar')
+    elif backend == 'compact':
+        broker.load_historical_data(get_compact_path(columnar_path), fidelity='day', backend='compact')
+    else:
+        broker.load_historical_data(columnar_path, fidelity='day', backend='mmap')
+
+    return broker
+
+
+def benchmark_broker(backend, db_path, columnar_path, samples, env_steps, positions):
+    rng = random.Random(0)
+    results = {}
+
+    start = time.perf_counter()
+    broker = open_broker(backend, db_path, columnar_path)
+    results['load_historical_data'] = summarize([time.perf_counter() - start])
+
+    days = broker.get_trading_days()
+    sample_days = [days[rng.randrange(len(days))] for _ in range(samples)]
+    chains = {day: broker.get_options_chain(quotedate=day) for day in set(sample_days)}
+
+    results['get_trading_days'] = time_calls(broker.get_trading_days, [()] * samples)
+    results['get_options_chain'] = time_calls(lambda day: broker.get_options_chain(quotedate=day),
+                                              [(day,) for day in sample_days])
+
+    history_arguments = [
+        (rng.choice(chains[day]).asset.symbol, day, day - timedelta(days=5)) for day in sample_days if chains[day]
+    ]
+    results['get_history_for_option'] = time_calls(broker.get_history_for_option, history_arguments)
+
+    find_arguments = []
+    for day in sample_days:
+        if chains[day]:
+            expiry = rng.choice(chains[day]).asset.expiry_date.replace(tzinfo=None)
+            find_arguments.append((rng.uniform(-1.0, 1.0), expiry, day))
+    results['find_option'] = time_calls(broker.find_option, find_arguments)
+
+    # Valuation with a book of open positions taken from the first chain
+    broker.current_date = days[0]
+    for quote in rng.sample(broker.get_options_chain(), min(positions, len(broker.get_options_chain()))):
+        broker.buy(quote=quote)
+    results['Account.get_market_value'] = time_calls(lambda day: broker.account.get_market_value(broker, day),
+                                                     [(day,) for day in sample_days])
+
+    # Repricing the same book under a grid of underlying and volatility shocks
+    shocks = (np.linspace(-0.2, 0.2, 41)[:, None], np.linspace(-0.1, 0.1, 25)[None, :])
+    results['OptionsBroker.revalue_positions'] = time_calls(lambda day: broker.revalue_positions(*shocks, quotedate=day),
+                                                            [(day,) for day in sample_days[:max(1, samples // 10)]])
+    broker.account.reset()
+
+    env = OptionsTradingEnvironment(broker)
+    results['OptionsTradingEnvironment.reset'] = time_calls(env.reset, [()] * max(1, samples // 10))
+
+    action_rng = np.random.RandomState(0)
+    step_timings = []
+    env.reset()
+    for _ in range(env_steps):
+        action = np.array([action_rng.uniform(-0.8, 0.8), action_rng.uniform(0, 0.3), action_rng.randint(3, 25),
+                           *action_rng.rand(3)])
+        start = time.perf_counter()
+        _, _, done, _ = env.step(action)
+        step_timings.append(time.perf_counter() - start)
+
+        if done:
+            env.reset()
+    results['OptionsTradingEnvironment.step'] = summarize(step_timings)
+
+    broker.shutdown()
+
+    return results
+
+
+def benchmark_pricing(broker, samples):
+    chain = broker.get_options_chain(quotedate=broker.get_trading_days()[0])
+    option_types = chain.option_types
+    strikes = chain.strikes.astype(np.float64)
+    underlying = chain.underlying_lasts.astype(np.float64)
+    years = get_years_to_expiry(chain.expirations, chain.quotedates)
+    volatilities = chain.implied_volatilities.astype(np.float64)
+    prices = black_scholes(option_types, underlying, strikes, years, volatilities)
+
+    return {
+        'black_scholes': time_calls(black_scholes, [(option_types, underlying, strikes, years, volatilities)] * samples),
+        'black_scholes_greeks': time_calls(black_scholes_greeks,
+                                           [(option_types, underlying, strikes, years, volatilities)] * samples),
+        'implied_volatility': time_calls(implied_volatility,
+                                         [(prices, option_types, underlying, strikes, years)] * max(1, samples // 10))
+    }
+
+
+def benchmark_ingestion(work_path, days, strikes, expiries):
+    csv_path = os.path.join(work_path, 'ingest.csv')
+    write_csv(csv_path, days, strikes, expiries)
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, 'preprocess_csv.py', csv_path, '-o', os.path.join(work_path, 'ingest.sqlite3')],
+                   cwd=ROOT_PATH, check=True, stdout=subprocess.DEVNULL)
+    elapsed = time.perf_counter() - start
+
+    result = summarize([elapsed])
+    result['rows'] = days * strikes * expiries * 2
+    result['rows_per_s'] = result['rows'] / elapsed
+
+    return result
+
+
+def benchmark_shard_loading(work_path, days, strikes, expiries, shard_count, repeats=3):
+    # ShardedStore.open of one shard per underlying, serially and with a worker per shard
+    paths = {name: os.path.join(work_path, f'shards-{name}') for name in ('sqlite', 'mmap', 'compact')}
+    for path in paths.values():
+        os.makedirs(path)
+
+    for i in range(shard_count):
+        underlying = f'U{i}'
+        db_path = os.path.join(paths['sqlite'], f'{underlying}.sqlite3')
+        write_sqlite(db_path, days, strikes, expiries, underlying=underlying, seed=i)
+
+        db_connection = sqlite3.connect(db_path)
+        upgrade_schema(db_connection)
+        db_connection.close()
+
+        store = ColumnarStore.from_sqlite(db_path)
+        store.save(os.path.join(paths['mmap'], underlying))
+        CompactStore.from_store(store).save(os.path.join(paths['compact'], underlying))
+
+    results = {}
+    for name, path, backend, in_memory in (('sqlite', paths['sqlite'], 'sqlite', False),
+                                           ('sqlite-memory', paths['sqlite'], 'sqlite', True),
+                                           ('columnar', paths['sqlite'], 'columnar', False),
+                                           ('mmap', paths['mmap'], 'mmap', False),
+                                           ('compact-memory', paths['compact'], 'compact', True)):
+        for label, max_workers in (('serial', 1), ('parallel', shard_count)):
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                store = ShardedStore.open(path, backend, in_memory=in_memory, max_workers=max_workers)
+                timings.append(time.perf_counter() - start)
+                store.close()
+
+            results[f'{name} {label}'] = summarize(timings)
+
+    return results
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_PATH, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark broker queries, environment steps and ingestion on '
+                                                 'synthetic option chains.')
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--strikes', type=int, default=40)
+    parser.add_argument('--expiries', type=int, default=8)
+    parser.add_argument('--samples', type=int, default=200, help='calls timed per broker method')
+    parser.add_argument('--env-steps', type=int, default=50)
+    parser.add_argument('--positions', type=int, default=50, help='open positions for the valuation benchmark')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--skip-ingestion', action='store_true')
+    parser.add_argument('--shards', type=int, default=4, help='shards for the shard loading benchmark, 0 skips it')
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_path:
+        db_path = os.path.join(work_path, 'synthetic.sqlite3')
+        columnar_path = os.path.join(work_path, 'synthetic.columnar')
+
+        write_sqlite(db_path, args.days, args.strikes, args.expiries)
+        if 'mmap' in args.backends or 'compact' in args.backends:
+            ColumnarStore.from_sqlite(db_path).save(columnar_path)
+        if 'compact' in args.backends:
+            CompactStore.from_store(ColumnarStore.load(columnar_path)).save(get_compact_path(columnar_path))
+
+        results = {}
+        for backend in args.backends:
+            print(f'Benchmarking {backend}')
+            results[backend] = benchmark_broker(backend, db_path, columnar_path, args.samples, args.env_steps,
+                                                args.positions)
+
+        print('Benchmarking pricing')
+        broker = open_broker('columnar', db_path, columnar_path)
+        results['pricing'] = benchmark_pricing(broker, args.samples)
+        broker.shutdown()
+
+        if args.shards:
+            print('Benchmarking shard loading')
+            results['shard_loading'] = benchmark_shard_loading(work_path, args.days, args.strikes, args.expiries,
+                                                               args.shards)
+
+        if not args.skip_ingestion:
+            print('Benchmarking preprocess_csv')
+            results['preprocess_csv'] = {
+                'ingestion': benchmark_ingestion(work_path, args.days, args.strikes, args.expiries)
+            }
+
+    report = {
+        'commit': get_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'config': vars(args),
+        'results': results
+    }
+
+    with open(args.output, 'w') as fp:
+        json.dump(report, fp, indent=2)
+
+    for group, group_results in results.items():
+        print(group)
+        for name, result in group_results.items():
+            print(f'  {name:<36} {result["mean_s"] * 1000:10.3f} ms/call ({result["calls"]} calls)')
+
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import os
+import math
+import sqlite3
+
+import numpy as np
+
+from datetime import datetime, timedelta, timezone
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'optionsbacktrader', 'db.sql')
+
+COLUMNS = ('underlying', 'underlying_last', 'optionroot', 'type', 'expiration', 'quotedate', 'strike', 'last', 'bid',
+           'ask', 'impliedvol', 'delta', 'gamma', 'theta', 'vega')
+
+
+def _normal_cdf(x):
+    return 0.5 * (1.0 + np.vectorize(math.erf)(x / math.sqrt(2.0)))
+
+
+def _trading_days(start_date, n_days):
+    days = []
+    date = start_date
+    while len(days) < n_days:
+        if date.weekday() < 5:
+            days.append(date)
+        date += timedelta(days=1)
+
+    return days
+
+
+def generate_chains(n_days, n_strikes, n_expiries, start_date=datetime(2015, 1, 5), underlying='SPX', seed=0):
+    # Yields one dict of columns per trading day: a random walk underlying with n_expiries weekly expirations
+    # (rolling forward) and n_strikes calls and puts per expiration
+    rng = np.random.RandomState(seed)
+    underlying_last = 2000.0
+
+    for day in _trading_days(start_date, n_days):
+        underlying_last = round(underlying_last * math.exp(rng.normal(0.0, 0.01)), 2)
+
+        first_friday = day + timedelta(days=(4 - day.weekday()) % 7)
+        expiries = [first_friday + timedelta(weeks=i) for i in range(n_expiries)]
+        strikes = np.round(underlying_last / 5.0) * 5.0 + 5.0 * (np.arange(n_strikes) - n_strikes // 2)
+
+        expiry_grid, strike_grid, type_grid = np.meshgrid(np.arange(n_expiries), strikes, [0, 1], indexing='ij')
+        expiry_grid, strike_grid, type_grid = expiry_grid.ravel(), strike_grid.ravel(), type_grid.ravel()
+
+        years = np.maximum(np.array([(expiries[i] - day).days for i in expiry_grid]), 1) / 365.0
+        implied_volatility = 0.15 + 0.05 * rng.rand(len(strike_grid))
+        d1 = (np.log(underlying_last / strike_grid) + 0.5 * implied_volatility ** 2 * years) / (
+                implied_volatility * np.sqrt(years))
+        d2 = d1 - implied_volatility * np.sqrt(years)
+        is_put = type_grid == 1
+
+        call_price = underlying_last * _normal_cdf(d1) - strike_grid * _normal_cdf(d2)
+        price = np.where(is_put, call_price - underlying_last + strike_grid, call_price)
+        price = np.maximum(price, 0.05)
+        density = np.exp(-0.5 * d1 ** 2) / math.sqrt(2 * math.pi)
+
+        yield {
+            'underlying': [underlying] * len(strike_grid),
+            'underlying_last': [underlying_last] * len(strike_grid),
+            'optionroot': [
+                f'{underlying}{expiries[e]:%y%m%d}{"P" if p else "C"}{int(k * 1000):08d}'
+                for e, k, p in zip(expiry_grid, strike_grid, is_put)
+            ],
+            'type': ['p' if p else 'c' for p in is_put],
+            'expiration': [datetime_to_ns(expiries[e]) for e in expiry_grid],
+            'quotedate': [datetime_to_ns(day)] * len(strike_grid),
+            'strike': strike_grid.tolist(),
+            'last': np.round(price, 2).tolist(),
+            'bid': np.round(price * 0.98, 2).tolist(),
+            'ask': np.round(price * 1.02 + 0.05, 2).tolist(),
+            'impliedvol': np.round(implied_volatility, 6).tolist(),
+            'delta': np.round(np.where(is_put, _normal_cdf(d1) - 1.0, _normal_cdf(d1)), 6).tolist(),
+            'gamma': np.round(density / (underlying_last * implied_volatility * np.sqrt(years)), 6).tolist(),
+            'theta': np.round(-underlying_last * density * implied_volatility / (2 * np.sqrt(years)) / 365.0, 6).tolist(),
+            'vega': np.round(underlying_last * density * np.sqrt(years) / 100.0, 6).tolist()
+        }
+
+
+def datetime_to_ns(date):
+    return int(date.replace(tzinfo=timezone.utc).timestamp() * 10 ** 9)
+
+
+def write_sqlite(db_path, n_days, n_strikes, n_expiries, **kwargs):
+    db_connection = sqlite3.connect(db_path)
+
+    with open(SCHEMA_PATH, 'r') as fp:
+        db_connection.executescript(fp.read())
+
+    for chain in generate_chains(n_days, n_strikes, n_expiries, **kwargs):
+        db_connection.executemany(
+            f'INSERT INTO historical_data ({",".join(COLUMNS)}) VALUES ({",".join("?" * len(COLUMNS))})',
+            zip(*[chain[column] for column in COLUMNS])
+        )
+
+    db_connection.commit()
+    db_connection.close()
+
+
+def write_csv(csv_path, n_days, n_strikes, n_expiries, **kwargs):
+    with open(csv_path, 'w') as fp:
+        fp.write(','.join(COLUMNS) + '\n')
+
+        for chain in generate_chains(n_days, n_strikes, n_expiries, **kwargs):
+            for column in ('expiration', 'quotedate'):
+                chain[column] = [
+                    datetime.fromtimestamp(value / 10 ** 9, timezone.utc).strftime('%m/%d/%Y') for value in chain[column]
+                ]
+            chain['type'] = ['put' if value == 'p' else 'call' for value in chain['type']]
+
+            for row in zip(*[chain[column] for column in COLUMNS]):
+                fp.write(','.join(map(str, row)) + '\n')
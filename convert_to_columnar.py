@@ -0,0 +1,15 @@
+#!/usr/bin/env python
+
+import sys
+import os
+
+from optionsbacktrader.columnar_store import ColumnarStore
+
+if len(sys.argv) < 2:
+    print('Usage convert_to_columnar.py <sqlite_path> [<output_dir>]')
+    exit(0)
+
+db_path = sys.argv[1]
+output_path = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(db_path)[0] + '.columnar'
+
+ColumnarStore.from_sqlite(db_path).save(output_path)
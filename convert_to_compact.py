@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+import sys
+import os
+
+from optionsbacktrader.columnar_store import ColumnarStore
+from optionsbacktrader.compact_store import CompactStore
+
+
+def get_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+arguments = [argument for argument in sys.argv[1:] if argument != '--lossy']
+if not arguments or arguments[0] in ('-h', '--help'):
+    print('Usage convert_to_compact.py <sqlite_path or columnar_dir> [<output_dir>] [--lossy]')
+    print('Prices are stored as int32 ticks and greeks/IV as float32 or int32 ticks, where that reproduces every '
+          'value exactly.\nBy default a column without such an encoding stays float64 (8 instead of 4 bytes/row), '
+          'e.g. greeks with more\nsignificant digits than float32 holds. Those columns are listed after conversion. '
+          '--lossy stores them as\nfloat32 instead, rounding them to about 7 significant digits.')
+    exit(0)
+
+input_path = arguments[0]
+output_path = arguments[1] if len(arguments) > 1 else os.path.splitext(input_path.rstrip(os.sep))[0] + '.compact'
+
+store = ColumnarStore.load(input_path) if os.path.isdir(input_path) else ColumnarStore.from_sqlite(input_path)
+compact_store = CompactStore.from_store(store, exact='--lossy' not in sys.argv)
+compact_store.save(output_path)
+
+row_count = max(len(compact_store.columns['quotedate']), 1)
+full_precision_columns = compact_store.get_full_precision_columns()
+for name, encoding in compact_store.get_encodings().items():
+    note = '  no exact 4 byte encoding, kept as float64' if name in full_precision_columns else ''
+    print(f'{name:16}{compact_store.columns[name].nbytes / row_count:6.1f} bytes/row  {encoding}{note}')
+
+if full_precision_columns:
+    print(f'{", ".join(full_precision_columns)} kept as float64 '
+          f'({4 * len(full_precision_columns)} extra bytes/row), --lossy stores these as float32')
+
+print(f'{input_path}: {get_size(input_path) / 2 ** 20:.1f} MB -> '
+      f'{output_path}: {get_size(output_path) / 2 ** 20:.1f} MB')
@@ -1,6 +1,15 @@
 from optionsbacktrader.options_broker import OptionsBroker
 from optionsbacktrader.account import Account
 from optionsbacktrader.position import Position
-from optionsbacktrader.execution import Execution
+from optionsbacktrader.execution import Execution, OrderLeg, OrderType
 from optionsbacktrader.trader import Trader
-from optionsbacktrader.options_trading_env import OptionsTradingEnvironment
+
+
+def __getattr__(name):
+    # The gym environment is imported on first use, so the data tools (schema, pricing, stores) need no RL stack
+    if name == 'OptionsTradingEnvironment':
+        from optionsbacktrader.options_trading_env import OptionsTradingEnvironment
+
+        return OptionsTradingEnvironment
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
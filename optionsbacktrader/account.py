@@ -1,15 +1,48 @@
+import bisect
+
 from .position import Position
 from .execution import OrderType
+from .execution_ledger import ExecutionLedger
+from .option import Option
+from .chain_view import datetime_to_db
+
+
+class AccountSnapshot:
+    __slots__ = ('initial_value', 'cash', 'cash_spent', 'cash_gain', 'symbols', 'positions', 'ledger_mark')
+
+    def __init__(self, account, symbols=None):
+        self.initial_value = account._initial_value
+        self.cash = account._cash
+        self.cash_spent = account._cash_spent
+        self.cash_gain = account._cash_gain
+        # Only the positions of symbols are kept (every position if None), restoring leaves the others as they are.
+        # Positions are updated in place, so their fields are copied
+        self.symbols = None if symbols is None else set(symbols)
+        positions = account._positions.values() if symbols is None else [
+            account._positions[symbol] for symbol in self.symbols if symbol in account._positions
+        ]
+        self.positions = [(position.symbol, position.book_value, position.size, position.asset)
+                          for position in positions]
+        self.ledger_mark = account._ledger.mark()
 
 
 class Account:
-    def __init__(self, cash=0):
+    def __init__(self, cash=0, ledger=None):
         self._initial_value = cash
         self._cash = cash
         self._cash_spent = 0
         self._cash_gain = 0
         self._positions = {}
-        self._executions = []
+        # Option positions bucketed by expiration (nanoseconds), with the bucket expirations kept sorted
+        self._expiry_buckets = {}
+        self._expirations = []
+        self._ledger = ledger if ledger is not None else ExecutionLedger()
+
+        self._reset_marks()
+
+    @property
+    def ledger(self):
+        return self._ledger
 
     @property
     def cash(self):
@@ -26,14 +59,89 @@ class Account:
         self._cash = self._initial_value
         self._cash_spent = 0
         self._cash_gain = 0
+        self._clear_positions()
+        self._ledger.clear()
+
+        self._reset_marks()
+
+    def snapshot(self, symbols=None):
+        return AccountSnapshot(self, symbols)
+
+    def restore(self, snapshot):
+        # Executions after the snapshot are dropped from the ledger, so a snapshot can be restored any number of
+        # times to branch from it, but not after rolling back past it
+        self._ledger.truncate(snapshot.ledger_mark)
+
+        self._initial_value = snapshot.initial_value
+        self._cash = snapshot.cash
+        self._cash_spent = snapshot.cash_spent
+        self._cash_gain = snapshot.cash_gain
+
+        if snapshot.symbols is None:
+            self._clear_positions()
+            self._reset_marks()
+        else:
+            for symbol in snapshot.symbols:
+                if symbol in self._positions:
+                    self._remove_position(symbol)
+            self._dirty_symbols.update(snapshot.symbols)
+
+        for symbol, book_value, size, asset in snapshot.positions:
+            self._add_position(Position(symbol=symbol, book_value=book_value, size=size, asset=asset))
+
+    def _reset_marks(self):
+        # Market value of each position for one (broker, quotedate, liquidity risk), refreshed with one batched
+        # quote lookup per day and re-marked per symbol as executions arrive
+        self._marks_key = None
+        self._marks = {}
+        self._marked_quotes = {}
+        self._dirty_symbols = set()
+
+    def _clear_positions(self):
         self._positions = {}
-        self._executions = []
+        self._expiry_buckets = {}
+        self._expirations = []
+
+    def _add_position(self, position):
+        self._positions[position.symbol] = position
+
+        if isinstance(position.asset, Option):
+            expiration = datetime_to_db(position.asset.expiry_date)
+            bucket = self._expiry_buckets.get(expiration)
+            if bucket is None:
+                bucket = self._expiry_buckets[expiration] = {}
+                bisect.insort(self._expirations, expiration)
+
+            bucket[position.symbol] = position
+
+    def _remove_position(self, symbol):
+        position = self._positions.pop(symbol)
+
+        if isinstance(position.asset, Option):
+            expiration = datetime_to_db(position.asset.expiry_date)
+            bucket = self._expiry_buckets[expiration]
+            del bucket[symbol]
+
+            if not bucket:
+                del self._expiry_buckets[expiration]
+                del self._expirations[bisect.bisect_left(self._expirations, expiration)]
 
     def get_positions(self):
         return list(self._positions.values())
 
+    def get_expiring_positions(self, expiry_end, expiry_start=None):
+        # Option positions expiring before expiry_end (and at or after expiry_start), in expiration order.
+        # Costs O(log expirations + positions returned).
+        last = bisect.bisect_left(self._expirations, datetime_to_db(expiry_end))
+        first = 0 if expiry_start is None else bisect.bisect_left(self._expirations, datetime_to_db(expiry_start))
+
+        return [
+            position for expiration in self._expirations[first:last]
+            for position in self._expiry_buckets[expiration].values()
+        ]
+
     def get_executions(self):
-        return self._executions
+        return self._ledger.get_executions()
 
     def get_position(self, symbol):
         if symbol in self._positions:
@@ -42,7 +150,8 @@ class Account:
             return False
 
     def update_from_execution(self, execution):
-        self._executions.append(execution)
+        self._dirty_symbols.add(execution.symbol)
+        realized_pl = 0.0
 
         if execution.symbol in self._positions:
             existing_position = self._positions[execution.symbol]
@@ -55,24 +164,27 @@ class Account:
                     # Existing position closed out
                     if existing_position.book_value > 0.0:
                         # Closing out long position
+                        realized_pl = execution.get_total_value() - existing_position.get_total_book_value()
                         self._cash += execution.get_total_value()
                         self._cash_gain += execution.get_total_value()
                     else:
                         # Closing out short position
+                        realized_pl = -existing_position.get_total_book_value() - execution.get_total_value()
                         self._cash += -existing_position.get_total_book_value() * 2 - execution.get_total_value()
                         self._cash_gain += -existing_position.get_total_book_value() * 2 - execution.get_total_value()
 
-                    del self._positions[existing_position.symbol]
+                    self._remove_position(existing_position.symbol)
                 elif execution.size > existing_position.size:
                     # Existing position type swap
                     new_position = Position.from_execution(execution)
                     new_position.size = execution.size - existing_position.size
-                    self._positions[existing_position.symbol] = new_position
+                    self._add_position(new_position)
 
                     if execution.order_type == OrderType.BUY:
                         # Previous short position now long
 
                         # Payment for closing short position
+                        realized_pl = -existing_position.get_total_book_value() - existing_position.size * execution.price
                         self._cash += -existing_position.get_total_book_value() * 2 - existing_position.size * execution.price
                         self._cash_gain += -existing_position.get_total_book_value() * 2 - existing_position.size * execution.price
 
@@ -83,6 +195,7 @@ class Account:
                         # Previous long position now short
 
                         # Payment for closing long position
+                        realized_pl = existing_position.size * execution.price - existing_position.get_total_book_value()
                         self._cash += existing_position.size * execution.price
                         self._cash_gain += existing_position.size * execution.price
 
@@ -100,27 +213,60 @@ class Account:
                 self._cash -= execution.get_total_value()
                 self._cash_spent += execution.get_total_value()
         else:
-            self._positions[execution.symbol] = Position.from_execution(execution)
+            self._add_position(Position.from_execution(execution))
             self._cash -= execution.get_total_value()
             self._cash_spent += execution.get_total_value()
 
+        self._ledger.append(execution, realized_pl)
+
     def get_percent_cash_pl(self):
         return (self._cash - self._initial_value) / self._initial_value
 
-    def get_market_value(self, broker, quotedate=None):
-        return sum(
-            map(
-                lambda position: broker.get_market_order_price_for_quote(
-                    broker.get_option_quote(symbol=position.symbol, quotedate=quotedate),
+    def _update_marks(self, broker, quotedate):
+        if quotedate is None:
+            quotedate = broker.current_date
+
+        marks_key = (id(broker), quotedate, broker.liquidity_risk)
+        if marks_key != self._marks_key:
+            self._marks_key = marks_key
+            self._marks = {}
+            self._marked_quotes = {}
+            self._dirty_symbols = set(self._positions)
+
+        if not self._dirty_symbols:
+            return
+
+        unquoted_symbols = [
+            symbol for symbol in self._dirty_symbols if symbol in self._positions and symbol not in self._marked_quotes
+        ]
+        if unquoted_symbols:
+            self._marked_quotes.update(broker.get_option_quotes(unquoted_symbols, quotedate))
+
+        for symbol in self._dirty_symbols:
+            if symbol in self._positions:
+                position = self._positions[symbol]
+                self._marks[symbol] = broker.get_market_order_price_for_quote(
+                    self._marked_quotes[symbol],
                     is_buy=position.book_value < 0.0
                 ) * (
                     1.0 if position.book_value >= 0.0 else -1.0
                 ) * position.size - (
                     0.0 if position.book_value >= 0.0 else position.get_total_book_value() * 2
-                ),
-                self.get_positions()
-            )
-        ) + self._cash
+                )
+            else:
+                self._marks.pop(symbol, None)
+
+        self._dirty_symbols = set()
+
+    def get_position_market_value(self, broker, position, quotedate=None):
+        self._update_marks(broker, quotedate)
+
+        return self._marks[position.symbol]
+
+    def get_market_value(self, broker, quotedate=None):
+        self._update_marks(broker, quotedate)
+
+        return sum(self._marks.values()) + self._cash
 
     def get_percent_market_value_pl(self, broker, quotedate=None):
         return (self.get_market_value(broker, quotedate) - self._initial_value) / self._initial_value
@@ -0,0 +1,114 @@
+import numpy as np
+
+from collections.abc import Sequence
+from datetime import datetime, timezone
+from .option import Option
+from .quote import Quote
+
+# Same order as the store quote rows: optionroot, underlying, type, strike, expiration, bid, ask, impliedvol, delta,
+# gamma, theta, vega, underlying_last
+VIEW_COLUMNS = (
+    'symbols',
+    'underlying_symbols',
+    'option_types',
+    'strikes',
+    'expirations',
+    'bids',
+    'asks',
+    'implied_volatilities',
+    'deltas',
+    'gammas',
+    'thetas',
+    'vegas',
+    'underlying_lasts'
+)
+
+
+def datetime_to_db(date):
+    return int(date.replace(tzinfo=timezone.utc).timestamp() * 10 ** 9)
+
+
+def datetime_from_db(timestamp):
+    return datetime.fromtimestamp(timestamp / 10 ** 9, timezone.utc)
+
+
+def quote_from_row(quotedate, row, expiry_date=None):
+    return Quote(
+        quotedate=quotedate,
+        asset=Option(
+            symbol=row[0],
+            underlying_symbol=row[1],
+            option_type=row[2],
+            strike=row[3],
+            expiry_date=datetime_from_db(row[4]) if expiry_date is None else expiry_date,
+            implied_volatility=row[7],
+            delta=row[8],
+            gamma=row[9],
+            theta=row[10],
+            vega=row[11]
+        ), bid=row[5], ask=row[6], underlying_last=row[12])
+
+
+class ChainView(Sequence):
+    def __init__(self, quotedates, columns, quotedate=None):
+        # Quotes kept as one array per field with int64 nanosecond timestamps. Quote objects are only created by
+        # the row accessors, quotedate (if given) is used as the Quote date of every row.
+        self.quotedates = np.asarray(quotedates, dtype=np.int64)
+        self.quotedate = quotedate
+
+        for name, column in zip(VIEW_COLUMNS, columns):
+            setattr(self, name, np.asarray(column))
+
+        self.expirations = self.expirations.astype(np.int64, copy=False)
+
+    @classmethod
+    def from_columns(cls, quotedate, quotedate_value, columns):
+        return cls(np.full(len(columns[0]), quotedate_value, dtype=np.int64), columns, quotedate=quotedate)
+
+    @classmethod
+    def from_history_columns(cls, columns):
+        return cls(columns[0], columns[1:])
+
+    def __len__(self):
+        return len(self.quotedates)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.quote(index)
+
+        return ChainView(self.quotedates[index], [getattr(self, name)[index] for name in VIEW_COLUMNS],
+                         quotedate=self.quotedate)
+
+    def __iter__(self):
+        return iter(self.quotes())
+
+    def _quotedate(self, timestamp):
+        return self.quotedate if self.quotedate is not None else datetime_from_db(timestamp)
+
+    def row(self, i):
+        if i < 0:
+            i += len(self)
+
+        if not 0 <= i < len(self):
+            raise IndexError()
+
+        return tuple(getattr(self, name)[i:i + 1].tolist()[0] for name in VIEW_COLUMNS)
+
+    def quote(self, i):
+        row = self.row(i)
+
+        return quote_from_row(self._quotedate(int(self.quotedates[i])), row)
+
+    def quotes(self):
+        # Expiry datetimes are shared between the rows of one expiration
+        expiry_dates = {expiration: datetime_from_db(expiration) for expiration in np.unique(self.expirations).tolist()}
+        if self.quotedate is None:
+            quotedates = {quotedate: datetime_from_db(quotedate) for quotedate in np.unique(self.quotedates).tolist()}
+            quotedates = [quotedates[quotedate] for quotedate in self.quotedates.tolist()]
+        else:
+            quotedates = [self.quotedate] * len(self)
+
+        return [
+            quote_from_row(quotedate, row, expiry_dates[row[4]]) for quotedate, row in
+            zip(quotedates, zip(*[getattr(self, name).tolist() for name in VIEW_COLUMNS]))
+        ]
@@ -0,0 +1,87 @@
+import numpy as np
+
+MINUTE = 60 * 10 ** 9
+DAY = 24 * 60 * MINUTE
+
+# Bar length in nanoseconds for each fidelity, None steps through every quote snapshot in the data
+FIDELITIES = {
+    None: None,
+    'minute': MINUTE,
+    '5min': 5 * MINUTE,
+    '15min': 15 * MINUTE,
+    '30min': 30 * MINUTE,
+    'hour': 60 * MINUTE,
+    'day': DAY
+}
+
+
+def get_bar_length(fidelity):
+    if fidelity not in FIDELITIES:
+        raise ValueError()
+
+    return FIDELITIES[fidelity]
+
+
+def iter_bars(quotedates, bar_length):
+    # Streams the last snapshot of every bar from an ordered stream of snapshot times, looking one snapshot ahead
+    if bar_length is None:
+        yield from quotedates
+        return
+
+    previous = None
+    for quotedate in quotedates:
+        if previous is not None and quotedate // bar_length != previous // bar_length:
+            yield previous
+
+        previous = quotedate
+
+    if previous is not None:
+        yield previous
+
+
+def get_day_start(quotedate):
+    return quotedate - quotedate % DAY
+
+
+def aggregate_daily(columns):
+    # Per symbol aggregates over history columns (quotedate, optionroot, expiration, strike, bid, ask, impliedvol,
+    # delta, theta, gamma, vega, underlying_last) ordered by symbol then quotedate
+    if len(columns[0]) == 0:
+        return {}
+
+    symbols = np.asarray(columns[1])
+    bids = np.asarray(columns[4], dtype=np.float64)
+    asks = np.asarray(columns[5], dtype=np.float64)
+    underlying_last = np.asarray(columns[11], dtype=np.float64)
+    mids = (bids + asks) / 2.0
+
+    group_start = np.ones(len(symbols), dtype=bool)
+    group_start[1:] = symbols[1:] != symbols[:-1]
+    first = np.flatnonzero(group_start)
+    last = np.append(first[1:], len(symbols)) - 1
+
+    highs = np.maximum.reduceat(mids, first)
+    lows = np.minimum.reduceat(mids, first)
+    underlying_highs = np.maximum.reduceat(underlying_last, first)
+    underlying_lows = np.minimum.reduceat(underlying_last, first)
+
+    mids, bids, asks, underlying_last = mids.tolist(), bids.tolist(), asks.tolist(), underlying_last.tolist()
+
+    return {
+        symbol: {
+            'open': mids[i],
+            'high': high,
+            'low': low,
+            'close': mids[j],
+            'bid': bids[j],
+            'ask': asks[j],
+            'underlying_open': underlying_last[i],
+            'underlying_high': underlying_high,
+            'underlying_low': underlying_low,
+            'underlying_close': underlying_last[j],
+            'snapshots': j - i + 1
+        } for symbol, i, j, high, low, underlying_high, underlying_low in zip(
+            symbols[first].tolist(), first.tolist(), last.tolist(), highs.tolist(), lows.tolist(),
+            underlying_highs.tolist(), underlying_lows.tolist()
+        )
+    }
@@ -0,0 +1,320 @@
+import os
+import sqlite3
+
+import numpy as np
+
+from .delta_index import DeltaIndexCache
+from .clock import get_day_start
+
+TEXT_COLUMNS = ('optionroot', 'underlying', 'type')
+INTEGER_COLUMNS = ('quotedate', 'expiration')
+FLOAT_COLUMNS = ('underlying_last', 'strike', 'last', 'bid', 'ask', 'impliedvol', 'delta', 'gamma', 'theta', 'vega')
+STORE_COLUMNS = TEXT_COLUMNS + INTEGER_COLUMNS + FLOAT_COLUMNS
+INDEX_NAMES = ('days', 'day_offsets', 'symbol_order', 'symbol_offsets', 'symbol_quotedates')
+
+
+def _encode_text(chunks):
+    # Merge per-chunk dictionaries into one sorted dictionary so that id order is string order
+    dictionary = np.unique(np.concatenate([values for values, _ in chunks]))
+
+    return dictionary, np.concatenate([
+        np.searchsorted(dictionary, values).astype(np.int32)[ids] for values, ids in chunks
+    ])
+
+
+class ColumnarStore:
+    def __init__(self, columns, dictionaries, indexes=None):
+        # columns holds one array per field, rows sorted by (quotedate, expiration, optionroot). Text fields are
+        # stored as int32 ids into the matching sorted dictionary.
+        self.columns = columns
+        self.dictionaries = dictionaries
+
+        self._symbols = dictionaries['optionroot']
+        self._underlyings = dictionaries['underlying']
+        self._types = dictionaries['type']
+
+        if indexes is None:
+            indexes = self._build_indexes()
+
+        self.indexes = indexes
+        self.days = indexes['days']
+        self._day_offsets = indexes['day_offsets']
+        self._symbol_order = indexes['symbol_order']
+        self._symbol_offsets = indexes['symbol_offsets']
+        self._symbol_quotedates = indexes['symbol_quotedates']
+
+        self._delta_indexes = DeltaIndexCache()
+
+    def _build_indexes(self):
+        quotedate = self.columns['quotedate']
+        day_starts = np.flatnonzero(np.diff(quotedate)) + 1
+
+        symbol_ids = self.columns['optionroot']
+        symbol_order = np.lexsort((quotedate, symbol_ids))
+
+        return {
+            'days': quotedate[np.append(0, day_starts)] if len(quotedate) else quotedate[:0],
+            'day_offsets': np.concatenate(([0], day_starts, [len(quotedate)])),
+            'symbol_order': symbol_order,
+            'symbol_offsets': np.searchsorted(symbol_ids[symbol_order], np.arange(len(self._symbols) + 1)),
+            'symbol_quotedates': quotedate[symbol_order]
+        }
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+
+        for name, column in self.columns.items():
+            np.save(os.path.join(path, f'{name}.npy'), column)
+        for name, dictionary in self.dictionaries.items():
+            np.save(os.path.join(path, f'{name}.dictionary.npy'), dictionary)
+        for name, index in self.indexes.items():
+            np.save(os.path.join(path, f'{name}.index.npy'), index)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        mmap_mode = 'r' if mmap else None
+
+        def load_arrays(names, suffix):
+            return {name: np.load(os.path.join(path, f'{name}{suffix}.npy'), mmap_mode=mmap_mode) for name in names}
+
+        return cls(load_arrays(STORE_COLUMNS, ''),
+                   load_arrays(TEXT_COLUMNS, '.dictionary'),
+                   load_arrays(INDEX_NAMES, '.index'))
+
+    @classmethod
+    def from_row_chunks(cls, row_chunks):
+        # Each chunk is a list of rows with the STORE_COLUMNS fields in order
+        chunks = []
+        for rows in row_chunks:
+            if not rows:
+                continue
+
+            values = list(zip(*rows))
+            chunk = {name: np.unique(np.array(values[i]), return_inverse=True) for i, name in enumerate(TEXT_COLUMNS)}
+            for i, name in enumerate(INTEGER_COLUMNS + FLOAT_COLUMNS, len(TEXT_COLUMNS)):
+                chunk[name] = np.array(values[i], dtype=np.int64 if name in INTEGER_COLUMNS else np.float64)
+            chunks.append(chunk)
+
+        return cls._from_chunks(chunks)
+
+    @classmethod
+    def from_stores(cls, stores):
+        # Merges stores holding different rows, e.g. the same day read from several shards
+        return cls._from_chunks([
+            {name: (store.dictionaries[name], store.columns[name]) if name in TEXT_COLUMNS else store.columns[name]
+             for name in STORE_COLUMNS} for store in stores if len(store.columns['quotedate'])
+        ])
+
+    @classmethod
+    def _from_chunks(cls, chunks):
+        # Text fields of each chunk are (dictionary, ids) pairs
+        if not chunks:
+            return cls.empty()
+
+        columns = {}
+        dictionaries = {}
+        for name in TEXT_COLUMNS:
+            dictionaries[name], columns[name] = _encode_text([chunk[name] for chunk in chunks])
+        for name in INTEGER_COLUMNS + FLOAT_COLUMNS:
+            columns[name] = np.concatenate([chunk[name] for chunk in chunks])
+
+        order = np.lexsort((columns['optionroot'], columns['expiration'], columns['quotedate']))
+
+        return cls({name: column[order] for name, column in columns.items()}, dictionaries)
+
+    @classmethod
+    def from_sqlite(cls, db_path, chunk_size=500000):
+        db_connection = sqlite3.connect(db_path)
+        cursor = db_connection.execute(
+            f'SELECT {", ".join(STORE_COLUMNS)} FROM historical_data'
+        )
+
+        store = cls.from_row_chunks(iter(lambda: cursor.fetchmany(chunk_size), []))
+        db_connection.close()
+
+        return store
+
+    @classmethod
+    def empty(cls):
+        columns = {name: np.zeros(0, dtype=np.int32) for name in TEXT_COLUMNS}
+        columns.update({name: np.zeros(0, dtype=np.int64) for name in INTEGER_COLUMNS})
+        columns.update({name: np.zeros(0, dtype=np.float64) for name in FLOAT_COLUMNS})
+
+        return cls(columns, {name: np.zeros(0, dtype=str) for name in TEXT_COLUMNS})
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for arrays in (self.columns, self.dictionaries, self.indexes) for array in arrays.values())
+
+    def get_day_store(self, quotedate):
+        first, last = self._day_range(quotedate)
+
+        columns = {name: np.array(column[first:last]) for name, column in self.columns.items()}
+        dictionaries = {}
+        for name in TEXT_COLUMNS:
+            # Re-encode against only the values used that day so the day store does not pin the full dictionary
+            ids, columns[name] = np.unique(columns[name], return_inverse=True)
+            columns[name] = columns[name].astype(np.int32)
+            dictionaries[name] = np.array(self.dictionaries[name][ids])
+
+        return ColumnarStore(columns, dictionaries)
+
+    def close(self):
+        pass
+
+    def open_reader(self):
+        # Read-only arrays, safe to share with a background reader
+        return self
+
+    def _day_range(self, quotedate):
+        i = np.searchsorted(self.days, quotedate)
+        if i < len(self.days) and self.days[i] == quotedate:
+            return self._day_offsets[i], self._day_offsets[i + 1]
+        else:
+            return 0, 0
+
+    def _find_symbol_ids(self, symbols):
+        symbols = np.asarray(symbols, dtype=str)
+        if len(self._symbols) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        symbol_ids = np.minimum(np.searchsorted(self._symbols, symbols), max(len(self._symbols) - 1, 0))
+
+        return symbol_ids[self._symbols[symbol_ids] == symbols]
+
+    def _symbol_range(self, symbol, start, end):
+        symbol_ids = self._find_symbol_ids([symbol])
+        if len(symbol_ids) == 0:
+            return self._symbol_order[:0]
+
+        symbol_id = symbol_ids[0]
+
+        first = self._symbol_offsets[symbol_id]
+        last = self._symbol_offsets[symbol_id + 1]
+        quotedates = self._symbol_quotedates[first:last]
+
+        return self._symbol_order[first + np.searchsorted(quotedates, start, 'left'):
+                                  first + np.searchsorted(quotedates, end, 'right')]
+
+    def _row_columns(self, index):
+        columns = self.columns
+
+        return [
+            self._symbols[columns['optionroot'][index]],
+            self._underlyings[columns['underlying'][index]],
+            self._types[columns['type'][index]]
+        ] + [
+            columns[name][index] for name in
+            ('strike', 'expiration', 'bid', 'ask', 'impliedvol', 'delta', 'gamma', 'theta', 'vega', 'underlying_last')
+        ]
+
+    def _rows(self, index):
+        return list(zip(*[column.tolist() for column in self._row_columns(index)]))
+
+    def get_date_range(self):
+        return int(self.days[0]), int(self.days[-1])
+
+    def get_underlyings(self):
+        return self._underlyings.tolist()
+
+    def get_trading_days(self, start, end):
+        return self.days[np.searchsorted(self.days, start, 'left'):np.searchsorted(self.days, end, 'right')].tolist()
+
+    def iter_trading_days(self, start, end):
+        days = self.days[np.searchsorted(self.days, start, 'left'):np.searchsorted(self.days, end, 'right')]
+        for i in range(0, len(days), 4096):
+            yield from days[i:i + 4096].tolist()
+
+    def get_option_row(self, symbol, quotedate):
+        index = self._symbol_range(symbol, quotedate, quotedate)
+
+        return self._rows(index)[0] if len(index) else None
+
+    def get_option_rows(self, symbols, quotedate):
+        first, last = self._day_range(quotedate)
+        symbol_ids = self.columns['optionroot'][first:last]
+
+        index = first + np.flatnonzero(np.isin(symbol_ids, self._find_symbol_ids(symbols)))
+
+        return {row[0]: row for row in self._rows(index)}
+
+    def _chain_range(self, quotedate, expiry_min, expiry_max):
+        first, last = self._day_range(quotedate)
+        expirations = self.columns['expiration'][first:last]
+
+        return slice(first + np.searchsorted(expirations, expiry_min, 'left'),
+                     first + np.searchsorted(expirations, expiry_max, 'right'))
+
+    def get_chain_rows(self, quotedate, expiry_min, expiry_max):
+        return self._rows(self._chain_range(quotedate, expiry_min, expiry_max))
+
+    def get_chain_columns(self, quotedate, expiry_min, expiry_max, underlying=None):
+        index = self._chain_range(quotedate, expiry_min, expiry_max)
+        if underlying is not None:
+            index = np.arange(index.start, index.stop)
+            index = index[self.columns['underlying'][index] == self._find_underlying_id(underlying)]
+
+        return self._row_columns(index)
+
+    def _find_underlying_id(self, underlying):
+        # -1 (matching no row) for underlyings not in the store
+        underlying_id = np.searchsorted(self._underlyings, underlying)
+
+        return underlying_id if underlying_id < len(self._underlyings) and \
+            self._underlyings[underlying_id] == underlying else -1
+
+    def get_history_rows(self, symbol, start, end):
+        index = self._symbol_range(symbol, start, end)
+
+        return [(quotedate,) + row for quotedate, row in
+                zip(self.columns['quotedate'][index].tolist(), self._rows(index))]
+
+    def get_history_columns(self, symbol, start, end):
+        index = self._symbol_range(symbol, start, end)
+
+        return [self.columns['quotedate'][index]] + self._row_columns(index)
+
+    def get_chain_history_columns(self, quotedate, expiry_max, start, end):
+        columns = self.columns
+
+        first, last = self._day_range(quotedate)
+        expirations = columns['expiration'][first:last]
+        # Options expiring later on the quote day are part of intraday chains
+        chain_symbol_ids = columns['optionroot'][first + np.searchsorted(expirations, get_day_start(quotedate)):
+                                                 first + np.searchsorted(expirations, expiry_max, 'right')]
+
+        return self._history_columns(self._window_rows(start, end), chain_symbol_ids)
+
+    def get_symbol_history_columns(self, symbols, start, end):
+        return self._history_columns(self._window_rows(start, end), self._find_symbol_ids(symbols))
+
+    def _window_rows(self, start, end):
+        return np.arange(self._day_offsets[np.searchsorted(self.days, start, 'left')],
+                         self._day_offsets[np.searchsorted(self.days, end, 'right')])
+
+    def _history_columns(self, index, symbol_ids):
+        columns = self.columns
+
+        index = index[np.isin(columns['optionroot'][index], symbol_ids)]
+        index = index[np.lexsort((columns['quotedate'][index], columns['optionroot'][index]))]
+
+        return [columns['quotedate'][index], self._symbols[columns['optionroot'][index]]] + [
+            columns[name][index] for name in
+            ('expiration', 'strike', 'bid', 'ask', 'impliedvol', 'delta', 'theta', 'gamma', 'vega', 'underlying_last')
+        ]
+
+    def _build_delta_index(self, quotedate, expiry):
+        first, last = self._day_range(quotedate)
+        expirations = self.columns['expiration'][first:last]
+        first, last = first + np.searchsorted(expirations, expiry, 'left'), first + np.searchsorted(expirations, expiry, 'right')
+
+        return self.columns['delta'][first:last], first
+
+    def find_option_rows(self, deltas, expiries, quotedate):
+        results = self._delta_indexes.find(quotedate, deltas, expiries, self._build_delta_index)
+        rows = iter(self._rows([first + position for first, position in filter(None, results)]))
+
+        return [None if result is None else next(rows) for result in results]
+
+    def find_option_row(self, delta, expiry, quotedate):
+        return self.find_option_rows([delta], [expiry], quotedate)[0]
@@ -0,0 +1,215 @@
+import json
+import os
+
+import numpy as np
+
+from .columnar_store import ColumnarStore, TEXT_COLUMNS, INTEGER_COLUMNS, FLOAT_COLUMNS, INDEX_NAMES
+
+PRICE_COLUMNS = ('underlying_last', 'strike', 'last', 'bid', 'ask')
+GREEK_COLUMNS = ('impliedvol', 'delta', 'gamma', 'theta', 'vega')
+MAX_PRICE_DECIMALS = 6
+MAX_GREEK_DECIMALS = 8
+ENCODING_FILE = 'encoding.json'
+
+
+def _smallest_int_type(max_value):
+    for dtype in (np.int8, np.int16, np.int32):
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
+
+    return np.int64
+
+
+class QuantizedColumn:
+    __slots__ = ('values', 'decimals')
+
+    def __init__(self, values, decimals=None):
+        # Decodes to float64 on access. Integer values are ticks of 10 ** -decimals, float32 values are rounded
+        # back to decimals places, either way giving the exact float64 of a decimal with that many places.
+        self.values = values
+        self.decimals = decimals
+
+    @classmethod
+    def encode(cls, values, dtype, decimals=None):
+        values = np.asarray(values, dtype=np.float64)
+        if np.issubdtype(dtype, np.integer):
+            encoded = np.rint(values * 10.0 ** decimals)
+            if not np.all(np.abs(encoded) <= np.iinfo(dtype).max):
+                return None
+
+            return cls(encoded.astype(dtype), decimals)
+
+        return cls(values.astype(dtype), decimals)
+
+    def __getitem__(self, index):
+        values = self.values[index]
+        if self.decimals is None:
+            return values.astype(np.float64)
+
+        if np.issubdtype(self.values.dtype, np.integer):
+            return values / 10.0 ** self.decimals
+
+        return np.round(values.astype(np.float64), self.decimals)
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def get_arrays(self):
+        return {'': self.values}
+
+    def get_encoding(self):
+        return {'type': 'quantized', 'decimals': self.decimals}
+
+
+class DictionaryColumn:
+    __slots__ = ('ids', 'dictionary')
+
+    def __init__(self, ids, dictionary):
+        # Few distinct values (quotedates, expirations), stored as narrow ids into the sorted values
+        self.ids = ids
+        self.dictionary = dictionary
+
+    @classmethod
+    def encode(cls, values):
+        dictionary, ids = np.unique(values, return_inverse=True)
+
+        return cls(ids.astype(_smallest_int_type(len(dictionary))), dictionary)
+
+    def __getitem__(self, index):
+        return self.dictionary[self.ids[index]]
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        return self.ids.nbytes + self.dictionary.nbytes
+
+    def get_arrays(self):
+        return {'': self.ids, '.values': self.dictionary}
+
+    def get_encoding(self):
+        return {'type': 'dictionary'}
+
+
+def _encode_exact(values, candidates, chunk_size=1 << 22):
+    # First candidate encoding whose decoded values equal values bit for bit, checked a chunk at a time so that
+    # unsuitable encodings are usually rejected after the first chunk
+    for dtype, decimals in candidates:
+        for i in range(0, len(values), chunk_size):
+            chunk = np.asarray(values[i:i + chunk_size], dtype=np.float64)
+            encoded = QuantizedColumn.encode(chunk, dtype, decimals)
+            # Missing greeks (nan) survive float32, but never ticks
+            if encoded is None or not np.array_equal(encoded[:], chunk, equal_nan=np.issubdtype(dtype, np.floating)):
+                break
+        else:
+            return QuantizedColumn.encode(values, dtype, decimals)
+
+    return None
+
+
+def _load_array(path, name, mmap_mode):
+    # Plain ndarray views of the mapping, np.memmap slices cost several microseconds each and every query decodes
+    # a dozen of them
+    return np.asarray(np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode))
+
+
+class CompactStore(ColumnarStore):
+    def __init__(self, columns, dictionaries, indexes):
+        # A ColumnarStore whose columns and indexes decode on access: prices are int32 ticks, greeks and implied
+        # volatility float32 (or int32 ticks), quotedates, expirations and text fields narrow dictionary ids. Queries return the
+        # same values as the store it was converted from (see from_store).
+        super(CompactStore, self).__init__(columns, dictionaries, indexes)
+
+    @classmethod
+    def from_store(cls, store, exact=True):
+        # Converts a ColumnarStore. Each float column gets the fewest decimals that reproduce it exactly, greeks as
+        # float32 or else int32 ticks (float32 holds about 7 significant digits, vendor greeks such as a vega of
+        # 100.123456 need more); with exact=True columns no such encoding fits stay float64 (see
+        # get_full_precision_columns), otherwise they are stored as plain float32.
+        columns = {}
+        for name in TEXT_COLUMNS:
+            columns[name] = store.columns[name].astype(_smallest_int_type(len(store.dictionaries[name])))
+
+        for name in INTEGER_COLUMNS:
+            columns[name] = DictionaryColumn.encode(store.columns[name])
+
+        for name in FLOAT_COLUMNS:
+            if name in PRICE_COLUMNS:
+                candidates = [(np.int32, decimals) for decimals in range(MAX_PRICE_DECIMALS + 1)]
+            else:
+                candidates = [(dtype, decimals) for dtype in (np.float32, np.int32)
+                              for decimals in range(MAX_GREEK_DECIMALS + 1)]
+
+            columns[name] = _encode_exact(store.columns[name], candidates) or \
+                QuantizedColumn.encode(store.columns[name], np.float64 if exact else np.float32)
+
+        indexes = dict(store.indexes)
+        row_count = len(store.columns['quotedate'])
+        indexes['symbol_order'] = store.indexes['symbol_order'].astype(_smallest_int_type(row_count))
+        indexes['symbol_quotedates'] = DictionaryColumn(
+            np.searchsorted(store.days, store.indexes['symbol_quotedates']).astype(_smallest_int_type(len(store.days))),
+            np.asarray(store.days)
+        )
+
+        return cls(columns, dict(store.dictionaries), indexes)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+
+        encoding = {'columns': {}, 'indexes': {}}
+        for group, suffix, arrays in (('columns', '', self.columns), ('indexes', '.index', self.indexes)):
+            for name, array in arrays.items():
+                if isinstance(array, np.ndarray):
+                    array_files = {'': array}
+                    encoding[group][name] = {'type': 'array'}
+                else:
+                    array_files = array.get_arrays()
+                    encoding[group][name] = array.get_encoding()
+
+                for array_suffix, values in array_files.items():
+                    np.save(os.path.join(path, f'{name}{suffix}{array_suffix}.npy'), values)
+
+        for name, dictionary in self.dictionaries.items():
+            np.save(os.path.join(path, f'{name}.dictionary.npy'), dictionary)
+
+        with open(os.path.join(path, ENCODING_FILE), 'w') as fp:
+            json.dump(encoding, fp, indent=2)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        mmap_mode = 'r' if mmap else None
+
+        with open(os.path.join(path, ENCODING_FILE), 'r') as fp:
+            encoding = json.load(fp)
+
+        def load_group(group, suffix, names):
+            arrays = {}
+            for name in names:
+                column_encoding = encoding[group][name]
+                values = _load_array(path, f'{name}{suffix}', mmap_mode)
+
+                if column_encoding['type'] == 'quantized':
+                    arrays[name] = QuantizedColumn(values, column_encoding['decimals'])
+                elif column_encoding['type'] == 'dictionary':
+                    arrays[name] = DictionaryColumn(values, _load_array(path, f'{name}{suffix}.values', mmap_mode))
+                else:
+                    arrays[name] = values
+
+            return arrays
+
+        return cls(load_group('columns', '', TEXT_COLUMNS + INTEGER_COLUMNS + FLOAT_COLUMNS),
+                   {name: _load_array(path, f'{name}.dictionary', mmap_mode) for name in TEXT_COLUMNS},
+                   load_group('indexes', '.index', INDEX_NAMES))
+
+    def get_full_precision_columns(self):
+        # Float columns stored as float64, for want of an exact 4 byte encoding
+        return [name for name in FLOAT_COLUMNS if self.columns[name].values.dtype == np.float64]
+
+    def get_encodings(self):
+        return {name: column.get_encoding() if not isinstance(column, np.ndarray) else {'type': 'array'}
+                for name, column in self.columns.items()}
@@ -0,0 +1,18 @@
+from .account import Account
+from .options_broker import OptionsBroker
+
+
+def split_date_windows(data_path, n_windows, backend='mmap'):
+    broker = OptionsBroker(account=Account())
+    broker.load_historical_data(data_path, backend=backend)
+    trading_days = broker.get_trading_days()
+    broker.shutdown()
+
+    window_length = len(trading_days) // n_windows
+    if window_length < 2:
+        raise ValueError()
+
+    # The last window absorbs the remainder so the whole dataset is covered
+    return [(trading_days[i * window_length],
+             trading_days[(i + 1) * window_length - 1] if i < n_windows - 1 else trading_days[-1])
+            for i in range(n_windows)]
@@ -0,0 +1,305 @@
+import queue
+import sys
+import threading
+
+import numpy as np
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .columnar_store import ColumnarStore
+
+
+class DayStore(ColumnarStore):
+    def __init__(self, columns, dictionaries, indexes=None):
+        super(DayStore, self).__init__(columns, dictionaries, indexes)
+
+        # One trading day is small enough to keep as ready-made rows, which makes point lookups plain dict and
+        # list accesses instead of NumPy calls
+        self.quotedate = int(self.days[0]) if len(self.days) else None
+        self._row_list = self._rows(slice(None))
+        self._row_index = {row[0]: i for i, row in enumerate(self._row_list)}
+
+        # Estimated from the first row, the strings are mostly shared with the dictionaries
+        row_bytes = sys.getsizeof(self._row_list[0]) + sum(map(sys.getsizeof, self._row_list[0])) if self._row_list else 0
+        self._row_bytes = sys.getsizeof(self._row_index) + len(self._row_list) * row_bytes
+
+    @classmethod
+    def from_store(cls, store):
+        return cls(store.columns, store.dictionaries, store.indexes)
+
+    @property
+    def nbytes(self):
+        return super(DayStore, self).nbytes + self._row_bytes
+
+    def get_option_row(self, symbol, quotedate):
+        i = self._row_index.get(symbol)
+
+        return self._row_list[i] if i is not None and quotedate == self.quotedate else None
+
+    def get_option_rows(self, symbols, quotedate):
+        if quotedate != self.quotedate:
+            return {}
+
+        return {symbol: self._row_list[self._row_index[symbol]] for symbol in symbols if symbol in self._row_index}
+
+    def get_chain_rows(self, quotedate, expiry_min, expiry_max):
+        if quotedate != self.quotedate:
+            return []
+
+        expirations = self.columns['expiration']
+
+        return self._row_list[np.searchsorted(expirations, expiry_min, 'left'):
+                              np.searchsorted(expirations, expiry_max, 'right')]
+
+    def get_history_rows(self, symbol, start, end):
+        i = self._row_index.get(symbol)
+        if i is None or self.quotedate is None or not start <= self.quotedate <= end:
+            return []
+
+        return [(self.quotedate,) + self._row_list[i]]
+
+    def find_option_rows(self, deltas, expiries, quotedate):
+        return [None if result is None else self._row_list[result[0] + result[1]]
+                for result in self._delta_indexes.find(quotedate, deltas, expiries, self._build_delta_index)]
+
+
+class DayProducer:
+    def __init__(self, cache, quotedates, depth=2, reader=None):
+        # Loads and decodes the day stores of quotedates on a background thread, at most depth days ahead of the
+        # consumer. Iterating inserts each day into cache and yields its quotedate. Days are read from reader (see
+        # open_reader) when given, otherwise through the cache's store, which the consumer then waits on.
+        self._cache = cache
+        self._reader = reader
+        self._quotedates = quotedates
+        self._queue = queue.Queue(maxsize=depth)
+        self._stopped = threading.Event()
+
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        # Blocks while the queue is full, checking for close so a stopped consumer never strands the thread
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def _produce(self):
+        try:
+            for quotedate in self._quotedates:
+                day_store = DayStore.from_store(self._reader.get_day_store(quotedate)) if self._reader is not None \
+                    else self._cache._load_day(quotedate)
+
+                if not self._put((quotedate, day_store, None)):
+                    return
+        except Exception as e:
+            self._put((None, None, e))
+            return
+
+        self._put((None, None, None))
+
+    def __iter__(self):
+        while True:
+            quotedate, day_store, error = self._queue.get()
+            if error is not None:
+                raise error
+
+            if quotedate is None:
+                return
+
+            self._cache._insert_day(quotedate, day_store)
+
+            yield quotedate
+
+    def close(self):
+        self._stopped.set()
+
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+        self._thread.join()
+
+
+class DayCache:
+    def __init__(self, store, max_bytes=512 * 2 ** 20, prefetch=True, max_history_days=10):
+        self._store = store
+        self.max_bytes = max_bytes
+        self.max_history_days = max_history_days
+
+        # Day stores keyed by quotedate, least recently used first
+        self._days = OrderedDict()
+        self._pending = {}
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.prefetch_hits = 0
+        self.evictions = 0
+
+        self._store_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+
+        start, end = store.get_date_range()
+        self._trading_days = np.array(store.get_trading_days(start, end), dtype=np.int64)
+
+    def get_stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'prefetch_hits': self.prefetch_hits,
+            'evictions': self.evictions,
+            'days': len(self._days),
+            'bytes': self._bytes
+        }
+
+    def _load_day(self, quotedate):
+        with self._store_lock:
+            day_store = self._store.get_day_store(quotedate)
+
+        return DayStore.from_store(day_store)
+
+    def _insert_day(self, quotedate, day_store):
+        with self._cache_lock:
+            if quotedate in self._days:
+                return self._days[quotedate]
+
+            self._days[quotedate] = day_store
+            self._bytes += day_store.nbytes
+
+            # Always keep the day just inserted, even if it alone is over budget
+            while self._bytes > self.max_bytes and len(self._days) > 1:
+                _, evicted = self._days.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+            return day_store
+
+    def get_day(self, quotedate):
+        with self._cache_lock:
+            if quotedate in self._days:
+                self._days.move_to_end(quotedate)
+                self.hits += 1
+                return self._days[quotedate]
+
+            pending = self._pending.pop(quotedate, None)
+
+        if pending is not None:
+            self.prefetch_hits += 1
+            return self._insert_day(quotedate, pending.result())
+
+        self.misses += 1
+        return self._insert_day(quotedate, self._load_day(quotedate))
+
+    def prefetch(self, quotedate):
+        if self._executor is None:
+            return
+
+        with self._cache_lock:
+            if quotedate in self._days or quotedate in self._pending:
+                return
+
+            self._pending[quotedate] = self._executor.submit(self._load_day, quotedate)
+
+    def _window_days(self, start, end):
+        return self._trading_days[np.searchsorted(self._trading_days, start, 'left'):
+                                  np.searchsorted(self._trading_days, end, 'right')].tolist()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+        with self._store_lock:
+            self._store.close()
+
+    def open_reader(self):
+        return self._store.open_reader()
+
+    def set_trace_callback(self, callback):
+        if hasattr(self._store, 'set_trace_callback'):
+            with self._store_lock:
+                self._store.set_trace_callback(callback)
+
+    def get_date_range(self):
+        return int(self._trading_days[0]), int(self._trading_days[-1])
+
+    def get_underlyings(self):
+        with self._store_lock:
+            return self._store.get_underlyings()
+
+    def get_trading_days(self, start, end):
+        return self._window_days(start, end)
+
+    def iter_trading_days(self, start, end):
+        days = self._trading_days[np.searchsorted(self._trading_days, start, 'left'):
+                                  np.searchsorted(self._trading_days, end, 'right')]
+        for i in range(0, len(days), 4096):
+            yield from days[i:i + 4096].tolist()
+
+    def get_option_row(self, symbol, quotedate):
+        return self.get_day(quotedate).get_option_row(symbol, quotedate)
+
+    def get_option_rows(self, symbols, quotedate):
+        return self.get_day(quotedate).get_option_rows(symbols, quotedate)
+
+    def get_chain_rows(self, quotedate, expiry_min, expiry_max):
+        return self.get_day(quotedate).get_chain_rows(quotedate, expiry_min, expiry_max)
+
+    def get_chain_columns(self, quotedate, expiry_min, expiry_max, underlying=None):
+        return self.get_day(quotedate).get_chain_columns(quotedate, expiry_min, expiry_max, underlying)
+
+    def get_day_store(self, quotedate):
+        return self.get_day(quotedate)
+
+    def get_history_rows(self, symbol, start, end):
+        days = self._window_days(start, end)
+        if len(days) > self.max_history_days:
+            # Long histories would flush the cache, read them straight from the store
+            with self._store_lock:
+                return self._store.get_history_rows(symbol, start, end)
+
+        return [row for day in days for row in self.get_day(day).get_history_rows(symbol, day, day)]
+
+    def get_history_columns(self, symbol, start, end):
+        return list(zip(*self.get_history_rows(symbol, start, end))) or [()] * 14
+
+    def get_chain_history_columns(self, quotedate, expiry_max, start, end):
+        days = self._window_days(start, end)
+        if len(days) > self.max_history_days:
+            with self._store_lock:
+                return self._store.get_chain_history_columns(quotedate, expiry_max, start, end)
+
+        chain_symbols = self.get_day(quotedate).get_chain_history_columns(quotedate, expiry_max, quotedate, quotedate)[1]
+
+        return self._days_history_columns(days, chain_symbols)
+
+    def get_symbol_history_columns(self, symbols, start, end):
+        days = self._window_days(start, end)
+        if len(days) > self.max_history_days:
+            with self._store_lock:
+                return self._store.get_symbol_history_columns(symbols, start, end)
+
+        return self._days_history_columns(days, symbols)
+
+    def _days_history_columns(self, days, symbols):
+        day_columns = [self.get_day(day).get_symbol_history_columns(symbols, day, day) for day in days]
+        if not day_columns:
+            return ColumnarStore.empty().get_symbol_history_columns([], 0, 0)
+
+        columns = [np.concatenate(column) for column in zip(*day_columns)]
+        order = np.lexsort((columns[0], columns[1]))
+
+        return [column[order] for column in columns]
+
+    def find_option_rows(self, deltas, expiries, quotedate):
+        return self.get_day(quotedate).find_option_rows(deltas, expiries, quotedate)
+
+    def find_option_row(self, delta, expiry, quotedate):
+        return self.get_day(quotedate).find_option_row(delta, expiry, quotedate)
@@ -0,0 +1,65 @@
+from collections import OrderedDict
+
+import numpy as np
+
+
+class DeltaIndex:
+    def __init__(self, deltas):
+        # Stable sort keeps the original (optionroot) order among equal deltas
+        self.order = np.argsort(deltas, kind='stable')
+        self.deltas = np.asarray(deltas, dtype=np.float64)[self.order]
+
+    def find(self, targets):
+        targets = np.asarray(targets, dtype=np.float64)
+        if len(self.deltas) == 0:
+            return np.full(targets.shape, -1, dtype=np.int64)
+
+        # Closest delta at or below and at or above each target, like MAX(delta) <= x and MIN(delta) >= x
+        below = np.searchsorted(self.deltas, targets, 'right') - 1
+        above = np.searchsorted(self.deltas, targets, 'left')
+        found = (below >= 0) & (above < len(self.deltas))
+
+        below = np.clip(below, 0, len(self.deltas) - 1)
+        above = np.clip(above, 0, len(self.deltas) - 1)
+        # Among equal deltas prefer the first option, as SQLite does
+        below = np.searchsorted(self.deltas, self.deltas[below], 'left')
+
+        nearest = np.where(np.abs(self.deltas[below] - targets) < np.abs(self.deltas[above] - targets), below, above)
+
+        return np.where(found, self.order[nearest], -1)
+
+
+class DeltaIndexCache:
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._indexes = OrderedDict()
+
+    def get(self, quotedate, expiry, build):
+        key = (quotedate, expiry)
+        if key in self._indexes:
+            self._indexes.move_to_end(key)
+        else:
+            deltas, payload = build(quotedate, expiry)
+            self._indexes[key] = DeltaIndex(deltas), payload
+
+            if len(self._indexes) > self.max_size:
+                self._indexes.popitem(last=False)
+
+        return self._indexes[key]
+
+    def find(self, quotedate, deltas, expiries, build):
+        deltas, expiries = np.broadcast_arrays(np.asarray(deltas, dtype=np.float64),
+                                               np.asarray(expiries, dtype=np.int64))
+        deltas = deltas.ravel()
+        expiries = expiries.ravel()
+
+        results = [None] * len(deltas)
+        for expiry in np.unique(expiries).tolist():
+            targets = np.flatnonzero(expiries == expiry)
+            index, payload = self.get(quotedate, expiry, build)
+
+            for target, position in zip(targets.tolist(), index.find(deltas[targets]).tolist()):
+                if position >= 0:
+                    results[target] = (payload, position)
+
+        return results
@@ -6,13 +6,31 @@ class OrderType(Enum):
     SELL = 'sell'
 
 
+class OrderLeg:
+    __slots__ = ('order_type', 'symbol', 'quote', 'size')
+
+    def __init__(self, order_type, symbol=None, quote=None, size=1):
+        # One leg of a multi-leg order, size in contracts like OptionsBroker.buy/sell. Legs given a quote are
+        # priced from it, the others are looked up together.
+        if symbol is None and quote is None:
+            raise ValueError()
+
+        self.order_type = order_type
+        self.symbol = symbol if symbol is not None else quote.asset.symbol
+        self.quote = quote
+        self.size = size
+
+
 class Execution:
-    def __init__(self, symbol, price, size, asset, order_type):
+    __slots__ = ('symbol', 'price', 'size', 'asset', 'order_type', 'quotedate')
+
+    def __init__(self, symbol, price, size, asset, order_type, quotedate=None):
         self.symbol = symbol
         self.price = price if price >= 0.0 else -price
         self.size = size
         self.asset = asset
         self.order_type = order_type
+        self.quotedate = quotedate
 
     def get_total_value(self):
         return self.price * self.size
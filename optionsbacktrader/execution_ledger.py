@@ -0,0 +1,242 @@
+import bisect
+import os
+import tempfile
+
+import numpy as np
+
+from .chain_view import datetime_from_db, datetime_to_db
+from .execution import Execution, OrderType
+from .option import Option
+
+NO_DATE = np.iinfo(np.int64).min
+
+LEDGER_COLUMNS = (
+    ('symbol', np.int32),
+    ('quotedate', np.int64),
+    ('order_type', np.int8),
+    ('price', np.float64),
+    ('size', np.int64),
+    ('realized_pl', np.float64),
+    ('strike', np.float64),
+    ('expiration', np.int64),
+    ('implied_volatility', np.float64),
+    ('delta', np.float64),
+    ('theta', np.float64),
+    ('gamma', np.float64),
+    ('vega', np.float64)
+)
+
+
+class ExecutionLedger:
+    def __init__(self, capacity=1024, spill_path=None, spill_rows=65536):
+        # One preallocated array per column, symbols interned into a table of ids. With spill_path set, every
+        # spill_rows executions are written out as one .npz chunk so memory stays bounded.
+        self.spill_path = spill_path
+        self.spill_rows = spill_rows
+
+        self._initial_capacity = capacity
+        self._symbols = []
+        self._symbol_ids = {}
+        # underlying symbol and option type of each symbol id, from the first fill with a quoted Option
+        self._contracts = []
+
+        self._spilled_chunks = []
+        self._spilled_rows = 0
+
+        # (truncation number, length) of every truncate or clear not followed by a shorter one, so lengths increase.
+        # A mark is only restored while its rows are still the ones it saw.
+        self._truncations = []
+        self._truncation_count = 0
+
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self._columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in LEDGER_COLUMNS}
+        self._size = 0
+
+    def __len__(self):
+        return self._spilled_rows + self._size
+
+    def clear(self):
+        for chunk_path in self._spilled_chunks:
+            if os.path.exists(chunk_path):
+                os.remove(chunk_path)
+
+        self._symbols = []
+        self._symbol_ids = {}
+        self._contracts = []
+        self._spilled_chunks = []
+        self._spilled_rows = 0
+        self._truncated(0)
+
+        self._allocate(self._initial_capacity)
+
+    def _truncated(self, length):
+        while self._truncations and self._truncations[-1][1] >= length:
+            self._truncations.pop()
+
+        self._truncations.append((self._truncation_count, length))
+        self._truncation_count += 1
+
+    def mark(self):
+        return len(self), self._truncation_count
+
+    def truncate(self, mark):
+        # Drops the executions appended after mark. Constant time unless spilled chunks have to be read back.
+        length, truncation_count = mark
+        i = bisect.bisect_left(self._truncations, (truncation_count,))
+        if length > len(self) or (i < len(self._truncations) and self._truncations[i][1] < length):
+            raise ValueError()
+
+        while self._spilled_rows > length:
+            chunk_path = self._spilled_chunks.pop()
+            with np.load(chunk_path) as chunk:
+                chunk_columns = {name: chunk[name] for name, _ in LEDGER_COLUMNS}
+            os.remove(chunk_path)
+
+            chunk_size = len(chunk_columns['symbol'])
+            self._spilled_rows -= chunk_size
+            self._allocate(max(self._initial_capacity, chunk_size))
+            for name, column in chunk_columns.items():
+                self._columns[name][:chunk_size] = column
+
+        self._size = length - self._spilled_rows
+        self._truncated(length)
+
+    def _intern(self, symbol, asset):
+        symbol_id = self._symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self._symbol_ids[symbol] = len(self._symbols)
+            self._symbols.append(symbol)
+            self._contracts.append(None)
+
+        if self._contracts[symbol_id] is None and isinstance(asset, Option):
+            self._contracts[symbol_id] = (asset.underlying_symbol, asset.option_type)
+
+        return symbol_id
+
+    def append(self, execution, realized_pl=0.0):
+        if self._size == len(self._columns['symbol']):
+            self._columns = {
+                name: np.concatenate((column, np.empty(len(column), dtype=column.dtype)))
+                for name, column in self._columns.items()
+            }
+
+        asset = execution.asset
+        has_option = isinstance(asset, Option)
+
+        i = self._size
+        columns = self._columns
+        columns['symbol'][i] = self._intern(execution.symbol, asset)
+        columns['quotedate'][i] = datetime_to_db(execution.quotedate) if execution.quotedate is not None else NO_DATE
+        columns['order_type'][i] = 1 if execution.order_type == OrderType.BUY else -1
+        columns['price'][i] = execution.price
+        columns['size'][i] = execution.size
+        columns['realized_pl'][i] = realized_pl
+        columns['strike'][i] = asset.strike if has_option else np.nan
+        columns['expiration'][i] = datetime_to_db(asset.expiry_date) if has_option else NO_DATE
+        columns['implied_volatility'][i] = asset.implied_volatility if has_option else np.nan
+        columns['delta'][i] = asset.delta if has_option else np.nan
+        columns['theta'][i] = asset.theta if has_option else np.nan
+        columns['gamma'][i] = asset.gamma if has_option else np.nan
+        columns['vega'][i] = asset.vega if has_option else np.nan
+        self._size += 1
+
+        if self.spill_path is not None and self._size >= self.spill_rows:
+            self.spill()
+
+    def spill(self):
+        if self._size == 0:
+            return
+
+        os.makedirs(self.spill_path, exist_ok=True)
+        # A unique file, so ledgers of forked processes (or restored from a pickle) can share spill_path
+        fd, chunk_path = tempfile.mkstemp(prefix=f'executions-{len(self._spilled_chunks):06d}-', suffix='.npz',
+                                          dir=self.spill_path)
+        with os.fdopen(fd, 'wb') as fp:
+            np.savez(fp, **{name: column[:self._size] for name, column in self._columns.items()})
+
+        self._spilled_chunks.append(chunk_path)
+        self._spilled_rows += self._size
+        self._allocate(self._initial_capacity)
+
+    def get_columns(self):
+        chunks = []
+        for chunk_path in self._spilled_chunks:
+            with np.load(chunk_path) as chunk:
+                chunks.append({name: chunk[name] for name, _ in LEDGER_COLUMNS})
+
+        chunks.append({name: column[:self._size] for name, column in self._columns.items()})
+
+        return {name: np.concatenate([chunk[name] for chunk in chunks]) for name, _ in LEDGER_COLUMNS}
+
+    def get_symbols(self):
+        return list(self._symbols)
+
+    def get_executions(self):
+        columns = self.get_columns()
+        expiry_dates = {}
+
+        executions = []
+        for row in zip(*[columns[name].tolist() for name, _ in LEDGER_COLUMNS]):
+            symbol_id, quotedate, order_type, price, size, _, strike, expiration, iv, delta, theta, gamma, vega = row
+            symbol = self._symbols[symbol_id]
+
+            if expiration == NO_DATE:
+                asset = symbol
+            else:
+                if expiration not in expiry_dates:
+                    expiry_dates[expiration] = datetime_from_db(expiration)
+
+                underlying_symbol, option_type = self._contracts[symbol_id]
+                asset = Option(symbol=symbol,
+                               underlying_symbol=underlying_symbol,
+                               option_type=option_type.value,
+                               strike=strike,
+                               expiry_date=expiry_dates[expiration],
+                               implied_volatility=iv,
+                               delta=delta,
+                               theta=theta,
+                               gamma=gamma,
+                               vega=vega)
+
+            executions.append(Execution(symbol=symbol,
+                                        price=price,
+                                        size=size,
+                                        asset=asset,
+                                        order_type=OrderType.BUY if order_type == 1 else OrderType.SELL,
+                                        quotedate=None if quotedate == NO_DATE else datetime_from_db(quotedate)))
+
+        return executions
+
+    def _window(self, columns, start_date, end_date):
+        quotedates = columns['quotedate']
+        mask = np.ones(len(quotedates), dtype=bool)
+        if start_date is not None:
+            mask &= quotedates >= datetime_to_db(start_date)
+
+        if end_date is not None:
+            mask &= (quotedates <= datetime_to_db(end_date)) & (quotedates != NO_DATE)
+
+        return mask
+
+    def get_fills_per_symbol(self, start_date=None, end_date=None):
+        columns = self.get_columns()
+        symbol_ids = columns['symbol'][self._window(columns, start_date, end_date)]
+
+        counts = np.bincount(symbol_ids, minlength=len(self._symbols))
+
+        return {self._symbols[i]: int(counts[i]) for i in np.flatnonzero(counts)}
+
+    def get_realized_pl(self, start_date=None, end_date=None, per_symbol=False):
+        columns = self.get_columns()
+        mask = self._window(columns, start_date, end_date)
+
+        if not per_symbol:
+            return float(columns['realized_pl'][mask].sum())
+
+        totals = np.bincount(columns['symbol'][mask], weights=columns['realized_pl'][mask],
+                             minlength=len(self._symbols))
+        fills = np.bincount(columns['symbol'][mask], minlength=len(self._symbols))
+
+        return {self._symbols[i]: float(totals[i]) for i in np.flatnonzero(fills)}
@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+
+from .chain_view import datetime_to_db
+from .observation import ChainObservationBuilder, OBSERVATION_WIDTH
+
+FEATURE_WIDTH = OBSERVATION_WIDTH - 1
+
+# Streamed row arrays, written raw while building and converted to .npy at the end
+ROW_ARRAYS = (
+    ('features', np.float32, (FEATURE_WIDTH,)),
+    ('symbol_ids', np.int32, ()),
+    ('expirations', np.int64, ())
+)
+
+
+class FeatureStore:
+    def __init__(self, arrays):
+        # Every trading day's chain features concatenated in chain order. Day i owns rows
+        # day_offsets[i]:day_offsets[i + 1], symbol_ids index the symbols dictionary.
+        self.days = arrays['days']
+        self._day_offsets = arrays['day_offsets']
+        self._features = arrays['features']
+        self._symbol_ids = arrays['symbol_ids']
+        self._expirations = arrays['expirations']
+        self._symbols = arrays['symbols']
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        mmap_mode = 'r' if mmap else None
+
+        return cls({
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode) for name in
+            ('days', 'day_offsets', 'symbols') + tuple(name for name, _, _ in ROW_ARRAYS)
+        })
+
+    @classmethod
+    def build(cls, broker, path, start_date=None, end_date=None, progress=None):
+        # Builds one day at a time so only a single chain is ever held in memory
+        os.makedirs(path, exist_ok=True)
+
+        builder = ChainObservationBuilder(broker)
+        symbol_ids = {}
+        days = []
+        day_offsets = [0]
+
+        raw_files = {name: open(os.path.join(path, f'{name}.raw'), 'wb') for name, _, _ in ROW_ARRAYS}
+        try:
+            for day in broker.get_trading_days(start_date, end_date):
+                chain_features, symbols, expirations = builder.build_chain_features(day)
+
+                for symbol in symbols.tolist():
+                    if symbol not in symbol_ids:
+                        symbol_ids[symbol] = len(symbol_ids)
+
+                raw_files['features'].write(np.ascontiguousarray(chain_features, dtype=np.float32).tobytes())
+                raw_files['symbol_ids'].write(
+                    np.array([symbol_ids[symbol] for symbol in symbols.tolist()], dtype=np.int32).tobytes())
+                raw_files['expirations'].write(np.asarray(expirations, dtype=np.int64).tobytes())
+
+                days.append(datetime_to_db(day))
+                day_offsets.append(day_offsets[-1] + len(chain_features))
+
+                if progress is not None:
+                    progress(day, len(chain_features))
+        finally:
+            for fp in raw_files.values():
+                fp.close()
+
+        row_count = day_offsets[-1]
+        for name, dtype, shape in ROW_ARRAYS:
+            raw_path = os.path.join(path, f'{name}.raw')
+            output = np.lib.format.open_memmap(os.path.join(path, f'{name}.npy'), mode='w+', dtype=dtype,
+                                               shape=(row_count,) + shape)
+            if row_count:
+                raw = np.memmap(raw_path, dtype=dtype, mode='r', shape=(row_count,) + shape)
+                for i in range(0, row_count, 1 << 20):
+                    output[i:i + (1 << 20)] = raw[i:i + (1 << 20)]
+                del raw
+
+            output.flush()
+            del output
+            os.remove(raw_path)
+
+        np.save(os.path.join(path, 'days.npy'), np.array(days, dtype=np.int64))
+        np.save(os.path.join(path, 'day_offsets.npy'), np.array(day_offsets, dtype=np.int64))
+        np.save(os.path.join(path, 'symbols.npy'), np.array(list(symbol_ids), dtype=str))
+
+        return cls.load(path)
+
+    def get_day(self, quotedate):
+        i = np.searchsorted(self.days, quotedate)
+        if i == len(self.days) or self.days[i] != quotedate:
+            return None
+
+        first, last = self._day_offsets[i], self._day_offsets[i + 1]
+
+        return self._features[first:last], self._symbols[self._symbol_ids[first:last]], self._expirations[first:last]
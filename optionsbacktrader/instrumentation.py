@@ -0,0 +1,246 @@
+import bisect
+import json
+import threading
+import time
+
+from functools import wraps
+
+BROKER_METHODS = (
+    'get_options_chain',
+    'get_option_quote',
+    'get_option_quotes',
+    'get_history_for_option',
+    'get_history_for_options_chain',
+    'find_option',
+    'find_options',
+    'buy',
+    'sell',
+    'place_order',
+    'close_all',
+    'settle_expiring'
+)
+ACCOUNT_METHODS = ('get_market_value', 'get_position_market_value', 'get_percent_spent_pl')
+ENV_METHODS = ('step', 'reset')
+
+# Rows each store method returns
+STORE_ROW_COUNTS = {
+    'get_option_row': lambda result: int(result is not None),
+    'get_option_rows': len,
+    'get_chain_rows': len,
+    'get_chain_columns': lambda result: len(result[0]),
+    'get_history_rows': len,
+    'get_history_columns': lambda result: len(result[0]),
+    'get_chain_history_columns': lambda result: len(result[0]),
+    'find_option_row': lambda result: int(result is not None),
+    'find_option_rows': lambda result: sum(row is not None for row in result)
+}
+
+# Wall time histogram bucket upper bounds in seconds, four per decade from 1us to 10s
+HISTOGRAM_BOUNDS = [10 ** (exponent / 4) for exponent in range(-24, 5)]
+
+BACKGROUND = 'background'
+
+
+class CallStats:
+    def __init__(self):
+        self.calls = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self.store_calls = 0
+        self.sql_queries = 0
+        self.rows = 0
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+
+    def record(self, elapsed):
+        self.calls += 1
+        self.total_s += elapsed
+        self.max_s = max(self.max_s, elapsed)
+        self.histogram[bisect.bisect_left(HISTOGRAM_BOUNDS, elapsed)] += 1
+
+    def to_dict(self):
+        return {
+            'calls': self.calls,
+            'total_s': self.total_s,
+            'mean_s': self.total_s / self.calls if self.calls else 0.0,
+            'max_s': self.max_s,
+            'store_calls': self.store_calls,
+            'sql_queries': self.sql_queries,
+            'rows': self.rows,
+            'histogram': self.histogram
+        }
+
+
+class Instrumentation:
+    def __init__(self, tensorboard_log=None):
+        self.tensorboard_log = tensorboard_log
+
+        self.totals = {}
+        self.episode = {}
+        self.episodes = []
+
+        self._local = threading.local()
+        # Counters are also updated by prefetch and reader threads
+        self._lock = threading.RLock()
+        self._patched = []
+        self._traced_store = None
+        self._writer = None
+
+    def _stats(self, name):
+        # One CallStats per name in both the run totals and the current episode, call with _lock held
+        if name not in self.totals:
+            self.totals[name] = CallStats()
+
+        if name not in self.episode:
+            self.episode[name] = CallStats()
+
+        return self.totals[name], self.episode[name]
+
+    def _active(self):
+        # Names of the instrumented calls in progress on this thread, outermost first. Store and SQL work is
+        # counted against all of them, work done by prefetch threads against BACKGROUND.
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        return stack
+
+    def _wrap_call(self, obj, method_name, name):
+        method = getattr(obj, method_name)
+        active = self._active
+
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            stack = active()
+            stack.append(name)
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                stack.pop()
+                with self._lock:
+                    for stats in self._stats(name):
+                        stats.record(elapsed)
+
+        self._patch(obj, method_name, wrapper)
+
+    def _wrap_store(self, store, method_name, count_rows):
+        method = getattr(store, method_name)
+
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            result = method(*args, **kwargs)
+
+            rows = count_rows(result)
+            with self._lock:
+                for name in self._active() or [BACKGROUND]:
+                    for stats in self._stats(name):
+                        stats.store_calls += 1
+                        stats.rows += rows
+
+            return result
+
+        self._patch(store, method_name, wrapper)
+
+    def _patch(self, obj, method_name, wrapper):
+        # Instance attributes shadow the class methods, detach() deletes them again so nothing is left behind
+        setattr(obj, method_name, wrapper)
+        self._patched.append((obj, method_name))
+
+    def _trace_sql(self, statement):
+        with self._lock:
+            for name in self._active() or [BACKGROUND]:
+                for stats in self._stats(name):
+                    stats.sql_queries += 1
+
+    def attach(self, broker, env=None):
+        # Call after load_historical_data, the store is instrumented as loaded
+        for method_name in BROKER_METHODS:
+            self._wrap_call(broker, method_name, method_name)
+
+        for method_name in ACCOUNT_METHODS:
+            self._wrap_call(broker.account, method_name, f'Account.{method_name}')
+
+        store = broker._store
+        if store is not None:
+            for method_name, count_rows in STORE_ROW_COUNTS.items():
+                if hasattr(store, method_name):
+                    self._wrap_store(store, method_name, count_rows)
+
+            # Every connection of a SQLite backed store (the shards of a ShardedStore, the store behind a DayCache and
+            # readers opened from them for pipelined runs) reports its statements
+            if hasattr(store, 'set_trace_callback'):
+                self._traced_store = store
+                store.set_trace_callback(self._trace_sql)
+
+        if env is not None:
+            self._wrap_call(env, 'step', 'env.step')
+            self._wrap_call(env, 'reset', 'env.reset')
+
+            reset = env.reset
+
+            @wraps(reset)
+            def reset_episode(*args, **kwargs):
+                if 'env.step' in self.episode:
+                    self.end_episode()
+
+                return reset(*args, **kwargs)
+
+            self._patch(env, 'reset', reset_episode)
+
+        return self
+
+    def detach(self):
+        for obj, method_name in reversed(self._patched):
+            if method_name in vars(obj):
+                delattr(obj, method_name)
+
+        self._patched = []
+
+        if self._traced_store is not None:
+            self._traced_store.set_trace_callback(None)
+            self._traced_store = None
+
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def get_summary(self, stats=None):
+        with self._lock:
+            if stats is None:
+                stats = self.totals
+
+            return {name: call_stats.to_dict() for name, call_stats in sorted(stats.items())}
+
+    def end_episode(self):
+        with self._lock:
+            summary = self.get_summary(self.episode)
+            self.episode = {}
+
+        self.episodes.append(summary)
+
+        if self.tensorboard_log is not None:
+            self.write_tensorboard(summary, len(self.episodes))
+
+        return summary
+
+    def write_tensorboard(self, summary, step):
+        if self._writer is None:
+            # Same writer stable-baselines3 uses for tensorboard_log
+            from torch.utils.tensorboard import SummaryWriter
+
+            self._writer = SummaryWriter(self.tensorboard_log)
+
+        for name, stats in summary.items():
+            for key in ('calls', 'mean_s', 'max_s', 'sql_queries', 'rows'):
+                self._writer.add_scalar(f'instrumentation/{name}/{key}', stats[key], step)
+
+        self._writer.flush()
+
+    def export_json(self, path):
+        with open(path, 'w') as fp:
+            json.dump({
+                'histogram_bounds_s': HISTOGRAM_BOUNDS,
+                'totals': self.get_summary(),
+                'episodes': self.episodes
+            }, fp, indent=2)
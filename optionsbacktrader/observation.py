@@ -0,0 +1,131 @@
+import numpy as np
+
+from datetime import timedelta
+from .options_broker import datetime_to_db
+from .clock import DAY
+
+HISTORY_DAYS = 5
+FEATURES_PER_DAY = 8
+OBSERVATION_WIDTH = HISTORY_DAYS * FEATURES_PER_DAY + 2
+
+
+def pad_chain(chain, max_chain_length):
+    # The fixed shape (max_chain_length, width) chain of a masked observation, zero padded, and its row mask
+    padded = np.zeros((max_chain_length, chain.shape[1]), dtype=chain.dtype)
+    padded[:len(chain)] = chain
+
+    return padded, np.arange(max_chain_length) < len(chain)
+
+
+class ChainObservationBuilder:
+    def __init__(self, broker, max_chain_length=2602, top_k=None, buffers=0, feature_store=None):
+        # With top_k set only the top_k options nearest the money and expiry are kept. With buffers > 0
+        # observations are written in place into that many preallocated arrays, reused round robin, so each one
+        # stays valid for buffers - 1 further builds. Days found in feature_store are sliced from it instead of
+        # being computed, only the position column is filled in live.
+        self.broker = broker
+        self.top_k = top_k
+        self.feature_store = feature_store
+        self.max_chain_length = top_k if top_k is not None else max_chain_length
+
+        self.chain_length = 0
+
+        self._buffers = [np.zeros((self.max_chain_length, OBSERVATION_WIDTH), dtype=np.float32) for _ in range(buffers)]
+        self._buffer_rows = [0] * buffers
+        self._buffer_index = -1
+
+    def _next_buffer(self):
+        if not self._buffers:
+            return np.zeros((self.max_chain_length, OBSERVATION_WIDTH), dtype=np.float32)
+
+        i = self._buffer_index = (self._buffer_index + 1) % len(self._buffers)
+
+        # Only the rows written last time can be non-zero
+        obs = self._buffers[i]
+        obs[:self._buffer_rows[i]] = 0.0
+        self._buffer_rows[i] = 0
+
+        return obs
+
+    def build_chain_features(self, quotedate):
+        # Market features of the whole quotedate chain in chain order (expiration, then symbol): an
+        # (n, OBSERVATION_WIDTH - 1) float32 array without the position column, plus the symbols and expirations
+        columns = self.broker.get_history_for_options_chain(from_date=quotedate,
+                                                            to_date=quotedate - timedelta(days=HISTORY_DAYS),
+                                                            quotedate=quotedate)
+        row_count = len(columns[0])
+        if row_count == 0:
+            return np.zeros((0, OBSERVATION_WIDTH - 1), dtype=np.float32), np.zeros(0, dtype=str), \
+                   np.zeros(0, dtype=np.int64)
+
+        quotedates = np.asarray(columns[0], dtype=np.int64)
+        symbols = np.asarray(columns[1])
+        expirations = np.asarray(columns[2], dtype=np.int64)
+        strikes = np.asarray(columns[3], dtype=np.float64)
+        # bid, ask, impliedvol, delta, theta, gamma, vega, underlying_last
+        features = np.array(columns[4:], dtype=np.float64).T
+
+        # Rows arrive grouped by symbol, so each group is one option's history in date order
+        group_start = np.ones(row_count, dtype=bool)
+        group_start[1:] = symbols[1:] != symbols[:-1]
+        group = np.cumsum(group_start) - 1
+        group_offsets = np.flatnonzero(group_start)
+        group_sizes = np.diff(np.append(group_offsets, row_count))
+
+        current_rows = np.flatnonzero(quotedates == datetime_to_db(quotedate))
+        current_rows = current_rows[np.argsort(expirations[current_rows], kind='stable')]
+
+        chain_index = np.full(len(group_offsets), -1, dtype=np.int64)
+        chain_index[group[current_rows]] = np.arange(len(current_rows))
+        underlying_last = np.zeros(len(group_offsets), dtype=np.float64)
+        underlying_last[group[current_rows]] = features[current_rows, 7]
+
+        # Right-align the last HISTORY_DAYS quotes of each option, leaving zero padding in front
+        slot = np.arange(row_count) - group_offsets[group] + HISTORY_DAYS - group_sizes[group]
+        keep = (slot >= 0) & (chain_index[group] >= 0)
+
+        kept_features = features[keep]
+        kept_features[:, [0, 1, 7]] /= underlying_last[group[keep]][:, None]
+
+        chain_features = np.zeros((len(current_rows), OBSERVATION_WIDTH - 1), dtype=np.float32)
+        chain_features[chain_index[group[keep]][:, None],
+                       slot[keep][:, None] * FEATURES_PER_DAY + np.arange(FEATURES_PER_DAY)] = kept_features
+        chain_features[:, -1] = strikes[current_rows] / features[current_rows, 7]
+
+        return chain_features, symbols[current_rows], expirations[current_rows]
+
+    def build(self, quotedate=None):
+        if quotedate is None:
+            quotedate = self.broker.current_date
+
+        obs = self._next_buffer()
+        self.chain_length = 0
+
+        chain = self.feature_store.get_day(datetime_to_db(quotedate)) if self.feature_store is not None else None
+        if chain is None:
+            chain = self.build_chain_features(quotedate)
+
+        chain_features, symbols, expirations = chain
+
+        rows = np.arange(len(chain_features))
+        if self.top_k is not None:
+            # Distance from the money plus time to expiry in years, so 1% of moneyness weighs like 3.65 days
+            score = np.abs(chain_features[:, -1].astype(np.float64) - 1.0) + \
+                    (expirations - datetime_to_db(quotedate)) / (365.0 * DAY)
+            rows = np.sort(np.argsort(score, kind='stable')[:self.top_k])
+
+        rows = rows[:self.max_chain_length]
+        chain_length = len(rows)
+
+        obs[:chain_length, :-1] = chain_features[rows]
+
+        self.chain_length = chain_length
+        if self._buffers:
+            self._buffer_rows[self._buffer_index] = chain_length
+
+        held_symbols = [position.symbol for position in self.broker.account.get_positions()]
+        if held_symbols:
+            # TODO: -1 if short position
+            obs[:chain_length, -1] = np.isin(symbols[rows], held_symbols)
+
+        return obs
@@ -7,6 +7,9 @@ class OptionType(Enum):
 
 
 class Option:
+    __slots__ = ('symbol', 'underlying_symbol', 'option_type', 'strike', 'expiry_date', 'implied_volatility', 'delta',
+                 'theta', 'gamma', 'vega')
+
     def __init__(self,
                  symbol,
                  underlying_symbol,
@@ -1,39 +1,53 @@
-import sqlite3
+import numpy as np
 
-from datetime import datetime, timezone
+from datetime import datetime
 from .account import Account
 from .trader import Trader
-from .option import Option
 from .quote import Quote
+from .chain_view import ChainView, datetime_to_db, datetime_from_db, quote_from_row
 from .execution import Execution, OrderType
+from .sharded_store import ShardedStore, is_shard_directory, open_store
+from .day_cache import DayCache, DayProducer
+from .delta_index import DeltaIndex
+from .clock import get_bar_length, iter_bars, get_day_start, aggregate_daily, DAY
+from .option import Option, OptionType
+from .pricing import black_scholes, implied_volatility, get_years_to_expiry, MIN_VOLATILITY
 
 
-def datetime_to_db(date):
-    return int(date.replace(tzinfo=timezone.utc).timestamp() * 10 ** 9)
+class BrokerSnapshot:
+    __slots__ = ('current_date', 'clock_index', 'clock_end', 'is_running', 'account')
 
-
-def datetime_from_db(timestamp):
-    return datetime.fromtimestamp(timestamp / 10 ** 9, timezone.utc)
+    def __init__(self, broker):
+        self.current_date = broker.current_date
+        self.clock_index = broker._clock_index
+        self.clock_end = broker._clock_end
+        self.is_running = broker.isRunning
+        self.account = broker.account.snapshot()
 
 
 class OptionsBroker:
-    def __init__(self, liquidity_risk=0.5, commission=0, account=Account()):
+    def __init__(self, liquidity_risk=0.5, commission=0, account=None, commission_per_order=False):
         self._liquidity_risk = liquidity_risk
         self._commission = commission
+        # Commission is charged per leg (each buy/sell) unless commission_per_order charges multi-leg orders once
+        self._commission_per_order = commission_per_order
         self.current_date = None
         self._fidelity = None
         self.isRunning = False
 
-        self._simulation_days = None
-        self._day_index = 0
+        # Bar dates of the whole dataset, built once per load. The simulation clock is a position in it.
+        self._calendar = None
+        self._clock_index = 0
+        self._clock_end = 0
 
-        self._db_connection = None
-        self._db = None
+        self._store = None
+        self._day_cache = None
 
         self.data_start_date = None
         self.data_end_date = None
 
-        self.account = account
+        # A default Account() argument would be one instance shared by every broker
+        self.account = account if account is not None else Account()
         self.trader = Trader()
 
     @property
@@ -62,28 +76,65 @@ class OptionsBroker:
 
         self._commission = value
 
-    def load_historical_data(self, db_path, fidelity=None, in_memory=False):
+    @property
+    def commission_per_order(self):
+        return self._commission_per_order
+
+    @commission_per_order.setter
+    def commission_per_order(self, value):
+        self._commission_per_order = bool(value)
+
+    def load_historical_data(self, db_path, fidelity=None, in_memory=False, backend='sqlite', cache_bytes=None,
+                             prefetch=True, shard_workers=None):
         if not fidelity:
             fidelity = self._fidelity
 
+        get_bar_length(fidelity)
         self._fidelity = fidelity
 
-        self._db_connection = sqlite3.connect(db_path)
-        if in_memory:
-            memory_db_connection = sqlite3.connect(':memory:')
-            self._db_connection.backup(memory_db_connection)
-            self._db_connection.close()
+        # A directory of per underlying / per period files (or saved columnar stores for mmap) is opened as shards
+        if is_shard_directory(db_path, backend):
+            self._store = ShardedStore.open(db_path, backend, in_memory=in_memory, max_workers=shard_workers)
+        else:
+            self._store = open_store(db_path, backend, in_memory=in_memory)
+
+        self._calendar = None
+        self._clock_index = self._clock_end = 0
 
-            self._db_connection = memory_db_connection
+        self._day_cache = None
+        if cache_bytes:
+            self._store = self._day_cache = DayCache(self._store, max_bytes=cache_bytes, prefetch=prefetch)
 
-        self._db = self._db_connection.cursor()
+        start, end = self._store.get_date_range()
+        self.data_start_date = datetime_from_db(start)
+        self.data_end_date = datetime_from_db(end)
 
-        self.data_start_date = datetime_from_db(
-            self._db.execute('SELECT MIN(quotedate) FROM historical_data').fetchall()[0][0]
-        )
-        self.data_end_date = datetime_from_db(
-            self._db.execute('SELECT MAX(quotedate) FROM historical_data').fetchall()[0][0]
-        )
+    def get_underlyings(self):
+        return self._store.get_underlyings()
+
+    def get_cache_stats(self):
+        return self._day_cache.get_stats() if self._day_cache is not None else None
+
+    def iter_trading_days(self, start_date=None, end_date=None):
+        if start_date is None:
+            start_date = self.data_start_date
+
+        if end_date is None:
+            end_date = self.data_end_date
+
+        # Streams the close snapshot of every fidelity bar, without materializing the snapshot times
+        return iter_bars(self._store.iter_trading_days(datetime_to_db(start_date), datetime_to_db(end_date)),
+                         get_bar_length(self._fidelity))
+
+    def get_calendar(self, start_date=None, end_date=None):
+        if self._calendar is None:
+            self._calendar = np.fromiter(self.iter_trading_days(), dtype=np.int64)
+
+        calendar = self._calendar
+        first = 0 if start_date is None else np.searchsorted(calendar, datetime_to_db(start_date), 'left')
+        last = len(calendar) if end_date is None else np.searchsorted(calendar, datetime_to_db(end_date), 'right')
+
+        return calendar[first:last]
 
     def set_trader(self, trader):
         self.trader = trader
@@ -95,14 +146,9 @@ class OptionsBroker:
         if end_date is None:
             end_date = self.data_end_date
 
-        return list(map(lambda row: datetime_from_db(row[0]),
-                        self._db.execute(
-                            'SELECT DISTINCT quotedate FROM historical_data WHERE quotedate >= ? AND quotedate <= ? ORDER BY quotedate ASC',
-                            (datetime_to_db(start_date), datetime_to_db(end_date))
-                        )
-                        .fetchall()))
+        return list(map(datetime_from_db, self.get_calendar(start_date, end_date).tolist()))
 
-    def start(self, start_date=None, end_date=None, step_mode=False):
+    def start(self, start_date=None, end_date=None, step_mode=False, pipeline_days=0):
         if start_date is None:
             start_date = self.data_start_date
 
@@ -110,55 +156,94 @@ class OptionsBroker:
             end_date = self.data_end_date
 
         self.current_date = start_date
-        self._day_index = 0
 
-        self._simulation_days = self.get_trading_days(start_date, end_date)
+        calendar = self.get_calendar()
+        self._clock_index = int(np.searchsorted(calendar, datetime_to_db(start_date), 'left'))
+        self._clock_end = int(np.searchsorted(calendar, datetime_to_db(end_date), 'right'))
 
         self.isRunning = True
 
         if not step_mode:
-            for trading_date in self._simulation_days:
+            if pipeline_days > 0:
+                self._run_pipelined(pipeline_days)
+            else:
+                while self.isRunning and self._clock_index < self._clock_end:
+                    self._advance()
+                    self.trader.step(self.current_date, self, self.account)
+
+            self.isRunning = False
+
+    def _run_pipelined(self, pipeline_days):
+        # A producer thread loads and decodes the next pipeline_days bars into the day cache while the trader steps
+        # through the current one. Without a day cache one is used for this run only.
+        store = self._store
+        if self._day_cache is None:
+            self._store = DayCache(store, prefetch=False)
+
+        reader = self._store.open_reader()
+        producer = DayProducer(self._store, self._calendar[self._clock_index:self._clock_end].tolist(),
+                               depth=pipeline_days, reader=reader)
+        try:
+            for _ in producer:
+                self._advance(prefetch=False)
+                self.trader.step(self.current_date, self, self.account)
+
                 if not self.isRunning:
                     break
+        finally:
+            producer.close()
+            if reader is not None:
+                reader.close()
 
-                self.current_date = trading_date
-                self.trader.step(trading_date, self, self.account)
+            self._store = store
 
-            self.isRunning = False
+    def _advance(self, prefetch=True):
+        self.current_date = datetime_from_db(int(self._calendar[self._clock_index]))
+        self._clock_index += 1
+
+        # The next bar is the one the day cache loads ahead
+        if prefetch and self._day_cache is not None and self._clock_index < self._clock_end:
+            self._day_cache.prefetch(int(self._calendar[self._clock_index]))
 
     def step(self):
-        if self.isRunning:
-            self.current_date = self._simulation_days[self._day_index]
-            self._day_index += 1
+        if self.isRunning and self._clock_index < self._clock_end:
+            self._advance()
 
-            if self._day_index >= len(self._simulation_days):
+            if self._clock_index >= self._clock_end:
                 self.isRunning = False
                 return False
             else:
                 return True
         else:
+            self.isRunning = False
             return False
 
+    def snapshot(self):
+        return BrokerSnapshot(self)
+
+    def restore(self, snapshot):
+        # Constant time apart from the open positions, see Account.restore
+        self.current_date = snapshot.current_date
+        self._clock_index = snapshot.clock_index
+        self._clock_end = snapshot.clock_end
+        self.isRunning = snapshot.is_running
+
+        self.account.restore(snapshot.account)
+
     def stop(self):
         self.isRunning = False
 
     def shutdown(self):
-        self._db_connection.close()
+        self._store.close()
 
     def buy(self, symbol=None, quote=None, size=1):
         if quote is None:
             quote = self.get_option_quote(symbol)
 
-        order_price = self.get_market_order_price_for_quote(quote, is_buy=True)
-        order = Execution(symbol=quote.asset.symbol,
-                          price=order_price,
-                          size=size * 100,
-                          asset=quote.asset,
-                          order_type=OrderType.BUY)
+        order = self._execution_for_quote(quote, OrderType.BUY, size * 100)
 
         self.account.update_from_execution(order)
-        self.account.cash -= self._commission
-        self.account._cash_spent += self._commission
+        self._charge_commission()
 
         return order
 
@@ -166,83 +251,175 @@ class OptionsBroker:
         if quote is None:
             quote = self.get_option_quote(symbol)
 
-        order_price = -self.get_market_order_price_for_quote(quote, is_buy=False)
-        order = Execution(symbol=quote.asset.symbol,
-                          price=order_price,
-                          size=size * 100,
-                          asset=quote.asset,
-                          order_type=OrderType.SELL)
+        order = self._execution_for_quote(quote, OrderType.SELL, size * 100)
 
         self.account.update_from_execution(order)
-        self.account.cash -= self._commission
-        self.account._cash_spent += self._commission
+        self._charge_commission()
 
         return order
 
+    def _execution_for_quote(self, quote, order_type, size):
+        is_buy = order_type == OrderType.BUY
+        order_price = self.get_market_order_price_for_quote(quote, is_buy=is_buy)
+
+        return Execution(symbol=quote.asset.symbol,
+                         price=order_price if is_buy else -order_price,
+                         size=size,
+                         asset=quote.asset,
+                         order_type=order_type,
+                         quotedate=self.current_date)
+
+    def _charge_commission(self, leg_count=1):
+        commission = self._commission * (1 if self._commission_per_order else leg_count)
+        self.account.cash -= commission
+        self.account._cash_spent += commission
+
+    def place_order(self, legs):
+        # Multi-leg order: every leg without a quote is priced from one batched lookup, then all legs are booked
+        # as one transaction, charged commission per leg (or once with commission_per_order). Nothing is booked if
+        # any leg has no quote.
+        symbols = [leg.symbol for leg in legs if leg.quote is None]
+        quotes = self.get_option_quotes(symbols) if symbols else {}
+
+        leg_quotes = [leg.quote if leg.quote is not None else quotes[leg.symbol] for leg in legs]
+        if any(not isinstance(quote.asset, Option) for quote in leg_quotes):
+            raise ValueError()
+
+        return self._book_order([
+            self._execution_for_quote(quote, leg.order_type, leg.size * 100) for leg, quote in zip(legs, leg_quotes)
+        ])
+
+    def _book_order(self, orders):
+        if not orders:
+            return orders
+
+        # Rolling back only needs the positions the order touches, not the whole book
+        snapshot = self.account.snapshot([order.symbol for order in orders])
+        try:
+            for order in orders:
+                self.account.update_from_execution(order)
+        except Exception:
+            self.account.restore(snapshot)
+            raise
+
+        self._charge_commission(len(orders))
+
+        return orders
+
+    def close_all(self, position_filter=None):
+        # Closes every position (or those position_filter accepts) from one batched quote lookup as one order.
+        # Positions without a quote, e.g. expired options, close at a price of zero.
+        positions = [
+            position for position in self.account.get_positions()
+            if position_filter is None or position_filter(position)
+        ]
+
+        return self._close_positions(positions, self.get_option_quotes([position.symbol for position in positions]))
+
+    def _close_positions(self, positions, quotes):
+        orders = []
+        for position in positions:
+            quote = quotes[position.symbol]
+            if not isinstance(quote.asset, Option):
+                quote = Quote(quotedate=self.current_date, asset=position.asset, bid=0, ask=0, underlying_last=0)
+
+            orders.append(self._execution_for_quote(quote,
+                                                    OrderType.SELL if position.book_value >= 0.0 else OrderType.BUY,
+                                                    position.size))
+
+        return self._book_order(orders)
+
+    def settle_expiring(self, quotedate=None, method='intrinsic', position_filter=None):
+        # Settles every option position expiring on the quotedate (UTC) day, or earlier and still open, as one
+        # order: cash settled at intrinsic value against the underlying's last price, or closed at market.
+        if method not in ('intrinsic', 'market'):
+            raise ValueError()
+
+        if quotedate is None:
+            quotedate = self.current_date
+
+        positions = [
+            position for position in self.account.get_expiring_positions(
+                datetime_from_db(get_day_start(datetime_to_db(quotedate)) + DAY))
+            if position_filter is None or position_filter(position)
+        ]
+        if not positions:
+            return []
+
+        if method == 'intrinsic':
+            return self._close_positions(positions, self._intrinsic_quotes(positions, quotedate))
+
+        # Legs without a quote that day (expired on a day without data, or missing from the chain) settle at
+        # intrinsic value rather than at zero
+        quotes = self.get_option_quotes([position.symbol for position in positions], quotedate)
+        unquoted = [position for position in positions if not isinstance(quotes[position.symbol].asset, Option)]
+        if unquoted:
+            quotes.update(self._intrinsic_quotes(unquoted, quotedate))
+
+        return self._close_positions(positions, quotes)
+
+    def _intrinsic_quotes(self, positions, quotedate):
+        # One chain read gives the underlying price of every underlying quoted that day
+        chain = self._store.get_chain_columns(datetime_to_db(quotedate), get_day_start(datetime_to_db(quotedate)),
+                                              np.iinfo(np.int64).max)
+        underlying_lasts = dict(zip(np.asarray(chain[1]).tolist(), np.asarray(chain[12]).tolist()))
+
+        quotes = {}
+        for position in positions:
+            option = position.asset
+            underlying_last = underlying_lasts.get(option.underlying_symbol)
+            if underlying_last is None:
+                raise ValueError()
+
+            intrinsic_value = max(underlying_last - option.strike, 0.0) if option.option_type == OptionType.CALL \
+                else max(option.strike - underlying_last, 0.0)
+            quotes[position.symbol] = Quote(quotedate=quotedate, asset=option, bid=intrinsic_value,
+                                            ask=intrinsic_value, underlying_last=underlying_last)
+
+        return quotes
+
     def close(self, position):
-        if self.account.get_position(position.symbol):
-            if position.book_value >= 0.0:
-                return self.sell(symbol=position.symbol, size=position.size)
-            else:
-                return self.buy(symbol=position.symbol, size=position.size)
+        # position.size is in shares already, closing through buy/sell would multiply it by 100 again
+        position = self.account.get_position(position.symbol)
+        if position:
+            return self._close_positions([position], self.get_option_quotes([position.symbol]))[0]
 
     def get_option_quote(self, symbol, quotedate=None):
         if quotedate is None:
             quotedate = self.current_date
 
-        result = self._db.execute(
-            'SELECT optionroot, underlying, type, strike, expiration, bid, ask, impliedvol, delta, gamma, theta, vega, underlying_last FROM historical_data WHERE optionroot = ? AND quotedate = ?',
-            (symbol, datetime_to_db(quotedate))
-        ).fetchall()
+        result = self._store.get_option_row(symbol, datetime_to_db(quotedate))
 
         if result:
-            result = result[0]
-            return Quote(
-                quotedate=quotedate,
-                asset=Option(
-                    symbol=result[0],
-                    underlying_symbol=result[1],
-                    option_type=result[2],
-                    strike=result[3],
-                    expiry_date=datetime_from_db(result[4]),
-                    implied_volatility=result[7],
-                    delta=result[8],
-                    gamma=result[9],
-                    theta=result[10],
-                    vega=result[11]
-                ), bid=result[5], ask=result[6], underlying_last=result[12])
+            return quote_from_row(quotedate, result)
         else:
             return Quote(quotedate=quotedate, asset=symbol, bid=0, ask=0, underlying_last=0)
 
-    def get_options_chain(self, quotedate=None, expiry_min=None, expiry_max=None):
+    def get_option_quotes(self, symbols, quotedate=None):
         if quotedate is None:
             quotedate = self.current_date
 
-        if expiry_min is None:
-            expiry_min = quotedate
+        rows = self._store.get_option_rows(list(symbols), datetime_to_db(quotedate))
+
+        return {
+            symbol: quote_from_row(quotedate, rows[symbol]) if symbol in rows else
+            Quote(quotedate=quotedate, asset=symbol, bid=0, ask=0, underlying_last=0)
+            for symbol in symbols
+        }
+
+    def get_options_chain(self, quotedate=None, expiry_min=None, expiry_max=None, underlying=None):
+        if quotedate is None:
+            quotedate = self.current_date
 
         if expiry_max is None:
             expiry_max = self.data_end_date
 
-        return list(map(
-            lambda row: Quote(
-                quotedate=quotedate,
-                asset=Option(
-                    symbol=row[0],
-                    underlying_symbol=row[1],
-                    option_type=row[2],
-                    strike=row[3],
-                    expiry_date=datetime_from_db(row[4]),
-                    implied_volatility=row[7],
-                    delta=row[8],
-                    gamma=row[9],
-                    theta=row[10],
-                    vega=row[11]
-                ), bid=row[5], ask=row[6], underlying_last=row[12]),
-            self._db.execute(
-                'SELECT optionroot, underlying, type, strike, expiration, bid, ask, impliedvol, delta, gamma, theta, vega, underlying_last FROM historical_data WHERE expiration >= ? AND expiration <= ? AND quotedate = ? ORDER BY expiration ASC',
-                (datetime_to_db(expiry_min), datetime_to_db(expiry_max), datetime_to_db(quotedate))
-            ).fetchall()))
+        # Options expiring later on the quote day are still listed in intraday snapshots
+        expiry_min = get_day_start(datetime_to_db(quotedate)) if expiry_min is None else datetime_to_db(expiry_min)
+
+        return ChainView.from_columns(quotedate, datetime_to_db(quotedate), self._store.get_chain_columns(
+            datetime_to_db(quotedate), expiry_min, datetime_to_db(expiry_max), underlying
+        ))
 
     def get_history_for_option(self, symbol, from_date=None, to_date=None):
         if from_date is None:
@@ -254,66 +431,149 @@ class OptionsBroker:
         start_date = to_date if to_date < from_date else from_date
         end_date = from_date if to_date < from_date else to_date
 
-        return list(map(
-            lambda row: Quote(
-                quotedate=datetime_from_db(row[0]),
-                asset=Option(
-                    symbol=row[1],
-                    underlying_symbol=row[2],
-                    option_type=row[3],
-                    strike=row[4],
-                    expiry_date=datetime_from_db(row[5]),
-                    implied_volatility=row[8],
-                    delta=row[9],
-                    gamma=row[10],
-                    theta=row[11],
-                    vega=row[12]
-                ), bid=row[6], ask=row[7], underlying_last=row[13]),
-            self._db.execute(
-                'SELECT quotedate, optionroot, underlying, type, strike, expiration, bid, ask, impliedvol, delta, gamma, theta, vega, underlying_last FROM historical_data WHERE optionroot = ? AND quotedate >= ? AND quotedate <= ? ORDER BY quotedate ASC',
-                (symbol, datetime_to_db(start_date), datetime_to_db(end_date))
-            ).fetchall()))
-
-    def find_option(self, delta, expiry, quotedate=None):
+        return ChainView.from_history_columns(
+            self._store.get_history_columns(symbol, datetime_to_db(start_date), datetime_to_db(end_date))
+        )
+
+    def get_history_for_options_chain(self, from_date=None, to_date=None, quotedate=None, expiry_max=None):
         if quotedate is None:
             quotedate = self.current_date
 
-        max_result = self._db.execute(
-            'SELECT optionroot, underlying, type, strike, expiration, bid, ask, impliedvol, delta, gamma, theta, vega, underlying_last, MAX(delta) FROM historical_data WHERE quotedate = ? AND expiration = ? AND delta <= ?',
-            (datetime_to_db(quotedate), datetime_to_db(expiry), str(delta))
-        ).fetchall()[0]
-
-        if max_result[0] is not None:
-            min_result = self._db.execute(
-                'SELECT optionroot, underlying, type, strike, expiration, bid, ask, impliedvol, delta, gamma, theta, vega, underlying_last, MIN(delta) FROM historical_data WHERE quotedate = ? AND expiration = ? AND delta >= ?',
-                (datetime_to_db(quotedate), datetime_to_db(expiry), str(delta))
-            ).fetchall()[0]
-
-            if min_result[0] is not None:
-                max_result_diff = abs(max_result[13] - delta)
-                min_result_diff = abs(min_result[13] - delta)
-
-                result = max_result if max_result_diff < min_result_diff else min_result
-
-                return Quote(
-                    quotedate=quotedate,
-                    asset=Option(
-                        symbol=result[0],
-                        underlying_symbol=result[1],
-                        option_type=result[2],
-                        strike=result[3],
-                        expiry_date=datetime_from_db(result[4]),
-                        implied_volatility=result[7],
-                        delta=result[8],
-                        gamma=result[9],
-                        theta=result[10],
-                        vega=result[11]
-                    ), bid=result[5], ask=result[6], underlying_last=result[12])
-            else:
-                return None
+        if from_date is None:
+            from_date = quotedate
+
+        if to_date is None:
+            to_date = self.data_start_date
+
+        if expiry_max is None:
+            expiry_max = self.data_end_date
+
+        start_date = to_date if to_date < from_date else from_date
+        end_date = from_date if to_date < from_date else to_date
+
+        # Raw columns (no Quote objects) for every option in the quotedate chain, ordered by symbol then date:
+        # quotedate, optionroot, expiration, strike, bid, ask, impliedvol, delta, theta, gamma, vega, underlying_last
+        return self._store.get_chain_history_columns(datetime_to_db(quotedate), datetime_to_db(expiry_max),
+                                                     datetime_to_db(start_date), datetime_to_db(end_date))
+
+    def get_daily_aggregates(self, symbols, quotedate=None):
+        if quotedate is None:
+            quotedate = self.current_date
+
+        # Open/high/low/close of the mid and underlying over the snapshots of the (UTC) day up to quotedate
+        end = datetime_to_db(quotedate)
+
+        return aggregate_daily(self._store.get_symbol_history_columns(list(symbols), get_day_start(end), end))
+
+    def find_option(self, delta, expiry, quotedate=None, underlying=None):
+        if quotedate is None:
+            quotedate = self.current_date
+
+        if underlying is not None:
+            return self.find_options([delta], [expiry], quotedate, underlying)[0]
+
+        result = self._store.find_option_row(delta, datetime_to_db(expiry), datetime_to_db(quotedate))
+
+        if result is not None:
+            return quote_from_row(quotedate, result)
         else:
             return None
 
+    def find_options(self, deltas, expiries, quotedate=None, underlying=None):
+        if quotedate is None:
+            quotedate = self.current_date
+
+        if isinstance(expiries, datetime):
+            expiries = [expiries]
+
+        if underlying is not None:
+            rows = self._find_underlying_option_rows(deltas, list(map(datetime_to_db, expiries)),
+                                                     datetime_to_db(quotedate), underlying)
+        else:
+            rows = self._store.find_option_rows(deltas, list(map(datetime_to_db, expiries)), datetime_to_db(quotedate))
+
+        return [None if row is None else quote_from_row(quotedate, row) for row in rows]
+
+    def _find_underlying_option_rows(self, deltas, expiries, quotedate, underlying):
+        # Same selection as the stores' delta indexes, over the expiration's chain of one underlying (single
+        # expiration chains are in optionroot order)
+        deltas, expiries = np.broadcast_arrays(np.asarray(deltas, dtype=np.float64), np.asarray(expiries, dtype=np.int64))
+        deltas = deltas.ravel()
+        expiries = expiries.ravel()
+
+        results = [None] * len(deltas)
+        for expiry in np.unique(expiries).tolist():
+            targets = np.flatnonzero(expiries == expiry)
+            chain = [np.asarray(column) for column in
+                     self._store.get_chain_columns(quotedate, expiry, expiry, underlying)]
+
+            for target, position in zip(targets.tolist(), DeltaIndex(chain[8]).find(deltas[targets]).tolist()):
+                if position >= 0:
+                    results[target] = tuple(column[position].item() for column in chain)
+
+        return results
+
+    def revalue_positions(self, underlying_shocks=0.0, volatility_shocks=0.0, quotedate=None, rate=0.0,
+                          dividend_yield=0.0, per_symbol=False):
+        # Account market value with every option position repriced by Black-Scholes after moving the underlying by
+        # underlying_shocks (relative, -0.1 is a 10% drop) and implied volatility by volatility_shocks (absolute).
+        # Shocks broadcast against each other, so arrays of scenarios are priced in one pass. Volatility is implied
+        # from each option's current mid (the stored one where that fails) and only the model's price change is
+        # applied to the market order price, so zero shocks give Account.get_market_value.
+        if quotedate is None:
+            quotedate = self.current_date
+
+        underlying_shocks = np.asarray(underlying_shocks, dtype=np.float64)[..., None]
+        volatility_shocks = np.asarray(volatility_shocks, dtype=np.float64)[..., None]
+
+        positions = self.account.get_positions()
+        quotes = self.get_option_quotes([position.symbol for position in positions], quotedate)
+        quotes = [quotes[position.symbol] for position in positions]
+
+        is_short = np.array([position.book_value < 0.0 for position in positions], dtype=bool)
+        sizes = np.array([position.size for position in positions], dtype=np.float64)
+        total_book_values = np.array([position.get_total_book_value() for position in positions], dtype=np.float64)
+        order_prices = np.array([
+            self.get_market_order_price_for_quote(quote, is_buy=short) for quote, short in zip(quotes, is_short)
+        ], dtype=np.float64)
+        mids = np.array([(quote.bid + quote.ask) / 2.0 for quote in quotes], dtype=np.float64)
+        underlying_last = np.array([quote.underlying_last for quote in quotes], dtype=np.float64)
+
+        options = [position.asset if isinstance(position.asset, Option) else None for position in positions]
+        priced = np.array([option is not None for option in options], dtype=bool) & (underlying_last > 0.0)
+        calls = np.array([option is not None and option.option_type == OptionType.CALL for option in options])
+        strikes = np.array([option.strike if option is not None else 1.0 for option in options], dtype=np.float64)
+        years = get_years_to_expiry([datetime_to_db(option.expiry_date) if option is not None else 0
+                                     for option in options], datetime_to_db(quotedate))
+        stored_volatilities = np.array([
+            option.implied_volatility if option is not None and option.implied_volatility else np.nan
+            for option in options
+        ], dtype=np.float64)
+
+        volatilities = implied_volatility(mids, calls, np.where(priced, underlying_last, 1.0), strikes, years, rate,
+                                          dividend_yield)
+        volatilities = np.where(np.isnan(volatilities), stored_volatilities, volatilities)
+        priced &= ~np.isnan(volatilities)
+
+        underlying_last = np.where(priced, underlying_last, 1.0)
+        volatilities = np.nan_to_num(volatilities)
+        shocked_prices = black_scholes(calls, underlying_last * (1.0 + underlying_shocks), strikes, years,
+                                       np.maximum(volatilities + volatility_shocks, MIN_VOLATILITY), rate,
+                                       dividend_yield)
+        model_prices = black_scholes(calls, underlying_last, strikes, years, np.maximum(volatilities, MIN_VOLATILITY),
+                                     rate, dividend_yield)
+        shocked_order_prices = np.where(priced, np.maximum(order_prices + shocked_prices - model_prices, 0.0),
+                                        order_prices)
+
+        # Same marking as Account.get_position_market_value
+        values = np.where(is_short, -shocked_order_prices * sizes - 2.0 * total_book_values,
+                          shocked_order_prices * sizes)
+
+        if per_symbol:
+            return {position.symbol: values[..., i] for i, position in enumerate(positions)}
+
+        return values.sum(axis=-1) + self.account.cash
+
     def get_market_order_price_for_quote(self, quote, is_buy):
         if is_buy:
             return quote.bid * (1.0 - self._liquidity_risk) + quote.ask * self._liquidity_risk
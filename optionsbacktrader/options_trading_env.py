@@ -4,36 +4,143 @@ from gym import spaces
 import numpy as np
 
 from datetime import timedelta
+from .observation import ChainObservationBuilder, OBSERVATION_WIDTH
+from .feature_store import FeatureStore
+from .chain_view import datetime_from_db
+from .execution import OrderType, OrderLeg
 
 
 def clamp(n, smallest, largest): return max(smallest, min(n, largest))
 
 
+class ChainSpace(spaces.Space):
+    # Option chains of 0 to max_chain_length rows of width float32 features, the shape of masked observations
+    def __init__(self, max_chain_length, width=OBSERVATION_WIDTH):
+        super(ChainSpace, self).__init__(None, np.float32)
+
+        self.max_chain_length = max_chain_length
+        self.width = width
+
+    def sample(self, mask=None):
+        length = int(self.np_random.uniform(0, self.max_chain_length + 1))
+
+        return self.np_random.standard_normal((length, self.width)).astype(np.float32)
+
+    def contains(self, x):
+        return isinstance(x, np.ndarray) and x.ndim == 2 and x.shape[0] <= self.max_chain_length and \
+            x.shape[1] == self.width and np.can_cast(x.dtype, np.float32)
+
+    def __repr__(self):
+        return f'ChainSpace({self.max_chain_length}, {self.width})'
+
+    def __eq__(self, other):
+        return isinstance(other, ChainSpace) and other.max_chain_length == self.max_chain_length and \
+            other.width == self.width
+
+
 class OptionsTradingEnvironment(gym.Env):
     metadata = {'render.modes': ['human']}
 
-    def __init__(self, broker, max_chain_length=2602):
+    def __init__(self, broker, max_chain_length=2602, batched_observations=True, start_date=None, end_date=None,
+                 observation_mode='dense', top_k=256, reuse_buffers=False, feature_store=None, random_start=False,
+                 episode_length=None, seed=None):
         super(OptionsTradingEnvironment, self).__init__()
 
+        if observation_mode not in ('dense', 'masked', 'top_k'):
+            raise ValueError()
+
+        if (observation_mode != 'dense' or feature_store is not None) and not batched_observations:
+            raise ValueError()
+
+        # A path is loaded (memory-mapped) here, which keeps the environment cheap to pickle into subprocesses
+        if isinstance(feature_store, str):
+            feature_store = FeatureStore.load(feature_store)
+
         self._max_chain_length = max_chain_length
         self.broker = broker
 
+        self.start_date = start_date
+        self.end_date = end_date
+
+        # With random_start each episode begins on a random trading day between start_date and end_date and runs
+        # for episode_length trading days (to end_date if None). While reset_snapshot is set, reset restores it
+        # instead, which branches every episode from the same checkpoint.
+        self._random_start = random_start
+        self._episode_length = episode_length
+        self._rng = np.random.RandomState(seed)
+        self.reset_snapshot = None
+
+        self._batched_observations = batched_observations
+        self._observation_mode = observation_mode
+        self._reuse_buffers = reuse_buffers
+
+        # Two reused buffers rather than one: the previous observation is still held (e.g. by an off-policy
+        # algorithm adding the transition to its replay buffer) while the next one is built
+        self._observation_builder = ChainObservationBuilder(broker,
+                                                            max_chain_length,
+                                                            top_k=top_k if observation_mode == 'top_k' else None,
+                                                            buffers=2 if reuse_buffers else 0,
+                                                            feature_store=feature_store)
+
         # delta, spread delta, dte, buy, sell, ignore
         self.action_space = spaces.Box(
             low=np.array([-1, 0, 0, 0, 0, 0]), high=np.array([1, 1, 31, 1, 1, 1]), dtype=np.float32)
 
-        self.observation_space = spaces.Box(
-            low=-np.inf, high=np.inf, shape=(max_chain_length, 5 * 8 + 2), dtype=np.float32)
+        if observation_mode == 'masked':
+            # Only the real chain rows, (n, OBSERVATION_WIDTH) with n <= max_chain_length, so a replay buffer
+            # stores n rows instead of the padding. Every row of the observation is a real option: pad_chain gives
+            # back the fixed shape chain and its mask (row i is real for i < n) for batching in a policy network.
+            # Vectorized environments stack equal shapes, they need the dense mode.
+            self.observation_space = ChainSpace(self._observation_builder.max_chain_length)
+        else:
+            self.observation_space = spaces.Box(low=-np.inf, high=np.inf,
+                                                shape=(self._observation_builder.max_chain_length, OBSERVATION_WIDTH),
+                                                dtype=np.float32)
 
     def reset(self):
+        if self.reset_snapshot is not None:
+            return self.reset_to(self.reset_snapshot)
+
+        start_date, end_date = self.start_date, self.end_date
+        if self._random_start:
+            calendar = self.broker.get_calendar(start_date, end_date)
+            episode_length = self._episode_length if self._episode_length is not None else 1
+
+            first = self._rng.randint(0, max(len(calendar) - episode_length, 0) + 1)
+            start_date = datetime_from_db(int(calendar[first]))
+            if self._episode_length is not None:
+                end_date = datetime_from_db(int(calendar[min(first + episode_length, len(calendar)) - 1]))
+
         self.broker.account.reset()
-        self.broker.start(step_mode=True)
+        self.broker.start(start_date=start_date, end_date=end_date, step_mode=True)
 
         return self._next_observation()
 
+    def snapshot(self):
+        # Taken between steps, restoring it gives back the observation of the current day
+        return self.broker.snapshot()
+
+    def reset_to(self, snapshot):
+        self.broker.restore(snapshot)
+
+        return self._observation()
+
     def _next_observation(self):
         self.broker.step()
 
+        return self._observation()
+
+    def _observation(self):
+        if self._batched_observations:
+            obs = self._observation_builder.build()
+
+            if self._observation_mode == 'masked':
+                # A reused buffer is only sliced, otherwise the rows are copied so the padding is not kept alive
+                obs = obs[:self._observation_builder.chain_length]
+                return obs if self._reuse_buffers else obs.copy()
+
+            return obs
+
         options_chain = self.broker.get_options_chain()
 
         return self._vectorize_options_chain(options_chain)
@@ -41,9 +148,7 @@ class OptionsTradingEnvironment(gym.Env):
     def step(self, action):
         self._take_action(action)
 
-        for position in self.broker.account.get_positions():
-            if position.book_value < 0.0 and position.asset.expiry_date == self.broker.current_date:
-                self.broker.close(position)
+        self.broker.settle_expiring(method='market', position_filter=lambda position: position.book_value < 0.0)
 
         obs = self._next_observation()
 
@@ -64,8 +169,8 @@ class OptionsTradingEnvironment(gym.Env):
 
             expiry_date = self.broker.current_date + timedelta(days=dte)
 
-            ntm_leg_option = self.broker.find_option(delta=ntm_leg_delta, expiry=expiry_date)
-            otm_leg_option = self.broker.find_option(delta=otm_leg_delta, expiry=expiry_date)
+            ntm_leg_option, otm_leg_option = self.broker.find_options(deltas=[ntm_leg_delta, otm_leg_delta],
+                                                                      expiries=expiry_date)
 
             if ntm_leg_option is None or otm_leg_option is None:
                 return
@@ -73,12 +178,11 @@ class OptionsTradingEnvironment(gym.Env):
             if ntm_leg_option.asset.symbol == otm_leg_option.asset.symbol:
                 return
 
-            if action_type == 0:
-                self.broker.buy(quote=ntm_leg_option)
-                self.broker.sell(quote=otm_leg_option)
-            else:
-                self.broker.sell(quote=ntm_leg_option)
-                self.broker.buy(quote=otm_leg_option)
+            ntm_order_type, otm_order_type = (OrderType.BUY, OrderType.SELL) if action_type == 0 else \
+                (OrderType.SELL, OrderType.BUY)
+
+            self.broker.place_order([OrderLeg(ntm_order_type, quote=ntm_leg_option),
+                                     OrderLeg(otm_order_type, quote=otm_leg_option)])
 
     def render(self, mode='human', close=False):
         print('-' * 100, end='\n\n')
@@ -88,14 +192,7 @@ class OptionsTradingEnvironment(gym.Env):
 
         print('Positions:', end='\n\n')
         for position in self.broker.account.get_positions():
-            market_value = self.broker.get_market_order_price_for_quote(
-                self.broker.get_option_quote(symbol=position.symbol),
-                is_buy=position.book_value < 0.0
-            ) * (
-                1.0 if position.book_value >= 0.0 else -1.0
-            ) * position.size - (
-                0.0 if position.book_value >= 0.0 else position.get_total_book_value() * 2
-            )
+            market_value = self.broker.account.get_position_market_value(self.broker, position)
 
             print(f'{position.symbol} Strike: {position.asset.strike} Qty: {position.size // 100} Price: {position.book_value} Market Value: {market_value}', end='\n\n')
 
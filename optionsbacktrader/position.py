@@ -1,6 +1,8 @@
 from .execution import OrderType
 
 class Position:
+    __slots__ = ('symbol', 'book_value', 'size', 'asset')
+
     def __init__(self, symbol, book_value, size, asset):
         if symbol is None:
             raise ValueError()
@@ -0,0 +1,174 @@
+import numpy as np
+
+from .clock import DAY
+from .option import OptionType
+
+YEAR = 365 * DAY
+SQRT_2 = np.sqrt(2.0)
+SQRT_2PI = np.sqrt(2.0 * np.pi)
+
+MIN_VOLATILITY = 1e-4
+MAX_VOLATILITY = 10.0
+
+
+def erfc(x):
+    # Chebyshev fit with fractional error below 1.2e-7 everywhere (Numerical Recipes erfcc), so tail
+    # probabilities of far out of the money options keep their relative accuracy
+    x = np.asarray(x, dtype=np.float64)
+    z = np.abs(x)
+    t = 1.0 / (1.0 + 0.5 * z)
+    y = t * np.exp(-z * z - 1.26551223 + t * (1.00002368 + t * (0.37409196 + t * (0.09678418 + t * (
+        -0.18628806 + t * (0.27886807 + t * (-1.13520398 + t * (1.48851587 + t * (-0.82215223 + t * 0.17087277)))))))))
+
+    return np.where(x >= 0.0, y, 2.0 - y)
+
+
+def norm_cdf(x):
+    return 0.5 * erfc(-np.asarray(x, dtype=np.float64) / SQRT_2)
+
+
+def norm_pdf(x):
+    x = np.asarray(x, dtype=np.float64)
+
+    return np.exp(-0.5 * x * x) / SQRT_2PI
+
+
+def get_years_to_expiry(expirations, quotedates):
+    # Calendar years between int64 nanosecond timestamps, zero once expired
+    return np.maximum(np.asarray(expirations, dtype=np.int64) - np.asarray(quotedates, dtype=np.int64), 0) / YEAR
+
+
+def is_call(option_types):
+    # Accepts the stored 'c'/'p' type codes (or 'call'/'put'), OptionType members or booleans
+    option_types = np.asarray(option_types)
+    if option_types.dtype == object:
+        # Any object is truthy, so OptionType members are mapped to their codes and anything else rejected
+        if not all(isinstance(value, (OptionType, str)) for value in option_types.flat):
+            raise ValueError()
+
+        option_types = np.array([value.value if isinstance(value, OptionType) else value
+                                 for value in option_types.flat], dtype=str).reshape(option_types.shape)
+
+    if option_types.dtype.kind in 'US':
+        return np.char.startswith(np.char.lower(option_types.astype(str)), 'c')
+
+    return option_types.astype(bool)
+
+
+def _d1_d2(underlying, strikes, years, volatilities, rate, dividend_yield):
+    deviation = np.maximum(volatilities * np.sqrt(years), 1e-12)
+    d1 = (np.log(underlying / strikes) + (rate - dividend_yield + 0.5 * volatilities * volatilities) * years) / deviation
+
+    return d1, d1 - deviation
+
+
+def black_scholes(option_types, underlying, strikes, years, volatilities, rate=0.0, dividend_yield=0.0):
+    # European prices, all arguments broadcast against each other
+    calls = is_call(option_types)
+    underlying, strikes, years, volatilities = np.broadcast_arrays(*(
+        np.asarray(value, dtype=np.float64) for value in (underlying, strikes, years, volatilities)
+    ))
+
+    d1, d2 = _d1_d2(underlying, strikes, years, volatilities, rate, dividend_yield)
+    forward = underlying * np.exp(-dividend_yield * years)
+    discounted_strikes = strikes * np.exp(-rate * years)
+
+    return np.where(calls,
+                    forward * norm_cdf(d1) - discounted_strikes * norm_cdf(d2),
+                    discounted_strikes * norm_cdf(-d2) - forward * norm_cdf(-d1))
+
+
+def black_scholes_greeks(option_types, underlying, strikes, years, volatilities, rate=0.0, dividend_yield=0.0):
+    # Same units as the stored columns: theta per calendar day, vega per volatility point
+    calls = is_call(option_types)
+    underlying, strikes, years, volatilities = np.broadcast_arrays(*(
+        np.asarray(value, dtype=np.float64) for value in (underlying, strikes, years, volatilities)
+    ))
+
+    d1, d2 = _d1_d2(underlying, strikes, years, volatilities, rate, dividend_yield)
+    dividend_discount = np.exp(-dividend_yield * years)
+    discounted_strikes = strikes * np.exp(-rate * years)
+    sqrt_years = np.sqrt(years)
+    density = norm_pdf(d1)
+
+    call_delta = dividend_discount * norm_cdf(d1)
+    put_delta = call_delta - dividend_discount
+
+    decay = -underlying * dividend_discount * density * volatilities / np.maximum(2.0 * sqrt_years, 1e-12)
+    call_theta = decay - rate * discounted_strikes * norm_cdf(d2) + \
+                 dividend_yield * underlying * dividend_discount * norm_cdf(d1)
+    put_theta = decay + rate * discounted_strikes * norm_cdf(-d2) - \
+                dividend_yield * underlying * dividend_discount * norm_cdf(-d1)
+
+    return {
+        'delta': np.where(calls, call_delta, put_delta),
+        'gamma': dividend_discount * density / np.maximum(underlying * volatilities * sqrt_years, 1e-12),
+        'theta': np.where(calls, call_theta, put_theta) / 365.0,
+        'vega': underlying * dividend_discount * density * sqrt_years / 100.0
+    }
+
+
+def implied_volatility(prices, option_types, underlying, strikes, years, rate=0.0, dividend_yield=0.0, tol=1e-6,
+                       max_iterations=100, volatility_tol=1e-8):
+    # Newton steps on the whole batch at once, each kept inside a bisection bracket so it always converges.
+    # Prices outside the no-arbitrage bounds (or already expired options) have no volatility and give nan.
+    # A volatility is solved once its price is within tol, or the volatility itself is pinned to volatility_tol
+    # (Newton step or bracket), which ends the search where high vega makes tol unreachable in float64.
+    calls = is_call(option_types)
+    prices, underlying, strikes, years, calls = np.broadcast_arrays(*(
+        np.asarray(value, dtype=np.float64) for value in (prices, underlying, strikes, years)
+    ), calls)
+    shape = prices.shape
+    prices, underlying, strikes, years, calls = (value.ravel() for value in (prices, underlying, strikes, years, calls))
+
+    forward = underlying * np.exp(-dividend_yield * years)
+    discounted_strikes = strikes * np.exp(-rate * years)
+    lower_bound = np.maximum(np.where(calls, forward - discounted_strikes, discounted_strikes - forward), 0.0)
+    upper_bound = np.where(calls, forward, discounted_strikes)
+
+    volatilities = np.full(len(prices), np.nan)
+    active = np.flatnonzero((years > 0.0) & (prices > lower_bound) & (prices < upper_bound))
+
+    low = np.full(len(active), MIN_VOLATILITY)
+    high = np.full(len(active), MAX_VOLATILITY)
+    guess = np.full(len(active), 0.3)
+    solved = np.zeros(len(active), dtype=bool)
+
+    for _ in range(max_iterations):
+        todo = np.flatnonzero(~solved)
+        if len(todo) == 0:
+            break
+
+        i = active[todo]
+        sigma = guess[todo]
+        error = black_scholes(calls[i], underlying[i], strikes[i], years[i], sigma, rate, dividend_yield) - prices[i]
+        vega = black_scholes_greeks(calls[i], underlying[i], strikes[i], years[i], sigma, rate,
+                                    dividend_yield)['vega'] * 100.0
+
+        with np.errstate(divide='ignore', over='ignore', invalid='ignore'):
+            step = sigma - error / vega
+
+        solved[todo] = (np.abs(error) < tol) | (np.abs(step - sigma) < volatility_tol)
+        high[todo] = np.where(error > 0.0, sigma, high[todo])
+        low[todo] = np.where(error < 0.0, sigma, low[todo])
+
+        bisect = ~np.isfinite(step) | (step <= low[todo]) | (step >= high[todo])
+        guess[todo] = np.where(solved[todo], sigma, np.where(bisect, 0.5 * (low[todo] + high[todo]), step))
+
+    # Brackets narrowed below tolerance count as solved too
+    solved |= (high - low) < volatility_tol
+    volatilities[active[solved]] = guess[solved]
+
+    return volatilities.reshape(shape)
+
+
+def get_chain_greeks(option_types, underlying, strikes, expirations, quotedates, prices, rate=0.0, dividend_yield=0.0):
+    # Implied volatility and greeks of whole chains keyed by their historical_data column names, nan where the
+    # price has no implied volatility
+    years = get_years_to_expiry(expirations, quotedates)
+    volatilities = implied_volatility(prices, option_types, underlying, strikes, years, rate, dividend_yield)
+
+    greeks = black_scholes_greeks(option_types, underlying, strikes, years, volatilities, rate, dividend_yield)
+    greeks['impliedvol'] = volatilities
+
+    return greeks
@@ -1,4 +1,6 @@
 class Quote:
+    __slots__ = ('quotedate', 'asset', 'bid', 'ask', 'underlying_last')
+
     def __init__(self, quotedate, asset, bid, ask, underlying_last):
         self.quotedate = quotedate
         self.asset = asset
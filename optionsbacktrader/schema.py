@@ -0,0 +1,69 @@
+INDEXES = {
+    'idx_delta': 'CREATE INDEX IF NOT EXISTS idx_delta ON historical_data (delta)',
+    'idx_exp': 'CREATE INDEX IF NOT EXISTS idx_exp ON historical_data (expiration)'
+}
+
+# Covers get_options_chain, find_option and the chain history subquery without touching the table b-tree
+COMPOSITE_INDEXES = {
+    'idx_quotedate_expiration': 'CREATE INDEX IF NOT EXISTS idx_quotedate_expiration ON historical_data ('
+                                'quotedate, expiration, optionroot, underlying, type, strike, bid, ask, impliedvol, '
+                                'delta, gamma, theta, vega, underlying_last)'
+}
+
+TRADING_DAYS_TABLE = 'CREATE TABLE IF NOT EXISTS trading_days (quotedate INTEGER PRIMARY KEY) WITHOUT ROWID'
+UNDERLYINGS_TABLE = 'CREATE TABLE IF NOT EXISTS underlyings (underlying TEXT PRIMARY KEY) WITHOUT ROWID'
+
+QUERY_PLAN_CHECKS = {
+    'get_trading_days': 'SELECT DISTINCT quotedate FROM historical_data WHERE quotedate >= ? AND quotedate <= ? ORDER BY quotedate ASC',
+    'get_trading_days (trading_days table)': 'SELECT quotedate FROM trading_days WHERE quotedate >= ? AND quotedate <= ? ORDER BY quotedate ASC',
+    'get_options_chain': 'SELECT optionroot, underlying, type, strike, expiration, bid, ask, impliedvol, delta, gamma, theta, vega, underlying_last FROM historical_data WHERE expiration >= ? AND expiration <= ? AND quotedate = ? ORDER BY expiration ASC, optionroot ASC',
+    'find_option': 'SELECT optionroot, underlying, type, strike, expiration, bid, ask, impliedvol, delta, gamma, theta, vega, underlying_last FROM historical_data WHERE quotedate = ? AND expiration = ? ORDER BY optionroot ASC',
+    'get_option_quote': 'SELECT optionroot, underlying, type, strike, expiration, bid, ask, impliedvol, delta, gamma, theta, vega, underlying_last FROM historical_data WHERE optionroot = ? AND quotedate = ?'
+}
+
+
+def has_table(db_connection, name):
+    return bool(db_connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchall())
+
+
+def get_indexes(db_connection):
+    return [row[0] for row in db_connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'historical_data' AND sql IS NOT NULL"
+    ).fetchall()]
+
+
+def explain_query_plans(db_connection):
+    plans = {}
+    for name, sql in QUERY_PLAN_CHECKS.items():
+        if 'trading_days' in sql and not has_table(db_connection, 'trading_days'):
+            continue
+
+        plans[name] = [row[3] for row in db_connection.execute(f'EXPLAIN QUERY PLAN {sql}', (0,) * sql.count('?'))]
+
+    return plans
+
+
+def refresh_trading_days(db_connection):
+    db_connection.execute(TRADING_DAYS_TABLE)
+    db_connection.execute('INSERT OR IGNORE INTO trading_days (quotedate) SELECT DISTINCT quotedate FROM historical_data')
+    db_connection.commit()
+
+
+def refresh_underlyings(db_connection):
+    # Lets sharded datasets route by underlying without scanning every shard when they are opened
+    db_connection.execute(UNDERLYINGS_TABLE)
+    db_connection.execute('INSERT OR IGNORE INTO underlyings (underlying) SELECT DISTINCT underlying FROM historical_data')
+    db_connection.commit()
+
+
+def upgrade_schema(db_connection):
+    for index_sql in COMPOSITE_INDEXES.values():
+        db_connection.execute(index_sql)
+
+    refresh_trading_days(db_connection)
+    refresh_underlyings(db_connection)
+
+    db_connection.execute('ANALYZE')
+    db_connection.commit()
@@ -0,0 +1,268 @@
+import heapq
+import os
+
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from .columnar_store import ColumnarStore
+from .compact_store import CompactStore, ENCODING_FILE
+from .sqlite_store import SQLiteStore
+from .delta_index import DeltaIndexCache
+from .clock import get_day_start
+
+SQLITE_EXTENSIONS = ('.sqlite3', '.sqlite', '.db')
+# Backends reading saved store directories, by a file every such directory has
+DIRECTORY_BACKENDS = {'mmap': 'quotedate.npy', 'compact': ENCODING_FILE}
+
+
+def is_shard_directory(path, backend='sqlite'):
+    # A directory holding shards rather than a single store, saved columnar stores are directories themselves
+    return os.path.isdir(path) and not (backend in DIRECTORY_BACKENDS and
+                                        os.path.exists(os.path.join(path, DIRECTORY_BACKENDS[backend])))
+
+
+def detect_backend(path):
+    # The load_historical_data backend of a sqlite file, a saved store directory or a directory of shards of either.
+    # Compact directories are checked first, their raw columns are saved like the columnar ones.
+    if os.path.isdir(path):
+        for backend in ('compact', 'mmap'):
+            if os.path.exists(os.path.join(path, DIRECTORY_BACKENDS[backend])) or find_shard_paths(path, backend):
+                return backend
+
+    return 'sqlite'
+
+
+def find_shard_paths(path, backend='sqlite'):
+    paths = []
+    for name in sorted(os.listdir(path)):
+        shard_path = os.path.join(path, name)
+        if name.startswith('.'):
+            continue
+
+        if backend in DIRECTORY_BACKENDS:
+            if os.path.exists(os.path.join(shard_path, DIRECTORY_BACKENDS[backend])):
+                paths.append(shard_path)
+        elif os.path.isfile(shard_path) and os.path.splitext(name)[1] in SQLITE_EXTENSIONS:
+            paths.append(shard_path)
+
+    return paths
+
+
+def open_store(path, backend='sqlite', in_memory=False):
+    if backend == 'sqlite':
+        return SQLiteStore(path, in_memory=in_memory)
+    elif backend == 'columnar':
+        return ColumnarStore.from_sqlite(path)
+    elif backend == 'mmap':
+        return ColumnarStore.load(path, mmap=True)
+    elif backend == 'compact':
+        # in_memory reads the (small) encoded arrays into memory instead of mapping them
+        return CompactStore.load(path, mmap=not in_memory)
+
+    raise ValueError()
+
+
+class Shard:
+    __slots__ = ('path', 'store', 'start', 'end', 'underlyings')
+
+    def __init__(self, path, store, start=None, end=None, underlyings=None):
+        # start, end and underlyings are read from the store unless given, e.g. when reopening a known shard
+        self.path = path
+        self.store = store
+
+        if start is None or end is None:
+            start, end = store.get_date_range()
+
+        self.start = start
+        self.end = end
+        self.underlyings = frozenset(store.get_underlyings() if underlyings is None else underlyings)
+
+    @classmethod
+    def open(cls, path, backend='sqlite', in_memory=False):
+        return cls(path, open_store(path, backend, in_memory))
+
+
+class ShardedStore:
+    def __init__(self, shards):
+        # Stores holding disjoint rows, e.g. one file per underlying and/or per year. Every query only reaches the
+        # shards whose date range (and underlyings, where the query names one) can hold matching rows, results
+        # are merged in the order a single store would return them.
+        self.shards = sorted((shard for shard in shards if shard.start is not None),
+                             key=lambda shard: (shard.start, shard.path))
+        if not self.shards:
+            raise ValueError()
+
+        self._starts = np.array([shard.start for shard in self.shards], dtype=np.int64)
+        self._ends = np.array([shard.end for shard in self.shards], dtype=np.int64)
+
+        # Shard a symbol was last found in, tried first by point lookups
+        self._symbol_shards = {}
+        self._delta_indexes = DeltaIndexCache()
+
+    @classmethod
+    def open(cls, path, backend='sqlite', in_memory=False, max_workers=None):
+        # Opens (and for in_memory/columnar, loads) the shards of a directory in parallel. SQLite copies and the
+        # mmap/compact array reads release the GIL, so threads overlap them. Building a columnar store decodes
+        # every SQLite row in Python, so columnar shards are built in worker processes and sent back as arrays.
+        paths = find_shard_paths(path, backend)
+        if not paths:
+            raise ValueError()
+
+        max_workers = max_workers or min(len(paths), os.cpu_count() or 1)
+        if backend == 'columnar' and max_workers > 1:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                return cls([Shard(shard_path, store) for shard_path, store in
+                            zip(paths, executor.map(ColumnarStore.from_sqlite, paths))])
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return cls(list(executor.map(lambda shard_path: Shard.open(shard_path, backend, in_memory), paths)))
+
+    def _select(self, start, end, underlying=None):
+        # Shards overlapping [start, end] that list underlying
+        return [shard for shard, shard_start, shard_end in zip(self.shards, self._starts.tolist(), self._ends.tolist())
+                if shard_start <= end and shard_end >= start and
+                (underlying is None or underlying in shard.underlyings)]
+
+    def close(self):
+        for shard in self.shards:
+            shard.store.close()
+
+    def open_reader(self):
+        readers = [shard.store.open_reader() for shard in self.shards]
+        if any(reader is None for reader in readers):
+            return None
+
+        return ShardedStore([Shard(shard.path, reader, shard.start, shard.end, shard.underlyings)
+                             for shard, reader in zip(self.shards, readers)])
+
+    def set_trace_callback(self, callback):
+        for shard in self.shards:
+            if hasattr(shard.store, 'set_trace_callback'):
+                shard.store.set_trace_callback(callback)
+
+    def get_date_range(self):
+        return int(self._starts.min()), int(self._ends.max())
+
+    def get_underlyings(self):
+        return sorted(set().union(*(shard.underlyings for shard in self.shards)))
+
+    def get_trading_days(self, start, end):
+        return list(self.iter_trading_days(start, end))
+
+    def iter_trading_days(self, start, end):
+        shards = self._select(start, end)
+        if len(shards) == 1:
+            yield from shards[0].store.iter_trading_days(start, end)
+            return
+
+        # Union of the shard calendars, per underlying shards mostly repeat the same days
+        last = None
+        for quotedate in heapq.merge(*(shard.store.iter_trading_days(start, end) for shard in shards)):
+            if quotedate != last:
+                last = quotedate
+                yield quotedate
+
+    def get_option_row(self, symbol, quotedate):
+        shards = self._select(quotedate, quotedate)
+        shard = self._symbol_shards.get(symbol)
+        if shard in shards:
+            shards.remove(shard)
+            shards.insert(0, shard)
+
+        for shard in shards:
+            row = shard.store.get_option_row(symbol, quotedate)
+            if row is not None:
+                self._symbol_shards[symbol] = shard
+                return row
+
+        return None
+
+    def get_option_rows(self, symbols, quotedate):
+        rows = {}
+        missing = list(symbols)
+        for shard in self._select(quotedate, quotedate):
+            if not missing:
+                break
+
+            rows.update(shard.store.get_option_rows(missing, quotedate))
+            missing = [symbol for symbol in missing if symbol not in rows]
+
+        return rows
+
+    def get_chain_rows(self, quotedate, expiry_min, expiry_max):
+        return sorted((row for shard in self._select(quotedate, quotedate)
+                       for row in shard.store.get_chain_rows(quotedate, expiry_min, expiry_max)),
+                      key=lambda row: (row[4], row[0]))
+
+    def get_chain_columns(self, quotedate, expiry_min, expiry_max, underlying=None):
+        shard_columns = [shard.store.get_chain_columns(quotedate, expiry_min, expiry_max, underlying)
+                         for shard in self._select(quotedate, quotedate, underlying)]
+        if len(shard_columns) == 1:
+            return shard_columns[0]
+
+        columns = self._merge_columns(shard_columns, 13)
+        if len(columns[0]) == 0:
+            return columns
+
+        # By expiration then symbol
+        order = np.lexsort((columns[0], columns[4]))
+
+        return [column[order] for column in columns]
+
+    def get_history_rows(self, symbol, start, end):
+        return sorted((row for shard in self._select(start, end)
+                       for row in shard.store.get_history_rows(symbol, start, end)), key=lambda row: row[0])
+
+    def get_history_columns(self, symbol, start, end):
+        return list(zip(*self.get_history_rows(symbol, start, end))) or [()] * 14
+
+    def get_day_store(self, quotedate):
+        shards = self._select(quotedate, quotedate)
+        if len(shards) == 1:
+            return shards[0].store.get_day_store(quotedate)
+
+        return ColumnarStore.from_stores([shard.store.get_day_store(quotedate) for shard in shards])
+
+    def get_chain_history_columns(self, quotedate, expiry_max, start, end):
+        # The chain is read from the quotedate shards, its history from every shard in the window (per year shards
+        # split the history of one option)
+        chain_symbols = self.get_chain_columns(quotedate, get_day_start(quotedate), expiry_max)[0]
+
+        return self.get_symbol_history_columns(list(chain_symbols), start, end)
+
+    def get_symbol_history_columns(self, symbols, start, end):
+        columns = self._merge_columns([shard.store.get_symbol_history_columns(symbols, start, end)
+                                       for shard in self._select(start, end)], 12)
+        if len(columns[0]) == 0:
+            return columns
+
+        # By symbol then quotedate
+        order = np.lexsort((columns[0], columns[1]))
+
+        return [column[order] for column in columns]
+
+    @staticmethod
+    def _merge_columns(shard_columns, width):
+        shard_columns = [columns for columns in shard_columns if len(columns[0])]
+        if not shard_columns:
+            return [()] * width
+
+        return [np.concatenate([np.asarray(columns[i]) for columns in shard_columns]) for i in range(width)]
+
+    def _build_delta_index(self, quotedate, expiry):
+        # The merged expiration of all shards in optionroot order, as a single store would index it
+        rows = sorted((row for shard in self._select(quotedate, quotedate)
+                       for row in shard.store.get_chain_rows(quotedate, expiry, expiry)), key=lambda row: row[0])
+
+        return [row[8] for row in rows], rows
+
+    def find_option_rows(self, deltas, expiries, quotedate):
+        shards = self._select(quotedate, quotedate)
+        if len(shards) == 1:
+            return shards[0].store.find_option_rows(deltas, expiries, quotedate)
+
+        return [None if result is None else result[0][result[1]]
+                for result in self._delta_indexes.find(quotedate, deltas, expiries, self._build_delta_index)]
+
+    def find_option_row(self, delta, expiry, quotedate):
+        return self.find_option_rows([delta], [expiry], quotedate)[0]
@@ -0,0 +1,164 @@
+import sqlite3
+
+from .delta_index import DeltaIndexCache
+from .columnar_store import ColumnarStore, STORE_COLUMNS
+from .schema import has_table
+from .clock import get_day_start
+
+QUOTE_COLUMNS = 'optionroot, underlying, type, strike, expiration, bid, ask, impliedvol, delta, gamma, theta, vega, underlying_last'
+CHAIN_HISTORY_COLUMNS = 'quotedate, optionroot, expiration, strike, bid, ask, impliedvol, delta, theta, gamma, vega, underlying_last'
+
+
+class SQLiteStore:
+    def __init__(self, db_path, in_memory=False):
+        self._db_path = db_path
+        self._in_memory = in_memory
+
+        # Not bound to the opening thread so a DayCache can prefetch from a worker (it serializes access)
+        self._db_connection = sqlite3.connect(db_path, check_same_thread=False)
+        if in_memory:
+            memory_db_connection = sqlite3.connect(':memory:', check_same_thread=False)
+            self._db_connection.backup(memory_db_connection)
+            self._db_connection.close()
+
+            self._db_connection = memory_db_connection
+
+        self._db = self._db_connection.cursor()
+        self._delta_indexes = DeltaIndexCache()
+        self._trace_callback = None
+
+        # Files upgraded with upgrade_db.py keep the distinct quotedates in their own table
+        self._days_table = 'trading_days' if has_table(self._db_connection, 'trading_days') else 'historical_data'
+        self._underlyings_table = 'underlyings' if has_table(self._db_connection, 'underlyings') else 'historical_data'
+
+    def close(self):
+        self._db_connection.close()
+
+    def open_reader(self):
+        # A second connection to the same file for a background reader, in-memory copies can only be shared
+        if self._in_memory:
+            return None
+
+        reader = SQLiteStore(self._db_path)
+        reader.set_trace_callback(self._trace_callback)
+
+        return reader
+
+    def set_trace_callback(self, callback):
+        # Called with every statement this store executes, readers opened afterwards inherit it
+        self._trace_callback = callback
+        self._db_connection.set_trace_callback(callback)
+
+    def get_date_range(self):
+        return self._db.execute(f'SELECT MIN(quotedate), MAX(quotedate) FROM {self._days_table}').fetchall()[0]
+
+    def get_underlyings(self):
+        return [row[0] for row in self._db.execute(
+            f'SELECT DISTINCT underlying FROM {self._underlyings_table} ORDER BY underlying ASC'
+        ).fetchall()]
+
+    def get_trading_days(self, start, end):
+        return [row[0] for row in self._db.execute(
+            f'SELECT DISTINCT quotedate FROM {self._days_table} WHERE quotedate >= ? AND quotedate <= ? ORDER BY quotedate ASC',
+            (start, end)
+        ).fetchall()]
+
+    def iter_trading_days(self, start, end):
+        # Own cursor so other queries can run while the days stream
+        cursor = self._db_connection.cursor()
+        cursor.execute(
+            f'SELECT DISTINCT quotedate FROM {self._days_table} WHERE quotedate >= ? AND quotedate <= ? ORDER BY quotedate ASC',
+            (start, end)
+        )
+
+        for rows in iter(lambda: cursor.fetchmany(4096), []):
+            yield from (row[0] for row in rows)
+
+    def get_option_row(self, symbol, quotedate):
+        result = self._db.execute(
+            f'SELECT {QUOTE_COLUMNS} FROM historical_data WHERE optionroot = ? AND quotedate = ?',
+            (symbol, quotedate)
+        ).fetchall()
+
+        return result[0] if result else None
+
+    def get_option_rows(self, symbols, quotedate):
+        rows = {}
+        # Stay under SQLite's bound parameter limit
+        for i in range(0, len(symbols), 900):
+            symbols_chunk = symbols[i:i + 900]
+            for row in self._db.execute(
+                    f'SELECT {QUOTE_COLUMNS} FROM historical_data WHERE quotedate = ? AND optionroot IN ({",".join("?" * len(symbols_chunk))})',
+                    (quotedate, *symbols_chunk)
+            ).fetchall():
+                rows[row[0]] = row
+
+        return rows
+
+    def get_chain_rows(self, quotedate, expiry_min, expiry_max):
+        return self._db.execute(
+            f'SELECT {QUOTE_COLUMNS} FROM historical_data WHERE expiration >= ? AND expiration <= ? AND quotedate = ? ORDER BY expiration ASC, optionroot ASC',
+            (expiry_min, expiry_max, quotedate)
+        ).fetchall()
+
+    def get_chain_columns(self, quotedate, expiry_min, expiry_max, underlying=None):
+        if underlying is None:
+            rows = self.get_chain_rows(quotedate, expiry_min, expiry_max)
+        else:
+            rows = self._db.execute(
+                f'SELECT {QUOTE_COLUMNS} FROM historical_data WHERE expiration >= ? AND expiration <= ? AND quotedate = ? AND underlying = ? ORDER BY expiration ASC, optionroot ASC',
+                (expiry_min, expiry_max, quotedate, underlying)
+            ).fetchall()
+
+        return list(zip(*rows)) or [()] * 13
+
+    def get_history_rows(self, symbol, start, end):
+        return self._db.execute(
+            f'SELECT quotedate, {QUOTE_COLUMNS} FROM historical_data WHERE optionroot = ? AND quotedate >= ? AND quotedate <= ? ORDER BY quotedate ASC',
+            (symbol, start, end)
+        ).fetchall()
+
+    def get_history_columns(self, symbol, start, end):
+        return list(zip(*self.get_history_rows(symbol, start, end))) or [()] * 14
+
+    def get_day_store(self, quotedate):
+        # An expiration bound lets files without the quotedate index range scan idx_exp instead of the table
+        return ColumnarStore.from_row_chunks([self._db.execute(
+            f'SELECT {", ".join(STORE_COLUMNS)} FROM historical_data WHERE quotedate = ? AND expiration >= ?',
+            (quotedate, get_day_start(quotedate))
+        ).fetchall()])
+
+    def get_chain_history_columns(self, quotedate, expiry_max, start, end):
+        rows = self._db.execute(
+            f'SELECT {CHAIN_HISTORY_COLUMNS} FROM historical_data WHERE optionroot IN (SELECT optionroot FROM historical_data WHERE quotedate = ? AND expiration >= ? AND expiration <= ?) AND quotedate >= ? AND quotedate <= ? ORDER BY optionroot ASC, quotedate ASC',
+            (quotedate, get_day_start(quotedate), expiry_max, start, end)
+        ).fetchall()
+
+        return list(zip(*rows)) or [()] * 12
+
+    def get_symbol_history_columns(self, symbols, start, end):
+        rows = []
+        symbols = sorted(symbols)
+        for i in range(0, len(symbols), 900):
+            symbols_chunk = symbols[i:i + 900]
+            rows += self._db.execute(
+                f'SELECT {CHAIN_HISTORY_COLUMNS} FROM historical_data WHERE optionroot IN ({",".join("?" * len(symbols_chunk))}) AND quotedate >= ? AND quotedate <= ? ORDER BY optionroot ASC, quotedate ASC',
+                (*symbols_chunk, start, end)
+            ).fetchall()
+
+        return list(zip(*rows)) or [()] * 12
+
+    def _build_delta_index(self, quotedate, expiry):
+        rows = self._db.execute(
+            f'SELECT {QUOTE_COLUMNS} FROM historical_data WHERE quotedate = ? AND expiration = ? ORDER BY optionroot ASC',
+            (quotedate, expiry)
+        ).fetchall()
+
+        return [row[8] for row in rows], rows
+
+    def find_option_rows(self, deltas, expiries, quotedate):
+        return [None if result is None else result[0][result[1]]
+                for result in self._delta_indexes.find(quotedate, deltas, expiries, self._build_delta_index)]
+
+    def find_option_row(self, delta, expiry, quotedate):
+        return self.find_option_rows([delta], [expiry], quotedate)[0]
@@ -0,0 +1,87 @@
+import csv
+import itertools
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from .account import Account
+from .options_broker import OptionsBroker
+from .date_windows import split_date_windows
+
+BROKER_PARAMETERS = ('liquidity_risk', 'commission', 'commission_per_order')
+ACCOUNT_PARAMETERS = ('cash',)
+
+
+def make_parameter_grid(**parameter_values):
+    names = list(parameter_values)
+
+    return [dict(zip(names, values)) for values in itertools.product(*parameter_values.values())]
+
+
+def run_backtest(data_path, trader_factory, parameters, start_date=None, end_date=None, load_kwargs=None):
+    # Every backtest owns its broker, account and trader. Parameters other than the broker and account ones are
+    # passed to trader_factory.
+    broker_kwargs = {name: value for name, value in parameters.items() if name in BROKER_PARAMETERS}
+    trader_kwargs = {
+        name: value for name, value in parameters.items() if name not in BROKER_PARAMETERS + ACCOUNT_PARAMETERS
+    }
+
+    broker = OptionsBroker(account=Account(parameters.get('cash', 100000)), **broker_kwargs)
+    broker.load_historical_data(data_path, **(load_kwargs or {}))
+    broker.set_trader(trader_factory(**trader_kwargs))
+
+    start_time = time.perf_counter()
+    broker.start(start_date=start_date, end_date=end_date)
+    elapsed = time.perf_counter() - start_time
+
+    account = broker.account
+    result = dict(parameters)
+    result.update({
+        'start_date': start_date if start_date is not None else broker.data_start_date,
+        'end_date': end_date if end_date is not None else broker.data_end_date,
+        'cash': account.cash,
+        'market_value': account.get_market_value(broker),
+        'cash_pl': account.get_percent_cash_pl(),
+        'market_value_pl': account.get_percent_market_value_pl(broker),
+        'spent_pl': account.get_percent_spent_pl(broker),
+        'realized_pl': account.ledger.get_realized_pl(),
+        'executions': len(account.ledger),
+        'open_positions': len(account.get_positions()),
+        'elapsed_s': elapsed
+    })
+
+    broker.shutdown()
+
+    return result
+
+
+def run_sweep(data_path, trader_factory, grid, windows=None, processes=None, load_kwargs=None, mp_context=None):
+    # trader_factory must be picklable (a module level class or function) so worker processes can rebuild it
+    if isinstance(grid, dict):
+        grid = make_parameter_grid(**grid)
+
+    if windows is None:
+        windows = [(None, None)]
+    elif isinstance(windows, int):
+        windows = split_date_windows(data_path, windows, backend=(load_kwargs or {}).get('backend', 'sqlite'))
+
+    jobs = [(parameters, start_date, end_date) for parameters in grid for start_date, end_date in windows]
+
+    with ProcessPoolExecutor(max_workers=processes, mp_context=mp_context) as executor:
+        futures = [
+            executor.submit(run_backtest, data_path, trader_factory, parameters, start_date, end_date, load_kwargs)
+            for parameters, start_date, end_date in jobs
+        ]
+
+        return [future.result() for future in futures]
+
+
+def write_sweep_results(results, path):
+    fieldnames = []
+    for result in results:
+        fieldnames += [name for name in result if name not in fieldnames]
+
+    with open(path, 'w', newline='') as fp:
+        writer = csv.DictWriter(fp, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(results)
@@ -0,0 +1,38 @@
+from stable_baselines3.common.vec_env import SubprocVecEnv
+
+from .account import Account
+from .options_broker import OptionsBroker
+from .options_trading_env import OptionsTradingEnvironment
+from .date_windows import split_date_windows
+
+
+class EnvironmentFactory:
+    def __init__(self, data_path, backend='mmap', start_date=None, end_date=None, cash=0, broker_kwargs=None,
+                 env_kwargs=None):
+        self.data_path = data_path
+        self.backend = backend
+        self.start_date = start_date
+        self.end_date = end_date
+        self.cash = cash
+        self.broker_kwargs = broker_kwargs or {}
+        self.env_kwargs = env_kwargs or {}
+
+    def __call__(self):
+        # Runs inside the worker process, so each environment owns its broker and account while the market data
+        # itself is shared through the page cache of the memory-mapped (or SQLite) files
+        broker = OptionsBroker(account=Account(self.cash), **self.broker_kwargs)
+        broker.load_historical_data(self.data_path, fidelity='day', backend=self.backend)
+
+        return OptionsTradingEnvironment(broker, start_date=self.start_date, end_date=self.end_date,
+                                         **self.env_kwargs)
+
+
+def make_vec_env(data_path, windows, backend='mmap', cash=0, broker_kwargs=None, env_kwargs=None, start_method=None):
+    if isinstance(windows, int):
+        windows = split_date_windows(data_path, windows, backend=backend)
+
+    return SubprocVecEnv([
+        EnvironmentFactory(data_path, backend=backend, start_date=start_date, end_date=end_date, cash=cash,
+                           broker_kwargs=broker_kwargs, env_kwargs=env_kwargs)
+        for start_date, end_date in windows
+    ], start_method=start_method)
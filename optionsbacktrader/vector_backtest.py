@@ -0,0 +1,320 @@
+import numpy as np
+
+from .account import Account
+from .chain_view import datetime_from_db, datetime_to_db
+from .clock import DAY, get_day_start
+from .execution import Execution, OrderType
+from .option import Option, OptionType
+from .quote import Quote
+
+
+def _search_ranges(values, starts, ends, targets, side='left'):
+    # np.searchsorted of each target within its own sorted slice values[start:end], as one vectorized binary
+    # search over all of them
+    low = np.array(starts, dtype=np.int64)
+    high = np.array(ends, dtype=np.int64)
+    last = max(len(values) - 1, 0)
+
+    while True:
+        searching = low < high
+        if not searching.any():
+            return low
+
+        middle = (low + high) // 2
+        middle_values = values[np.minimum(middle, last)]
+        right = searching & (middle_values < targets if side == 'left' else middle_values <= targets)
+        low = np.where(right, middle + 1, low)
+        high = np.where(searching & ~right, middle, high)
+
+
+class LegRule:
+    __slots__ = ('order_type', 'delta', 'dte', 'size')
+
+    def __init__(self, order_type, delta, dte, size=1):
+        # Each day the leg trades the option nearest delta in the listed expiration nearest dte calendar days out,
+        # picked like OptionsBroker.find_option. size is in contracts.
+        self.order_type = order_type
+        self.delta = delta
+        self.dte = dte
+        self.size = size
+
+
+class VectorBacktest:
+    def __init__(self, broker, start_date=None, end_date=None, max_dte=None):
+        # Reads the chain of every trading day in the window once into flat arrays. Each run then resolves its
+        # contracts for all days with array searches and only replays the resulting fills through an Account, so
+        # screening many rule variants never goes back to the store. max_dte drops expirations further out.
+        # Legs are picked from the expirations get_options_chain lists by default, those up to the end of the
+        # data (or max_dte), later ones are kept for quotes, marks and settlement prices only.
+        self.broker = broker
+        self.days = np.asarray(broker.get_calendar(start_date, end_date), dtype=np.int64)
+
+        chains = []
+        for day in self.days.tolist():
+            expiry_max = np.iinfo(np.int64).max if max_dte is None else day + int(max_dte * DAY)
+            chains.append(broker._store.get_chain_columns(day, get_day_start(day), expiry_max))
+
+        day_index = np.repeat(np.arange(len(self.days)), [len(chain[0]) for chain in chains])
+        columns = [np.concatenate([np.asarray(chain[i]) for chain in chains]) if chains else np.zeros(0)
+                   for i in range(13)]
+
+        self.symbols, symbol_ids = np.unique(columns[0].astype(str), return_inverse=True)
+        self._underlying_symbols = columns[1].astype(str)
+        self._option_types = columns[2].astype(str)
+        self._strikes = columns[3].astype(np.float64)
+        self._expirations = columns[4].astype(np.int64)
+        self._bids = columns[5].astype(np.float64)
+        self._asks = columns[6].astype(np.float64)
+        self._implied_volatilities = columns[7].astype(np.float64)
+        self._deltas = columns[8].astype(np.float64)
+        self._gammas = columns[9].astype(np.float64)
+        self._thetas = columns[10].astype(np.float64)
+        self._vegas = columns[11].astype(np.float64)
+        self._underlying_lasts = columns[12].astype(np.float64)
+        self._symbol_ids = symbol_ids
+        self._day_offsets = np.searchsorted(day_index, np.arange(len(self.days) + 1))
+
+        # (day, symbol) -> row, for fills and marks
+        self._row_keys = day_index.astype(np.int64) * len(self.symbols) + symbol_ids
+        self._row_order = np.argsort(self._row_keys, kind='stable')
+        self._row_keys = self._row_keys[self._row_order]
+
+        # Listed expirations (groups) of each day, by day then expiration, with their nanoseconds after the day
+        listed = np.flatnonzero(self._expirations <= (datetime_to_db(broker.data_end_date) if max_dte is None
+                                                      else np.iinfo(np.int64).max))
+        group_order = listed[np.lexsort((self._expirations[listed], day_index[listed]))]
+        new_group = np.ones(len(group_order), dtype=bool)
+        new_group[1:] = (np.diff(day_index[group_order]) != 0) | (np.diff(self._expirations[group_order]) != 0)
+        groups = np.full(len(day_index), -1, dtype=np.int64)
+        groups[group_order] = np.cumsum(new_group) - 1
+
+        group_rows = group_order[new_group]
+        self._group_offsets = np.maximum(self._expirations[group_rows] - self.days[day_index[group_rows]], 0)
+        self._day_groups = np.searchsorted(day_index[group_rows], np.arange(len(self.days) + 1))
+
+        # Rows of each group ordered by delta then symbol like the broker's delta indexes
+        self._delta_order = listed[np.lexsort((columns[0][listed].astype(str), self._deltas[listed], groups[listed]))]
+        self._delta_values = self._deltas[self._delta_order]
+        self._group_rows = np.searchsorted(groups[self._delta_order], np.arange(len(group_rows) + 1))
+
+        self._options = {}
+
+    def _find_rows(self, day_indexes, delta, dte):
+        # Nearest listed expiration to day + dte (the earlier one on ties), then the nearest delta in it when the
+        # target lies between its smallest and largest delta. -1 where nothing qualifies.
+        if len(self._group_offsets) == 0:
+            return np.full(len(day_indexes), -1, dtype=np.int64)
+
+        starts, ends = self._day_groups[day_indexes], self._day_groups[day_indexes + 1]
+        target = int(round(dte * DAY))
+        above = _search_ranges(self._group_offsets, starts, ends, target)
+        below = above - 1
+        last_group = len(self._group_offsets) - 1
+
+        no_distance = np.iinfo(np.int64).max
+        above_distance = np.where(above < ends, self._group_offsets[np.minimum(above, last_group)] - target,
+                                  no_distance)
+        below_distance = np.where(below >= starts, target - self._group_offsets[np.maximum(below, 0)], no_distance)
+        has_group = (above < ends) | (below >= starts)
+        groups = np.where(has_group, np.where(below_distance <= above_distance, below, above), 0)
+
+        starts, ends = self._group_rows[groups], self._group_rows[groups + 1]
+        last_row = max(len(self._delta_values) - 1, 0)
+        below = _search_ranges(self._delta_values, starts, ends, delta, 'right') - 1
+        above = _search_ranges(self._delta_values, starts, ends, delta, 'left')
+        found = has_group & (below >= starts) & (above < ends)
+        below = np.clip(below, 0, last_row)
+        above = np.clip(above, 0, last_row)
+
+        # Among equal deltas the first (by symbol) wins, and above wins exact distance ties, as in DeltaIndex
+        below = _search_ranges(self._delta_values, starts, ends, self._delta_values[below], 'left')
+        below = np.minimum(below, last_row)
+        nearest = np.where(np.abs(self._delta_values[below] - delta) < np.abs(self._delta_values[above] - delta),
+                           below, above)
+
+        return np.where(found, self._delta_order[nearest], -1)
+
+    def _lookup_rows(self, day_index, symbol_ids):
+        keys = day_index * len(self.symbols) + np.asarray(symbol_ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self._row_keys, keys), max(len(self._row_keys) - 1, 0))
+        found = (len(self._row_keys) > 0) & (self._row_keys[positions] == keys)
+
+        return np.where(found, self._row_order[positions], -1)
+
+    def _option(self, row):
+        option = self._options.get(row)
+        if option is None:
+            option = self._options[row] = Option(symbol=str(self.symbols[self._symbol_ids[row]]),
+                                                 underlying_symbol=self._underlying_symbols[row],
+                                                 option_type=self._option_types[row],
+                                                 strike=float(self._strikes[row]),
+                                                 expiry_date=datetime_from_db(int(self._expirations[row])),
+                                                 implied_volatility=float(self._implied_volatilities[row]),
+                                                 delta=float(self._deltas[row]),
+                                                 theta=float(self._thetas[row]),
+                                                 gamma=float(self._gammas[row]),
+                                                 vega=float(self._vegas[row]))
+
+        return option
+
+    def run(self, legs, signal=None, hold_days=None, settlement='intrinsic', cash=100000):
+        # Event order each day, as an equivalent Trader would place it through the broker:
+        #   1. settle_expiring(method=settlement)
+        #   2. close_all of the positions opened hold_days trading days ago (whole positions, as close() does)
+        #   3. place_order of all legs if signal is set for the day and every leg resolves
+        # then the account is marked like Account.get_market_value. signal is a boolean per day (None trades
+        # every day).
+        if settlement not in ('intrinsic', 'market') or not legs:
+            raise ValueError()
+
+        day_count = len(self.days)
+        signal = np.ones(day_count, dtype=bool) if signal is None else np.asarray(signal, dtype=bool)
+        if len(signal) != day_count:
+            raise ValueError()
+
+        day_indexes = np.arange(day_count)
+        leg_rows = np.array([self._find_rows(day_indexes, leg.delta, leg.dte) for leg in legs]).reshape(len(legs), -1)
+        entries = signal & np.all(leg_rows >= 0, axis=0)
+
+        broker = self.broker
+        account = Account(cash)
+        market_values = np.zeros(day_count)
+        cash_values = np.zeros(day_count)
+        exits = {}
+
+        for i in range(day_count):
+            quotedate = datetime_from_db(int(self.days[i]))
+            orders = []
+
+            # 1. settlement of everything expiring on the day or earlier
+            expiring = account.get_expiring_positions(datetime_from_db(get_day_start(int(self.days[i])) + DAY))
+            if expiring:
+                quotes = self._settlement_quotes(i, quotedate, expiring, settlement)
+                self._book(account, [self._closing_execution(position, quotes[position.symbol], quotedate)
+                                     for position in expiring])
+
+            # 2. holding period exits
+            due = exits.pop(i, None)
+            if due:
+                positions = [position for position in account.get_positions() if position.symbol in due]
+                if positions:
+                    quotes = self._market_quotes(i, quotedate, positions)
+                    self._book(account, [self._closing_execution(position, quotes[position.symbol], quotedate)
+                                         for position in positions])
+
+            # 3. entries
+            if entries[i]:
+                for leg, row in zip(legs, leg_rows[:, i].tolist()):
+                    option = self._option(row)
+                    quote = Quote(quotedate=quotedate, asset=option, bid=float(self._bids[row]),
+                                  ask=float(self._asks[row]), underlying_last=float(self._underlying_lasts[row]))
+                    orders.append(self._execution(quote, leg.order_type, leg.size * 100, quotedate))
+
+                self._book(account, orders)
+
+                if hold_days is not None and i + hold_days < day_count:
+                    exits.setdefault(i + hold_days, set()).update(order.symbol for order in orders)
+
+            market_values[i] = self._mark(account, i)
+            cash_values[i] = account.cash
+
+        return {
+            'days': self.days,
+            'entries': entries,
+            'market_value': market_values,
+            'cash': cash_values,
+            'executions': len(account.ledger),
+            'realized_pl': account.ledger.get_realized_pl(),
+            'account': account
+        }
+
+    def _execution(self, quote, order_type, size, quotedate):
+        is_buy = order_type == OrderType.BUY
+        order_price = self.broker.get_market_order_price_for_quote(quote, is_buy=is_buy)
+
+        return Execution(symbol=quote.asset.symbol,
+                         price=order_price if is_buy else -order_price,
+                         size=size,
+                         asset=quote.asset,
+                         order_type=order_type,
+                         quotedate=quotedate)
+
+    def _closing_execution(self, position, quote, quotedate):
+        return self._execution(quote, OrderType.SELL if position.book_value >= 0.0 else OrderType.BUY, position.size,
+                               quotedate)
+
+    def _book(self, account, orders):
+        # One order, charged commission like OptionsBroker.place_order / close_all
+        for order in orders:
+            account.update_from_execution(order)
+
+        commission = self.broker.commission * (1 if self.broker.commission_per_order else len(orders))
+        account.cash -= commission
+        account._cash_spent += commission
+
+    def _position_rows(self, day_index, positions):
+        return self._lookup_rows(day_index, np.searchsorted(self.symbols, [position.symbol for position in positions]))
+
+    def _market_quotes(self, day_index, quotedate, positions, rows=None):
+        if rows is None:
+            rows = self._position_rows(day_index, positions)
+
+        return {
+            position.symbol: Quote(quotedate=quotedate, asset=position.asset, bid=float(self._bids[row]),
+                                   ask=float(self._asks[row]), underlying_last=float(self._underlying_lasts[row]))
+            if row >= 0 else Quote(quotedate=quotedate, asset=position.asset, bid=0, ask=0, underlying_last=0)
+            for position, row in zip(positions, rows.tolist())
+        }
+
+    def _settlement_quotes(self, day_index, quotedate, positions, settlement):
+        if settlement == 'intrinsic':
+            return self._intrinsic_quotes(day_index, quotedate, positions)
+
+        # Unquoted legs settle at intrinsic value, as in settle_expiring
+        rows = self._position_rows(day_index, positions)
+        quotes = self._market_quotes(day_index, quotedate, positions, rows)
+        unquoted = [position for position, row in zip(positions, rows.tolist()) if row < 0]
+        if unquoted:
+            quotes.update(self._intrinsic_quotes(day_index, quotedate, unquoted))
+
+        return quotes
+
+    def _intrinsic_quotes(self, day_index, quotedate, positions):
+        # The last row of the day's chain for each underlying, as settle_expiring reads it
+        first, last = self._day_offsets[day_index], self._day_offsets[day_index + 1]
+        underlying_lasts = dict(zip(self._underlying_symbols[first:last].tolist(),
+                                    self._underlying_lasts[first:last].tolist()))
+
+        quotes = {}
+        for position in positions:
+            option = position.asset
+            underlying_last = underlying_lasts.get(option.underlying_symbol)
+            if underlying_last is None:
+                raise ValueError()
+
+            intrinsic_value = max(underlying_last - option.strike, 0.0) if option.option_type == OptionType.CALL \
+                else max(option.strike - underlying_last, 0.0)
+            quotes[position.symbol] = Quote(quotedate=quotedate, asset=option, bid=intrinsic_value,
+                                            ask=intrinsic_value, underlying_last=underlying_last)
+
+        return quotes
+
+    def _mark(self, account, day_index):
+        positions = account.get_positions()
+        if not positions:
+            return account.cash
+
+        rows = self._position_rows(day_index, positions)
+        is_short = np.array([position.book_value < 0.0 for position in positions])
+        sizes = np.array([position.size for position in positions], dtype=np.float64)
+        total_book_values = np.array([position.get_total_book_value() for position in positions], dtype=np.float64)
+
+        liquidity_risk = self.broker.liquidity_risk
+        bids = np.where(rows >= 0, self._bids[rows], 0.0)
+        asks = np.where(rows >= 0, self._asks[rows], 0.0)
+        # Longs are marked at the sell price and shorts at the buy price, see Account._update_marks
+        prices = np.where(is_short, bids * (1.0 - liquidity_risk) + asks * liquidity_risk,
+                          bids * liquidity_risk + asks * (1.0 - liquidity_risk))
+
+        return float(np.sum(np.where(is_short, -prices * sizes - 2.0 * total_book_values, prices * sizes))) + \
+            account.cash
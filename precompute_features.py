@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+import sys
+import os
+
+from optionsbacktrader import OptionsBroker, Account
+from optionsbacktrader.feature_store import FeatureStore
+from optionsbacktrader.sharded_store import detect_backend
+
+BACKENDS = ('sqlite', 'columnar', 'mmap', 'compact')
+
+backends = [argument.split('=', 1)[1] for argument in sys.argv[1:] if argument.startswith('--backend=')]
+arguments = [argument for argument in sys.argv[1:] if not argument.startswith('--backend=')]
+if not arguments or any(backend not in BACKENDS for backend in backends):
+    print('Usage precompute_features.py <sqlite_path|store_dir|shard_dir> [<output_dir>] [<fidelity>] '
+          f'[--backend={"|".join(BACKENDS)}]')
+    print('The backend is detected from the path unless given')
+    exit(0)
+
+data_path = arguments[0]
+output_path = arguments[1] if len(arguments) > 1 else os.path.splitext(data_path.rstrip(os.sep))[0] + '.features'
+fidelity = arguments[2] if len(arguments) > 2 else 'day'
+backend = backends[-1] if backends else detect_backend(data_path)
+
+broker = OptionsBroker(account=Account())
+broker.load_historical_data(data_path, fidelity=fidelity, backend=backend)
+
+
+def print_progress(day, rows):
+    print(f'{day.strftime("%m/%d/%Y %H:%M")}: {rows} options')
+
+
+store = FeatureStore.build(broker, output_path, progress=print_progress)
+broker.shutdown()
+
+print(f'Wrote features for {len(store.days)} days to {output_path}')
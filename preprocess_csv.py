@@ -1,63 +1,165 @@
 #!/usr/bin/env python
 
-import sys
+import argparse
+import glob
 import os
+import time
 
 import sqlite3
+import numpy
 import pandas
 
-if len(sys.argv) < 2:
-    print('Usage preprocess_csv.py <csv_path>')
-    exit(0)
+from optionsbacktrader.schema import INDEXES, COMPOSITE_INDEXES, get_indexes, refresh_trading_days, refresh_underlyings
+from optionsbacktrader.pricing import get_chain_greeks
 
-csv_path = sys.argv[1]
-output_path = os.path.splitext(csv_path)[0] + '.sqlite3'
+COLUMNS = (
+    'underlying',
+    'underlying_last',
+    'optionroot',
+    'type',
+    'expiration',
+    'quotedate',
+    'strike',
+    'last',
+    'bid',
+    'ask',
+    'impliedvol',
+    'delta',
+    'gamma',
+    'theta',
+    'vega'
+)
 
-data = pandas.read_csv(csv_path, parse_dates=['expiration', 'quotedate'], header=0)
+GREEK_COLUMNS = ('impliedvol', 'delta', 'gamma', 'theta', 'vega')
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'optionsbacktrader', 'db.sql')
+
+parser = argparse.ArgumentParser(description='Load option chain CSV files into a historical_data SQLite database.')
+parser.add_argument('csv_paths', nargs='+', metavar='csv_path',
+                    help='CSV file or directory of CSV files, appended in sorted order')
+parser.add_argument('-o', '--output', help='SQLite database to create or append to')
+parser.add_argument('--chunk-size', type=int, default=200000, help='CSV rows read and inserted per transaction')
+parser.add_argument('--fill-greeks', action='store_true',
+                    help='compute implied volatility and greeks (Black-Scholes, from the mid) where they are missing')
+parser.add_argument('--recompute-greeks', action='store_true',
+                    help='compute implied volatility and greeks for every row, replacing the stored ones')
+parser.add_argument('--rate', type=float, default=0.0, help='risk free rate used for computed greeks')
+parser.add_argument('--dividend-yield', type=float, default=0.0, help='dividend yield used for computed greeks')
+args = parser.parse_args()
+
+csv_paths = []
+for path in args.csv_paths:
+    if os.path.isdir(path):
+        csv_paths += sorted(glob.glob(os.path.join(path, '*.csv')))
+    else:
+        csv_paths.append(path)
+
+if not csv_paths:
+    parser.error('no CSV files found')
+
+output_path = args.output
+if output_path is None:
+    if len(args.csv_paths) > 1:
+        parser.error('--output is required when loading several inputs')
+
+    output_path = os.path.splitext(args.csv_paths[0].rstrip(os.sep))[0] + '.sqlite3'
 
 db_connection = sqlite3.connect(output_path)
 db = db_connection.cursor()
 
-with open('./optionsbacktrader/db.sql', 'r') as fp:
-    sql_script = fp.read()
-    db.executescript(sql_script)
-
-for row in data.itertuples():
-    to_insert = (
-        row.underlying,
-        row.underlying_last,
-        row.optionroot,
-        row.type[0].lower(),
-        row.expiration.value,
-        row.quotedate.value,
-        row.strike,
-        row.last,
-        row.bid,
-        row.ask,
-        row.impliedvol,
-        row.delta,
-        row.gamma,
-        row.theta,
-        row.vega
-    )
-
-    db.execute('INSERT INTO historical_data ('
-               'underlying,'
-               'underlying_last,'
-               'optionroot,'
-               'type,'
-               'expiration,'
-               'quotedate,'
-               'strike,'
-               'last,'
-               'bid,'
-               'ask,'
-               'impliedvol,'
-               'delta,'
-               'gamma,'
-               'theta,'
-               'vega'
-               ') VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?);', to_insert)
-
-db_connection.commit()
+appending = bool(db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'historical_data'")
+                 .fetchall())
+if appending:
+    # The file already holds data an interrupted load must not corrupt: write ahead log, fsync at checkpoints
+    print(f'Appending to {output_path}')
+    db.execute('PRAGMA journal_mode = WAL')
+    db.execute('PRAGMA synchronous = NORMAL')
+else:
+    # Bulk load settings for a new file: larger pages, no rollback journal or fsync while loading
+    db.execute('PRAGMA page_size = 65536')
+    db.execute('PRAGMA journal_mode = OFF')
+    db.execute('PRAGMA synchronous = OFF')
+
+db.execute('PRAGMA cache_size = -262144')
+db.execute('PRAGMA temp_store = MEMORY')
+
+if not appending:
+    with open(SCHEMA_PATH, 'r') as fp:
+        db.executescript(fp.read())
+
+# Indexes are rebuilt once at the end rather than maintained on every insert
+existing_indexes = get_indexes(db_connection)
+rebuild_indexes = dict(INDEXES)
+rebuild_indexes.update({name: sql for name, sql in COMPOSITE_INDEXES.items() if name in existing_indexes})
+
+for index_name in rebuild_indexes:
+    db.execute(f'DROP INDEX IF EXISTS {index_name}')
+
+insert_sql = f'INSERT OR REPLACE INTO historical_data ({",".join(COLUMNS)}) VALUES ({",".join("?" * len(COLUMNS))})'
+
+total_rows = 0
+start_time = time.time()
+
+for file_number, csv_path in enumerate(csv_paths, 1):
+    file_rows = 0
+
+    for chunk in pandas.read_csv(csv_path, usecols=list(COLUMNS), parse_dates=['expiration', 'quotedate'], header=0,
+                                 chunksize=args.chunk_size):
+        chunk['type'] = chunk['type'].str[0].str.lower()
+        for column in ('expiration', 'quotedate'):
+            chunk[column] = chunk[column].values.astype('datetime64[ns]').astype('int64')
+
+        if args.fill_greeks or args.recompute_greeks:
+            missing_rows = (chunk[list(GREEK_COLUMNS)].isna().any(axis=1) | (chunk['impliedvol'] <= 0.0)).values
+            fill_rows = numpy.ones(len(chunk), dtype=bool) if args.recompute_greeks else missing_rows
+
+            if fill_rows.any():
+                fill_chunk = chunk[fill_rows]
+                mids = ((fill_chunk['bid'] + fill_chunk['ask']) / 2.0).values
+                prices = numpy.where((fill_chunk['bid'] > 0.0) & (fill_chunk['ask'] > 0.0), mids, fill_chunk['last'])
+
+                greeks = get_chain_greeks(fill_chunk['type'].values, fill_chunk['underlying_last'].values,
+                                          fill_chunk['strike'].values, fill_chunk['expiration'].values,
+                                          fill_chunk['quotedate'].values, prices, args.rate, args.dividend_yield)
+
+                # Prices without an implied volatility keep the file's greeks, or if it has none get the zero
+                # volatility limit: intrinsic delta and no gamma, theta or vega
+                unsolved = numpy.isnan(greeks['impliedvol'])
+                is_call = (fill_chunk['type'] == 'c').values
+                moneyness = fill_chunk['underlying_last'].values - fill_chunk['strike'].values
+                greeks['impliedvol'][unsolved] = 0.0
+                intrinsic_delta = numpy.where(is_call, (moneyness > 0.0) * 1.0, (moneyness < 0.0) * -1.0)
+                greeks['delta'][unsolved] = intrinsic_delta[unsolved]
+                for column in ('gamma', 'theta', 'vega'):
+                    greeks[column][unsolved] = 0.0
+
+                keep_file_greeks = unsolved & ~missing_rows[fill_rows]
+                write_rows = numpy.flatnonzero(fill_rows)[~keep_file_greeks]
+                for column in GREEK_COLUMNS:
+                    chunk[column] = chunk[column].astype('float64')
+                    chunk.iloc[write_rows, chunk.columns.get_loc(column)] = greeks[column][~keep_file_greeks]
+
+        # Inserting in primary key order keeps the WITHOUT ROWID b-tree appends local
+        chunk = chunk.sort_values(['optionroot', 'quotedate'])
+
+        db.executemany(insert_sql, zip(*[chunk[column].tolist() for column in COLUMNS]))
+        db_connection.commit()
+
+        file_rows += len(chunk)
+        total_rows += len(chunk)
+        elapsed = time.time() - start_time
+        print(f'[{file_number}/{len(csv_paths)}] {csv_path}: {file_rows} rows '
+              f'({total_rows} total, {total_rows / max(elapsed, 1e-9):.0f} rows/s)')
+
+print('Building indexes')
+for index_sql in rebuild_indexes.values():
+    db.execute(index_sql)
+
+refresh_trading_days(db_connection)
+refresh_underlyings(db_connection)
+if appending:
+    # Back to a rollback journal, WAL mode would stick to the file and its readers
+    db.execute('PRAGMA journal_mode = DELETE')
 db_connection.close()
+
+print(f'Loaded {total_rows} rows into {output_path} in {time.time() - start_time:.1f}s')
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+import sys
+import os
+
+import sqlite3
+
+from optionsbacktrader.columnar_store import STORE_COLUMNS
+from optionsbacktrader.schema import upgrade_schema
+
+YEAR_SQL = "strftime('%Y', quotedate / 1000000000, 'unixepoch')"
+SHARD_KEYS = {
+    'underlying': ('underlying',),
+    'year': (YEAR_SQL,),
+    'underlying_year': ('underlying', YEAR_SQL)
+}
+
+if len(sys.argv) < 3 or (len(sys.argv) > 3 and sys.argv[3] not in SHARD_KEYS):
+    print('Usage shard_db.py <sqlite_path> <output_dir> [underlying|year|underlying_year]')
+    exit(0)
+
+db_path = sys.argv[1]
+output_path = sys.argv[2]
+keys = SHARD_KEYS[sys.argv[3] if len(sys.argv) > 3 else 'underlying']
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'optionsbacktrader', 'db.sql'), 'r') as fp:
+    schema_sql = fp.read()
+
+os.makedirs(output_path, exist_ok=True)
+
+db_connection = sqlite3.connect(db_path)
+shards = db_connection.execute(f'SELECT DISTINCT {", ".join(keys)} FROM historical_data ORDER BY 1').fetchall()
+db_connection.close()
+
+for shard in shards:
+    shard_path = os.path.join(output_path, '_'.join(map(str, shard)) + '.sqlite3')
+    print(f'Writing {shard_path}')
+
+    shard_connection = sqlite3.connect(shard_path)
+    shard_connection.executescript(schema_sql)
+    shard_connection.execute('ATTACH DATABASE ? AS source', (db_path,))
+    shard_connection.execute(
+        f'INSERT INTO historical_data ({", ".join(STORE_COLUMNS)}) SELECT {", ".join(STORE_COLUMNS)} '
+        f'FROM source.historical_data WHERE '
+        f'{" AND ".join(f"{key} = ?" for key in keys)}',
+        shard
+    )
+    shard_connection.commit()
+    shard_connection.execute('DETACH DATABASE source')
+
+    # Each shard gets the composite index and trading_days/underlyings tables of an upgraded file
+    upgrade_schema(shard_connection)
+    shard_connection.close()
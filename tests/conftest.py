@@ -0,0 +1,144 @@
+import os
+import random
+import sqlite3
+
+import numpy as np
+import pytest
+
+from datetime import timedelta
+
+from benchmarks.synthetic_data import write_sqlite, SCHEMA_PATH
+from optionsbacktrader import OptionsBroker, Account
+from optionsbacktrader.schema import upgrade_schema
+
+UNDERLYINGS = ('SPX', 'NDX')
+
+
+@pytest.fixture(scope='session')
+def db_path(tmp_path_factory):
+    # 20 trading days of one underlying, 3 weekly expirations of 12 strikes
+    path = str(tmp_path_factory.mktemp('data') / 'SPX.sqlite3')
+    write_sqlite(path, 20, 12, 3, seed=0)
+
+    return path
+
+
+@pytest.fixture(scope='session')
+def multi_db_paths(tmp_path_factory):
+    # The same two underlyings as one file and as a directory of per underlying shards
+    directory = tmp_path_factory.mktemp('multi')
+    shard_path = str(directory / 'shards')
+    os.makedirs(shard_path)
+
+    merged_path = str(directory / 'all.sqlite3')
+    merged_connection = sqlite3.connect(merged_path)
+    with open(SCHEMA_PATH, 'r') as fp:
+        merged_connection.executescript(fp.read())
+
+    for seed, underlying in enumerate(UNDERLYINGS):
+        path = os.path.join(shard_path, f'{underlying}.sqlite3')
+        write_sqlite(path, 20, 8, 3, underlying=underlying, seed=seed)
+
+        connection = sqlite3.connect(path)
+        upgrade_schema(connection)
+        connection.close()
+
+        merged_connection.execute('ATTACH DATABASE ? AS shard', (path,))
+        merged_connection.execute('INSERT INTO historical_data SELECT * FROM shard.historical_data')
+        merged_connection.commit()
+        merged_connection.execute('DETACH DATABASE shard')
+
+    upgrade_schema(merged_connection)
+    merged_connection.close()
+
+    return merged_path, shard_path
+
+
+@pytest.fixture(scope='session')
+def period_shard_path(multi_db_paths, tmp_path_factory):
+    # The merged file split at its middle trading day, so option histories span both shards
+    merged_path, _ = multi_db_paths
+    shard_path = str(tmp_path_factory.mktemp('periods'))
+
+    connection = sqlite3.connect(merged_path)
+    days = [day for day, in connection.execute('SELECT quotedate FROM trading_days ORDER BY quotedate')]
+    connection.close()
+
+    for name, condition in (('first', 'quotedate < ?'), ('second', 'quotedate >= ?')):
+        connection = sqlite3.connect(os.path.join(shard_path, f'{name}.sqlite3'))
+        with open(SCHEMA_PATH, 'r') as fp:
+            connection.executescript(fp.read())
+
+        connection.execute('ATTACH DATABASE ? AS source', (merged_path,))
+        connection.execute(f'INSERT INTO historical_data SELECT * FROM source.historical_data WHERE {condition}',
+                           (days[len(days) // 2],))
+        connection.commit()
+        connection.execute('DETACH DATABASE source')
+
+        upgrade_schema(connection)
+        connection.close()
+
+    return shard_path
+
+
+@pytest.fixture
+def make_broker():
+    def make(path, cash=100000, broker_kwargs=None, **load_kwargs):
+        broker = OptionsBroker(account=Account(cash), **(broker_kwargs or {}))
+        broker.load_historical_data(path, fidelity='day', **load_kwargs)
+
+        return broker
+
+    return make
+
+
+def describe_quote(quote):
+    if quote is None:
+        return None
+
+    asset = quote.asset
+    if isinstance(asset, str):
+        return str(quote.quotedate), asset, quote.bid, quote.ask
+
+    return str(quote.quotedate), asset.symbol, asset.underlying_symbol, asset.option_type, asset.strike, \
+        str(asset.expiry_date), asset.implied_volatility, asset.delta, asset.gamma, asset.theta, asset.vega, \
+        quote.bid, quote.ask, quote.underlying_last
+
+
+@pytest.fixture
+def broker_snapshot():
+    # What a broker returns for a sample of chain, quote, history and delta queries, for comparing stores
+    def snapshot(broker, underlyings=UNDERLYINGS):
+        rng = random.Random(3)
+        days = broker.get_trading_days()
+        result = [str(broker.data_start_date), str(broker.data_end_date), [str(day) for day in days],
+                  broker.get_underlyings()]
+
+        for day in days[::3]:
+            chain = broker.get_options_chain(quotedate=day)
+            result.append([describe_quote(quote) for quote in chain])
+            for underlying in underlyings:
+                result.append([describe_quote(quote) for quote in broker.get_options_chain(
+                    quotedate=day, expiry_max=day + timedelta(days=10), underlying=underlying)])
+
+            symbols = rng.sample([quote.asset.symbol for quote in chain], min(5, len(chain))) + ['NOT A SYMBOL']
+            for symbol in symbols:
+                result.append(describe_quote(broker.get_option_quote(symbol, day)))
+                result.append([describe_quote(quote)
+                               for quote in broker.get_history_for_option(symbol, day, day - timedelta(days=9))])
+            result.append(sorted((symbol, describe_quote(quote))
+                                 for symbol, quote in broker.get_option_quotes(symbols, day).items()))
+            result.append([np.asarray(column).tolist() for column in broker.get_history_for_options_chain(
+                day, day - timedelta(days=9), quotedate=day, expiry_max=day + timedelta(days=10))])
+
+            for expiry in sorted({quote.asset.expiry_date for quote in chain})[:2]:
+                expiry = expiry.replace(tzinfo=None)
+                for delta in (-1.5, -0.5, -0.3, -0.1, 0.0, 0.1, 0.3, 0.5, 1.5):
+                    result.append(describe_quote(broker.find_option(delta, expiry, day.replace(tzinfo=None))))
+                    for underlying in underlyings:
+                        result.append(describe_quote(
+                            broker.find_option(delta, expiry, day.replace(tzinfo=None), underlying=underlying)))
+
+        return result
+
+    return snapshot
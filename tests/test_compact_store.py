@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import pytest
+
+from optionsbacktrader.columnar_store import ColumnarStore, FLOAT_COLUMNS, INTEGER_COLUMNS, TEXT_COLUMNS
+from optionsbacktrader.compact_store import CompactStore, QuantizedColumn, DictionaryColumn
+from optionsbacktrader.sharded_store import find_shard_paths
+
+
+@pytest.fixture(scope='module')
+def columnar_store(multi_db_paths):
+    merged_path, _ = multi_db_paths
+
+    return ColumnarStore.from_sqlite(merged_path)
+
+
+@pytest.fixture(scope='module')
+def compact_path(columnar_store, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('compact') / 'all.compact')
+    CompactStore.from_store(columnar_store).save(path)
+
+    return path
+
+
+def test_columns_decode_exactly(columnar_store, compact_path):
+    for mmap in (True, False):
+        store = CompactStore.load(compact_path, mmap=mmap)
+        for name in TEXT_COLUMNS + INTEGER_COLUMNS + FLOAT_COLUMNS:
+            np.testing.assert_array_equal(store.columns[name][:], columnar_store.columns[name])
+        for name, dictionary in columnar_store.dictionaries.items():
+            np.testing.assert_array_equal(store.dictionaries[name], dictionary)
+
+
+def test_columns_are_narrower(columnar_store, compact_path):
+    store = CompactStore.load(compact_path)
+    encodings = store.get_encodings()
+
+    for name in ('underlying_last', 'strike', 'bid', 'ask'):
+        assert encodings[name] == {'type': 'quantized', 'decimals': encodings[name]['decimals']}
+        assert store.columns[name].values.dtype == np.int32
+    for name in ('impliedvol', 'delta'):
+        assert store.columns[name].values.dtype == np.float32
+    for name in INTEGER_COLUMNS:
+        assert encodings[name] == {'type': 'dictionary'}
+
+    assert sum(column.nbytes for column in store.columns.values()) < \
+        sum(column.nbytes for column in columnar_store.columns.values()) / 2
+
+
+@pytest.mark.parametrize('load_kwargs', [{}, {'in_memory': True}, {'cache_bytes': 2 ** 22}])
+def test_compact_store_answers_like_sqlite(multi_db_paths, compact_path, make_broker, broker_snapshot, load_kwargs):
+    merged_path, _ = multi_db_paths
+    broker = make_broker(compact_path, backend='compact', **load_kwargs)
+
+    assert broker_snapshot(broker) == broker_snapshot(make_broker(merged_path))
+
+
+def test_compact_shards_answer_like_sqlite(multi_db_paths, make_broker, broker_snapshot, tmp_path):
+    merged_path, shard_path = multi_db_paths
+    for path in find_shard_paths(shard_path):
+        CompactStore.from_store(ColumnarStore.from_sqlite(path)).save(
+            str(tmp_path / os.path.splitext(os.path.basename(path))[0]))
+
+    assert broker_snapshot(make_broker(str(tmp_path), backend='compact')) == \
+        broker_snapshot(make_broker(merged_path))
+
+
+def test_columns_without_a_decimal_encoding(columnar_store):
+    # Values with more digits than any candidate encoding stay float64 unless the conversion may be lossy
+    columns = dict(columnar_store.columns)
+    columns['vega'] = np.random.RandomState(0).uniform(0.0, 10.0, len(columns['vega']))
+    store = ColumnarStore(columns, columnar_store.dictionaries, columnar_store.indexes)
+
+    exact = CompactStore.from_store(store)
+    assert exact.columns['vega'].values.dtype == np.float64
+    assert exact.get_full_precision_columns() == ['vega']
+    np.testing.assert_array_equal(exact.columns['vega'][:], columns['vega'])
+
+    lossy = CompactStore.from_store(store, exact=False)
+    assert lossy.columns['vega'].values.dtype == np.float32
+    np.testing.assert_allclose(lossy.columns['vega'][:], columns['vega'], rtol=1e-6)
+
+
+def test_greeks_beyond_float32_precision_are_int32_ticks(columnar_store):
+    # Vendor greeks with 6 decimals and 9 significant digits, and missing implied volatilities
+    columns = dict(columnar_store.columns)
+    rng = np.random.RandomState(0)
+    columns['vega'] = np.round(rng.uniform(100.0, 500.0, len(columns['vega'])), 6)
+    columns['impliedvol'] = np.where(rng.rand(len(columns['impliedvol'])) < 0.1, np.nan, columns['impliedvol'])
+    store = CompactStore.from_store(ColumnarStore(columns, columnar_store.dictionaries, columnar_store.indexes))
+
+    assert store.columns['vega'].values.dtype == np.int32
+    assert store.columns['impliedvol'].values.dtype == np.float32
+    assert store.get_full_precision_columns() == []
+    for name in ('vega', 'impliedvol'):
+        np.testing.assert_array_equal(store.columns[name][:], columns[name])
+
+
+def test_encodings():
+    assert QuantizedColumn.encode([1e6], np.int16, 2) is None
+
+    prices = QuantizedColumn.encode([0.05, 1234.56, -3.1], np.int32, 2)
+    np.testing.assert_array_equal(prices.values, [5, 123456, -310])
+    np.testing.assert_array_equal(prices[1:], [1234.56, -3.1])
+
+    dates = DictionaryColumn.encode(np.array([30, 10, 30, 20], dtype=np.int64))
+    assert dates.ids.dtype == np.int8
+    np.testing.assert_array_equal(dates[:], [30, 10, 30, 20])
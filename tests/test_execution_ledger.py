@@ -0,0 +1,113 @@
+import os
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from optionsbacktrader.execution import Execution, OrderType
+from optionsbacktrader.execution_ledger import ExecutionLedger
+from optionsbacktrader.option import Option
+
+
+def make_execution(i):
+    option = Option(symbol=f'SPX1511{i % 5:02d}C02000', underlying_symbol='SPX', option_type='c' if i % 2 else 'p',
+                    strike=2000.0 + i % 5, expiry_date=datetime(2015, 11, 20), implied_volatility=0.2, delta=0.5,
+                    theta=-1.0, gamma=0.01, vega=2.0)
+
+    return Execution(symbol=option.symbol, price=1.0 + i, size=100, asset=option,
+                     order_type=OrderType.BUY if i % 3 else OrderType.SELL,
+                     quotedate=datetime(2015, 10, 1) + timedelta(days=i))
+
+
+def fill(ledger, count, start=0):
+    marks = []
+    for i in range(start, start + count):
+        marks.append(ledger.mark())
+        ledger.append(make_execution(i), realized_pl=float(i))
+
+    return marks
+
+
+def assert_same_columns(ledger, expected):
+    columns, expected_columns = ledger.get_columns(), expected.get_columns()
+    for name in expected_columns:
+        np.testing.assert_array_equal(columns[name], expected_columns[name])
+
+
+def test_spilled_ledger_reads_back_like_in_memory(tmp_path):
+    ledger = ExecutionLedger(spill_path=str(tmp_path), spill_rows=4)
+    expected = ExecutionLedger()
+    fill(ledger, 11)
+    fill(expected, 11)
+
+    assert len(os.listdir(tmp_path)) == 2
+    assert len(ledger) == 11
+    assert_same_columns(ledger, expected)
+    assert [(execution.symbol, execution.price, execution.order_type) for execution in ledger.get_executions()] == \
+        [(execution.symbol, execution.price, execution.order_type) for execution in expected.get_executions()]
+    assert ledger.get_realized_pl() == expected.get_realized_pl() == sum(range(11))
+
+
+@pytest.mark.parametrize('truncate_to', [0, 3, 4, 6, 9, 11])
+def test_truncate_reads_back_spilled_chunks(tmp_path, truncate_to):
+    ledger = ExecutionLedger(spill_path=str(tmp_path), spill_rows=4)
+    expected = ExecutionLedger()
+    marks = fill(ledger, 11) + [ledger.mark()]
+    expected_marks = fill(expected, 11) + [expected.mark()]
+
+    ledger.truncate(marks[truncate_to])
+    expected.truncate(expected_marks[truncate_to])
+
+    assert len(ledger) == truncate_to
+    assert len(os.listdir(tmp_path)) == truncate_to // 4
+    assert_same_columns(ledger, expected)
+
+    # Appending after a truncation spills again
+    fill(ledger, 6, start=20)
+    fill(expected, 6, start=20)
+    assert_same_columns(ledger, expected)
+
+
+def test_truncate_rejects_marks_of_dropped_executions(tmp_path):
+    ledger = ExecutionLedger(spill_path=str(tmp_path), spill_rows=4)
+    marks = fill(ledger, 8)
+
+    ledger.truncate(marks[2])
+    fill(ledger, 6)
+
+    with pytest.raises(ValueError):
+        ledger.truncate(marks[6])
+
+
+def test_ledgers_sharing_a_spill_path_keep_their_own_chunks(tmp_path):
+    first = ExecutionLedger(spill_path=str(tmp_path), spill_rows=4)
+    second = ExecutionLedger(spill_path=str(tmp_path), spill_rows=4)
+    fill(first, 9)
+    fill(second, 9, start=100)
+
+    assert len(os.listdir(tmp_path)) == 4
+    np.testing.assert_array_equal(first.get_columns()['realized_pl'], np.arange(9))
+    np.testing.assert_array_equal(second.get_columns()['realized_pl'], np.arange(100, 109))
+
+    first.clear()
+    assert len(os.listdir(tmp_path)) == 2
+    np.testing.assert_array_equal(second.get_columns()['realized_pl'], np.arange(100, 109))
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_forked_ledgers_do_not_overwrite_each_others_chunks(tmp_path):
+    # After a fork both processes hold the same ledger object (same id) and spill into the same directory
+    ledger = ExecutionLedger(spill_path=str(tmp_path), spill_rows=4)
+    fill(ledger, 2)
+
+    pid = os.fork()
+    if pid == 0:
+        fill(ledger, 2, start=100)
+        os._exit(0)
+
+    os.waitpid(pid, 0)
+    fill(ledger, 2)
+
+    assert len(os.listdir(tmp_path)) == 2
+    np.testing.assert_array_equal(ledger.get_columns()['realized_pl'], [0, 1, 0, 1])
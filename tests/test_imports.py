@@ -0,0 +1,26 @@
+import os
+import subprocess
+import sys
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imports the data tools make, with gym and stable-baselines made unimportable
+NO_RL_STACK = """
+import sys
+sys.modules['gym'] = None
+sys.modules['stable_baselines3'] = None
+
+import optionsbacktrader.schema, optionsbacktrader.pricing, optionsbacktrader.columnar_store
+from optionsbacktrader import OptionsBroker, Account, OrderLeg, OrderType
+"""
+
+
+def test_data_tools_import_without_the_rl_stack():
+    subprocess.run([sys.executable, '-c', NO_RL_STACK], cwd=ROOT_PATH, check=True)
+
+
+def test_environment_is_imported_on_first_use():
+    import optionsbacktrader
+    from optionsbacktrader.options_trading_env import OptionsTradingEnvironment
+
+    assert optionsbacktrader.OptionsTradingEnvironment is OptionsTradingEnvironment
@@ -0,0 +1,47 @@
+import threading
+
+from optionsbacktrader.instrumentation import Instrumentation, BACKGROUND
+
+
+def test_sql_is_traced_on_every_shard(multi_db_paths, make_broker):
+    _, shard_path = multi_db_paths
+    broker = make_broker(shard_path)
+    instrumentation = Instrumentation().attach(broker)
+
+    broker.get_options_chain(broker.data_start_date)
+
+    # One chain query per underlying shard
+    assert instrumentation.get_summary()['get_options_chain']['sql_queries'] == 2
+
+    instrumentation.detach()
+    broker.get_options_chain(broker.data_start_date)
+    assert instrumentation.get_summary()['get_options_chain']['sql_queries'] == 2
+
+
+def test_pipelined_reader_is_traced_as_background(db_path, make_broker):
+    broker = make_broker(db_path)
+    instrumentation = Instrumentation().attach(broker)
+
+    broker.start(pipeline_days=2)
+    instrumentation.detach()
+
+    # Each day is loaded by the producer thread through its own reader connection
+    assert instrumentation.get_summary()[BACKGROUND]['sql_queries'] >= len(broker.get_trading_days())
+
+
+def test_counters_are_exact_across_threads():
+    instrumentation = Instrumentation()
+
+    def trace():
+        for _ in range(5000):
+            instrumentation._trace_sql('SELECT 1')
+
+    threads = [threading.Thread(target=trace) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert instrumentation.get_summary()[BACKGROUND]['sql_queries'] == 8 * 5000
+    assert instrumentation.end_episode()[BACKGROUND]['sql_queries'] == 8 * 5000
+    assert instrumentation.episode == {}
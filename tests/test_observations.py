@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from optionsbacktrader import OptionsTradingEnvironment
+from optionsbacktrader.options_trading_env import ChainSpace
+from optionsbacktrader.observation import OBSERVATION_WIDTH, pad_chain
+from optionsbacktrader.clock import DAY
+from optionsbacktrader.chain_view import datetime_to_db
+
+HOLD = np.array([0, 0, 0, 0, 0, 1])
+
+
+def run_episode(env, steps=5):
+    # Lazily, reused observation buffers are only valid until the next builds
+    yield env.reset()
+    for _ in range(steps):
+        yield env.step(HOLD)[0]
+
+
+@pytest.mark.parametrize('max_chain_length, reuse_buffers', [(100, True), (50, True), (100, False)])
+def test_masked_observations_are_the_real_rows_of_the_dense_chain(db_path, make_broker, max_chain_length,
+                                                                  reuse_buffers):
+    dense_env = OptionsTradingEnvironment(make_broker(db_path), max_chain_length=max_chain_length)
+    masked_env = OptionsTradingEnvironment(make_broker(db_path), max_chain_length=max_chain_length,
+                                           observation_mode='masked', reuse_buffers=reuse_buffers)
+
+    for dense, masked in zip(run_episode(dense_env), run_episode(masked_env)):
+        chain_length = min(len(masked_env.broker.get_options_chain()), max_chain_length)
+
+        assert masked_env.observation_space.contains(masked)
+        assert masked.shape == (chain_length, OBSERVATION_WIDTH)
+        assert reuse_buffers or masked.base is None
+        np.testing.assert_array_equal(masked, dense[:chain_length])
+        assert np.all(masked[:, -2] > 0.0)
+
+        padded, mask = pad_chain(masked, max_chain_length)
+        np.testing.assert_array_equal(padded, dense)
+        np.testing.assert_array_equal(mask, np.arange(max_chain_length) < chain_length)
+
+
+def test_chain_space():
+    space = ChainSpace(10)
+
+    assert space.contains(space.sample())
+    assert space.contains(np.zeros((0, OBSERVATION_WIDTH), dtype=np.float32))
+    assert not space.contains(np.zeros((11, OBSERVATION_WIDTH), dtype=np.float32))
+    assert not space.contains(np.zeros((5, OBSERVATION_WIDTH + 1), dtype=np.float32))
+    assert space == ChainSpace(10) and space != ChainSpace(11)
+
+
+def test_top_k_observations_keep_the_rows_nearest_the_money_and_expiry(db_path, make_broker):
+    dense_env = OptionsTradingEnvironment(make_broker(db_path), max_chain_length=100)
+    top_k_env = OptionsTradingEnvironment(make_broker(db_path), observation_mode='top_k', top_k=10)
+
+    for dense, top_k in zip(run_episode(dense_env), run_episode(top_k_env)):
+        broker = top_k_env.broker
+        assert top_k_env.observation_space.contains(top_k)
+        assert top_k.shape == (10, OBSERVATION_WIDTH)
+
+        # Chain order is by expiration, the score is moneyness plus years to expiry
+        expirations = np.array([datetime_to_db(quote.asset.expiry_date) for quote in broker.get_options_chain()])
+        chain_length = len(expirations)
+        score = np.abs(dense[:chain_length, -2].astype(np.float64) - 1.0) + \
+            (np.sort(expirations) - datetime_to_db(broker.current_date)) / (365.0 * DAY)
+        rows = np.sort(np.argsort(score, kind='stable')[:10])
+
+        np.testing.assert_array_equal(top_k, dense[rows])
@@ -0,0 +1,151 @@
+import pytest
+
+from optionsbacktrader import OrderLeg, OrderType
+from optionsbacktrader.instrumentation import Instrumentation
+from optionsbacktrader.option import Option
+from optionsbacktrader.quote import Quote
+
+
+def start(broker):
+    broker.start(step_mode=True)
+    broker.step()
+
+    return [quote.asset.symbol for quote in broker.get_options_chain()]
+
+
+def account_state(account):
+    return account.cash, account._cash_spent, account._cash_gain, len(account.ledger), \
+        sorted((position.symbol, position.size, position.book_value) for position in account.get_positions())
+
+
+@pytest.mark.parametrize('commission_per_order, commissions', [(False, 3), (True, 1)])
+def test_place_order_books_every_leg(db_path, make_broker, commission_per_order, commissions):
+    broker = make_broker(db_path, broker_kwargs={'commission': 1.5, 'commission_per_order': commission_per_order})
+    symbols = start(broker)
+    legs = [OrderLeg(OrderType.BUY, symbols[0]), OrderLeg(OrderType.SELL, symbols[1], size=2),
+            OrderLeg(OrderType.BUY, quote=broker.get_option_quote(symbols[2]))]
+
+    orders = broker.place_order(legs)
+
+    assert [(order.symbol, order.order_type, order.size) for order in orders] == \
+        [(symbols[0], OrderType.BUY, 100), (symbols[1], OrderType.SELL, 200), (symbols[2], OrderType.BUY, 100)]
+    assert len(broker.account.get_positions()) == 3
+    assert broker.account.cash == pytest.approx(100000 - sum(order.get_total_value() for order in orders) -
+                                                1.5 * commissions)
+
+
+def test_place_order_books_nothing_when_a_leg_has_no_quote(db_path, make_broker):
+    broker = make_broker(db_path, broker_kwargs={'commission': 1.0})
+    symbols = start(broker)
+    broker.buy(symbols[0])
+    state = account_state(broker.account)
+
+    with pytest.raises(ValueError):
+        broker.place_order([OrderLeg(OrderType.BUY, symbols[1]), OrderLeg(OrderType.SELL, 'NOT A SYMBOL')])
+
+    assert account_state(broker.account) == state
+
+
+def test_place_order_rolls_back_a_partially_booked_order(db_path, make_broker, monkeypatch):
+    broker = make_broker(db_path, broker_kwargs={'commission': 1.0})
+    symbols = start(broker)
+    broker.sell(symbols[0])
+    state = account_state(broker.account)
+
+    update_from_execution = broker.account.update_from_execution
+    booked = []
+
+    def fail_on_second_leg(execution):
+        if booked:
+            raise RuntimeError()
+
+        booked.append(execution)
+        update_from_execution(execution)
+
+    monkeypatch.setattr(broker.account, 'update_from_execution', fail_on_second_leg)
+
+    with pytest.raises(RuntimeError):
+        broker.place_order([OrderLeg(OrderType.BUY, symbols[0]), OrderLeg(OrderType.BUY, symbols[1])])
+
+    assert len(booked) == 1
+    assert account_state(broker.account) == state
+
+
+def test_close_all_charges_commission_per_position(db_path, make_broker):
+    broker = make_broker(db_path, broker_kwargs={'commission': 2.0})
+    symbols = start(broker)
+    broker.place_order([OrderLeg(OrderType.BUY, symbol) for symbol in symbols[:4]])
+    cash = broker.account.cash
+
+    orders = broker.close_all()
+
+    assert len(orders) == 4
+    assert not broker.account.get_positions()
+    assert broker.account.cash == pytest.approx(cash + sum(order.get_total_value() for order in orders) - 4 * 2.0)
+
+
+def test_instrumentation_counts_orders_and_settlement(db_path, make_broker):
+    broker = make_broker(db_path)
+    instrumentation = Instrumentation().attach(broker)
+    symbols = start(broker)
+
+    broker.place_order([OrderLeg(OrderType.BUY, symbols[0]), OrderLeg(OrderType.SELL, symbols[1])])
+    broker.account.get_percent_spent_pl(broker)
+    broker.settle_expiring()
+    broker.close_all()
+    instrumentation.detach()
+
+    summary = instrumentation.get_summary()
+    for name in ('place_order', 'settle_expiring', 'close_all', 'Account.get_percent_spent_pl',
+                 'Account.get_market_value'):
+        assert summary[name]['calls'] == 1
+
+
+def test_account_snapshot_of_symbols_restores_only_those_positions(db_path, make_broker):
+    broker = make_broker(db_path)
+    symbols = start(broker)
+    broker.place_order([OrderLeg(OrderType.BUY, symbols[0]), OrderLeg(OrderType.SELL, symbols[1])])
+    state = account_state(broker.account)
+    market_value = broker.account.get_market_value(broker)
+
+    snapshot = broker.account.snapshot([symbols[0], symbols[2]])
+    assert len(snapshot.positions) == 1
+
+    broker.place_order([OrderLeg(OrderType.SELL, symbols[0]), OrderLeg(OrderType.BUY, symbols[2], size=3)])
+    broker.account.get_market_value(broker)
+    broker.account.restore(snapshot)
+
+    assert account_state(broker.account) == state
+    assert broker.account.get_market_value(broker) == market_value
+
+
+def test_close_closes_only_that_position(db_path, make_broker):
+    broker = make_broker(db_path, broker_kwargs={'commission': 1.0})
+    symbols = start(broker)
+    broker.place_order([OrderLeg(OrderType.BUY, symbols[0]), OrderLeg(OrderType.SELL, symbols[1], size=2)])
+
+    order = broker.close(broker.account.get_position(symbols[1]))
+
+    assert (order.symbol, order.order_type, order.size) == (symbols[1], OrderType.BUY, 200)
+    assert [position.symbol for position in broker.account.get_positions()] == [symbols[0]]
+    assert len(broker.account.ledger) == 3
+    assert broker.close(order) is None
+
+
+@pytest.mark.parametrize('method', ['market', 'intrinsic'])
+def test_settle_expiring_settles_unquoted_legs_at_intrinsic_value(db_path, make_broker, method):
+    broker = make_broker(db_path)
+    start(broker)
+    underlying_last = broker.get_options_chain()[0].underlying_last
+
+    # An in the money short put expiring today that has no quote in the data
+    option = Option('SPX NOT QUOTED', 'SPX', 'p', underlying_last + 25.0, broker.current_date, 0.2, -0.9, 0.0, 0.0,
+                    0.0)
+    broker.sell(quote=Quote(quotedate=broker.current_date, asset=option, bid=30.0, ask=30.0,
+                            underlying_last=underlying_last))
+
+    order = broker.settle_expiring(method=method)[0]
+
+    assert (order.symbol, order.order_type) == ('SPX NOT QUOTED', OrderType.BUY)
+    assert order.price == pytest.approx(25.0)
+    assert not broker.account.get_positions()
@@ -0,0 +1,88 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from optionsbacktrader.option import OptionType
+from optionsbacktrader.pricing import is_call, black_scholes, black_scholes_greeks, implied_volatility, \
+    get_chain_greeks, YEAR
+
+
+def test_is_call_accepts_codes_names_enums_and_booleans():
+    np.testing.assert_array_equal(is_call(['c', 'p', 'C', 'P', 'call', 'put']), [True, False, True, False, True, False])
+    np.testing.assert_array_equal(is_call([OptionType.CALL, OptionType.PUT, OptionType.PUT]), [True, False, False])
+    np.testing.assert_array_equal(is_call(np.array([[OptionType.PUT], [OptionType.CALL]])), [[False], [True]])
+    assert not is_call(OptionType.PUT)
+    np.testing.assert_array_equal(is_call([True, False]), [True, False])
+
+
+def test_is_call_rejects_other_objects():
+    with pytest.raises(ValueError):
+        is_call([OptionType.CALL, None])
+
+
+def test_put_call_parity():
+    strikes = np.linspace(50.0, 150.0, 11)
+    calls = black_scholes('c', 100.0, strikes, 0.5, 0.3, rate=0.02, dividend_yield=0.01)
+    puts = black_scholes('p', 100.0, strikes, 0.5, 0.3, rate=0.02, dividend_yield=0.01)
+
+    np.testing.assert_allclose(calls - puts, 100.0 * np.exp(-0.01 * 0.5) - strikes * np.exp(-0.02 * 0.5), atol=1e-6)
+
+
+@pytest.mark.parametrize('option_types', [['c', 'p'] * 50, [OptionType.CALL, OptionType.PUT] * 50])
+def test_implied_volatility_recovers_the_pricing_volatility(option_types):
+    rng = np.random.RandomState(0)
+    underlying = rng.uniform(50.0, 500.0, 100)
+    strikes = underlying * rng.uniform(0.8, 1.2, 100)
+    years = rng.uniform(7.0, 400.0, 100) / 365.0
+    volatilities = rng.uniform(0.05, 1.5, 100)
+
+    prices = black_scholes(option_types, underlying, strikes, years, volatilities, rate=0.01)
+    solved = implied_volatility(prices, option_types, underlying, strikes, years, rate=0.01)
+
+    np.testing.assert_allclose(solved, volatilities, atol=1e-5)
+
+
+def test_implied_volatility_stops_on_small_volatility_steps():
+    # A price tolerance no float64 price of this size can meet, solved through the volatility step instead
+    underlying = np.array([5e8, 2e10])
+    years = np.array([3.0, 5.0])
+    prices = black_scholes('c', underlying, underlying, years, np.array([0.2, 0.3]))
+
+    solved = implied_volatility(prices, 'c', underlying, underlying, years, tol=0.0, max_iterations=20)
+
+    np.testing.assert_allclose(solved, [0.2, 0.3], atol=1e-8)
+
+
+def test_implied_volatility_ignores_newton_steps_over_an_underflowed_vega():
+    # Deep in the money, vega at the starting guess is subnormal and the first Newton step overflows to inf
+    price = black_scholes('c', 100.0, 31.75, 0.01, 2.0)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        solved = implied_volatility(price, 'c', 100.0, 31.75, 0.01)
+
+    assert np.isfinite(solved) and black_scholes('c', 100.0, 31.75, 0.01, solved) == pytest.approx(price, abs=1e-6)
+
+
+def test_implied_volatility_is_nan_outside_the_no_arbitrage_bounds():
+    # Under intrinsic value, over the underlying price, under intrinsic value, expired
+    solved = implied_volatility([0.5, 150.0, 15.0, 5.0], 'c', 100.0, [90.0, 100.0, 80.0, 100.0],
+                                [0.5, 0.5, 0.5, 0.0])
+
+    assert np.all(np.isnan(solved))
+
+
+def test_chain_greeks_round_trip():
+    quotedates = np.zeros(4, dtype=np.int64)
+    expirations = np.full(4, int(0.25 * YEAR), dtype=np.int64)
+    strikes = np.array([95.0, 105.0, 95.0, 105.0])
+    types = ['c', 'c', 'p', 'p']
+    prices = black_scholes(types, 100.0, strikes, 0.25, 0.25)
+
+    greeks = get_chain_greeks(types, np.full(4, 100.0), strikes, expirations, quotedates, prices)
+    expected = black_scholes_greeks(types, 100.0, strikes, 0.25, 0.25)
+
+    np.testing.assert_allclose(greeks['impliedvol'], 0.25, atol=1e-6)
+    for name in ('delta', 'gamma', 'theta', 'vega'):
+        np.testing.assert_allclose(greeks[name], expected[name], rtol=1e-4)
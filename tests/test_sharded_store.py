@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from optionsbacktrader.columnar_store import ColumnarStore
+from optionsbacktrader.compact_store import CompactStore
+from optionsbacktrader.sharded_store import ShardedStore, find_shard_paths, is_shard_directory, detect_backend
+
+
+@pytest.fixture(scope='module')
+def mmap_shard_path(multi_db_paths, tmp_path_factory):
+    _, shard_path = multi_db_paths
+    mmap_path = str(tmp_path_factory.mktemp('mmap_shards'))
+    for path in find_shard_paths(shard_path):
+        ColumnarStore.from_sqlite(path).save(os.path.join(mmap_path, os.path.splitext(os.path.basename(path))[0]))
+
+    return mmap_path
+
+
+@pytest.mark.parametrize('shards, load_kwargs', [
+    ('underlying', {}),
+    ('underlying', {'in_memory': True}),
+    ('underlying', {'backend': 'columnar'}),
+    ('underlying', {'backend': 'columnar', 'shard_workers': 2}),
+    ('period', {'backend': 'columnar', 'shard_workers': 2}),
+    ('underlying', {'in_memory': True, 'shard_workers': 2}),
+    ('underlying', {'cache_bytes': 2 ** 22}),
+    ('period', {}),
+    ('period', {'cache_bytes': 2 ** 22}),
+    ('mmap', {'backend': 'mmap'}),
+])
+def test_sharded_store_answers_like_one_file(multi_db_paths, period_shard_path, mmap_shard_path, make_broker,
+                                             broker_snapshot, shards, load_kwargs):
+    merged_path, underlying_shard_path = multi_db_paths
+    path = {'underlying': underlying_shard_path, 'period': period_shard_path, 'mmap': mmap_shard_path}[shards]
+
+    broker = make_broker(path, **load_kwargs)
+    assert broker.get_underlyings() == ['NDX', 'SPX']
+
+    assert broker_snapshot(broker) == broker_snapshot(make_broker(merged_path))
+
+
+def test_queries_only_reach_matching_shards(multi_db_paths, period_shard_path):
+    _, shard_path = multi_db_paths
+    store = ShardedStore.open(shard_path)
+    start, end = store.get_date_range()
+
+    assert [shard.underlyings for shard in store._select(start, end, 'SPX')] == [frozenset(['SPX'])]
+    assert len(store._select(start, end)) == 2
+
+    store = ShardedStore.open(period_shard_path)
+    assert len(store._select(start, start)) == 1
+    assert len(store._select(end, end)) == 1
+    assert len(store._select(start, end)) == 2
+
+
+def test_saved_stores_are_not_shard_directories(multi_db_paths, mmap_shard_path):
+    _, shard_path = multi_db_paths
+    assert is_shard_directory(shard_path)
+    assert is_shard_directory(mmap_shard_path, 'mmap')
+    assert not is_shard_directory(os.path.join(mmap_shard_path, 'SPX'), 'mmap')
+
+
+def test_detect_backend(multi_db_paths, mmap_shard_path, tmp_path):
+    merged_path, shard_path = multi_db_paths
+    mmap_path = find_shard_paths(mmap_shard_path, 'mmap')[0]
+    compact_path = str(tmp_path / 'compact' / 'all')
+    CompactStore.from_store(ColumnarStore.from_sqlite(merged_path)).save(compact_path)
+
+    assert detect_backend(merged_path) == 'sqlite'
+    assert detect_backend(shard_path) == 'sqlite'
+    assert detect_backend(mmap_path) == 'mmap'
+    assert detect_backend(mmap_shard_path) == 'mmap'
+    assert detect_backend(compact_path) == 'compact'
+    assert detect_backend(os.path.dirname(compact_path)) == 'compact'
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from optionsbacktrader import Trader, OrderLeg, OrderType
+from optionsbacktrader.chain_view import datetime_from_db, datetime_to_db
+from optionsbacktrader.clock import DAY
+from optionsbacktrader.vector_backtest import VectorBacktest, LegRule
+
+
+class RuleTrader(Trader):
+    # The event driven equivalent of VectorBacktest.run, trading through the broker
+    def __init__(self, legs, signal, hold_days, settlement, days):
+        self.legs = legs
+        self.signal = signal
+        self.hold_days = hold_days
+        self.settlement = settlement
+        self.days = days
+
+        self.exits = {}
+        self.market_values = []
+        self.cash = []
+
+    def step(self, current_date, broker, account):
+        i = self.days.index(datetime_to_db(current_date))
+
+        broker.settle_expiring(method=self.settlement)
+
+        due = self.exits.pop(i, None)
+        if due:
+            broker.close_all(lambda position: position.symbol in due)
+
+        expirations = np.unique(broker.get_options_chain().expirations)
+        if (self.signal is None or self.signal[i]) and len(expirations):
+            quotes = []
+            for leg in self.legs:
+                # Nearest listed expiration, the earlier one on ties
+                expiry = expirations[np.argmin(np.abs(expirations - (self.days[i] + int(leg.dte * DAY))))]
+                quotes.append(broker.find_option(leg.delta, datetime_from_db(int(expiry)).replace(tzinfo=None)))
+
+            if all(quote is not None for quote in quotes):
+                orders = broker.place_order([OrderLeg(leg.order_type, quote=quote, size=leg.size)
+                                             for leg, quote in zip(self.legs, quotes)])
+                if self.hold_days is not None and i + self.hold_days < len(self.days):
+                    self.exits.setdefault(i + self.hold_days, set()).update(order.symbol for order in orders)
+
+        self.market_values.append(account.get_market_value(broker))
+        self.cash.append(account.cash)
+
+
+SCENARIOS = [
+    ([LegRule(OrderType.SELL, -0.3, 14)], None, None, 'intrinsic', {}),
+    ([LegRule(OrderType.SELL, -0.3, 7)], None, None, 'market', {}),
+    ([LegRule(OrderType.SELL, -0.25, 14), LegRule(OrderType.BUY, -0.1, 14)], None, 3, 'intrinsic',
+     {'commission': 1.0, 'liquidity_risk': 0.3}),
+    ([LegRule(OrderType.BUY, 0.5, 5, size=2)], 'alternate', 2, 'intrinsic', {}),
+    ([LegRule(OrderType.SELL, 0.2, 10), LegRule(OrderType.SELL, -0.2, 10)], None, 4, 'market',
+     {'commission': 0.65, 'commission_per_order': True}),
+]
+
+
+@pytest.mark.parametrize('legs, signal, hold_days, settlement, broker_kwargs', SCENARIOS)
+def test_vector_backtest_matches_the_event_driven_account(db_path, make_broker, legs, signal, hold_days, settlement,
+                                                          broker_kwargs):
+    broker = make_broker(db_path, broker_kwargs=broker_kwargs)
+    backtest = VectorBacktest(broker)
+    days = backtest.days.tolist()
+    if signal == 'alternate':
+        signal = np.arange(len(days)) % 2 == 0
+
+    result = backtest.run(legs, signal, hold_days, settlement)
+
+    trader = RuleTrader(legs, signal, hold_days, settlement, days)
+    broker.set_trader(trader)
+    broker.start()
+
+    assert result['entries'].sum() > 0
+    np.testing.assert_allclose(result['market_value'], trader.market_values, rtol=0, atol=1e-6)
+    np.testing.assert_allclose(result['cash'], trader.cash, rtol=0, atol=1e-6)
+    assert sorted((position.symbol, position.size, position.book_value)
+                  for position in result['account'].get_positions()) == \
+        sorted((position.symbol, position.size, position.book_value) for position in broker.account.get_positions())
+
+    columns, expected_columns = result['account'].ledger.get_columns(), broker.account.ledger.get_columns()
+    for name in ('quotedate', 'order_type', 'price', 'size', 'realized_pl', 'strike', 'expiration'):
+        np.testing.assert_array_equal(columns[name], expected_columns[name])
+
+
+def test_legs_expire_within_the_data_by_default(db_path, make_broker):
+    broker = make_broker(db_path)
+    data_end = datetime_to_db(broker.data_end_date)
+
+    result = VectorBacktest(broker).run([LegRule(OrderType.BUY, 0.5, 400)])
+    expirations = result['account'].ledger.get_columns()['expiration']
+    assert len(expirations) and expirations.max() <= data_end
+
+    result = VectorBacktest(broker, max_dte=60).run([LegRule(OrderType.BUY, 0.5, 400)])
+    assert result['account'].ledger.get_columns()['expiration'].max() > data_end
+
+
+@pytest.mark.parametrize('legs, kwargs', [
+    ([], {}),
+    ([LegRule(OrderType.BUY, 0.5, 7)], {'settlement': 'close'}),
+    ([LegRule(OrderType.BUY, 0.5, 7)], {'signal': [True]}),
+])
+def test_run_rejects_bad_arguments(db_path, make_broker, legs, kwargs):
+    with pytest.raises(ValueError):
+        VectorBacktest(make_broker(db_path)).run(legs, **kwargs)
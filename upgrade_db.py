@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+
+import sys
+
+import sqlite3
+
+from optionsbacktrader.schema import explain_query_plans, upgrade_schema
+
+
+def print_query_plans(title, plans):
+    print(title)
+    for name, plan in plans.items():
+        print(f'  {name}')
+        for step in plan:
+            print(f'    {step}')
+
+
+if len(sys.argv) < 2:
+    print('Usage upgrade_db.py <sqlite_path>')
+    exit(0)
+
+db_connection = sqlite3.connect(sys.argv[1])
+
+print_query_plans('Before:', explain_query_plans(db_connection))
+upgrade_schema(db_connection)
+print_query_plans('After:', explain_query_plans(db_connection))
+
+db_connection.close()